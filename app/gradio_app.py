@@ -1,8 +1,9 @@
 from __future__ import annotations
 import os
+import uuid
 import gradio as gr
 
-from src.rag_pipeline import RAGPipeline, PipelineConfig
+from src.rag_pipeline import RAGPipeline, PipelineConfig, shared_embedder
 from src.llm import LLMConfig
 
 def build_pipeline(provider: str, model: str, api_key: str, ollama_url: str) -> RAGPipeline:
@@ -10,9 +11,11 @@ def build_pipeline(provider: str, model: str, api_key: str, ollama_url: str) ->
         provider=provider,
         model=model,
         api_key=api_key,
-        base_url=ollama_url
+        base_url=ollama_url,
+        fallbacks=os.getenv("LLM_FALLBACKS", ""),  # напр. "ollama:llama3.1" — якщо основний провайдер лежить
     )
     cfg = PipelineConfig()
+    # ембеддер береться зі спільного реєстру — повторне "Індексувати" не перевантажує модель
     return RAGPipeline(cfg, llm_cfg)
 
 def format_sources(sources):
@@ -20,7 +23,8 @@ def format_sources(sources):
         return ""
     out = ["\n\n**Джерела (RAG):**"]
     for s in sources:
-        out.append(f"- [#{s['n']}] **{s['source']}**: {s['snippet']}")
+        also = f" (також: {', '.join(s['also'])})" if s.get("also") else ""
+        out.append(f"- [#{s['n']}] **{s['source']}**{also}: {s['snippet']}")
     return "\n".join(out)
 
 with gr.Blocks(title="BioConsult RAG") as demo:
@@ -35,41 +39,74 @@ with gr.Blocks(title="BioConsult RAG") as demo:
         ollama_url = gr.Textbox(value=os.getenv("OLLAMA_BASE_URL","http://localhost:11434"), label="Ollama URL (якщо provider=ollama)")
 
     pipeline_state = gr.State(None)
+    session_state = gr.State(None)  # id розмови: уточнення й підсумок попередніх реплік тримає RAGPipeline
 
     with gr.Row():
         index_btn = gr.Button("📚 Індексувати (data/raw → Chroma)")
         clear_index = gr.Checkbox(value=False, label="Очистити індекс перед індексацією")
+        incremental = gr.Checkbox(value=True, label="Лише змінені файли (інкрементально)")
 
     index_out = gr.Markdown()
 
     chatbot = gr.Chatbot(height=420, type="messages")
     msg = gr.Textbox(label="Запит", placeholder="Наприклад: Поясни різницю між мітозом і мейозом")
-    send = gr.Button("Надіслати")
+    with gr.Row():
+        send = gr.Button("Надіслати")
+        new_chat = gr.Button("🧹 Нова розмова")
 
-    def do_index(provider, model, api_key, ollama_url, clear_index):
+    def do_index(provider, model, api_key, ollama_url, clear_index, incremental, progress=gr.Progress()):
         pipe = build_pipeline(provider, model, api_key, ollama_url)
-        stats = pipe.index(clear=clear_index)
-        return pipe, f"✅ Індекс готовий: **docs={stats['raw_docs']}**, **chunks={stats['chunks']}** (collection: `{stats['collection']}`)"
+
+        def on_progress(p):
+            progress(
+                p.fraction,
+                desc=f"docs {p.docs_done}/{p.docs_total} · embedded {p.chunks_embedded} · written {p.chunks_written}"
+            )
+
+        stats = pipe.index(clear=clear_index, incremental=incremental, progress=on_progress)
+        return pipe, (
+            f"✅ Індекс готовий: **docs={stats['raw_docs']}**, **chunks={stats['chunks']}** (collection: `{stats['collection']}`)  \n"
+            f"нових: {stats['added']}, змінених: {stats['updated']}, видалених: {stats['deleted']}, без змін: {stats['skipped']}"
+        )
 
     index_btn.click(
         do_index,
-        inputs=[provider, model, api_key, ollama_url, clear_index],
+        inputs=[provider, model, api_key, ollama_url, clear_index, incremental],
         outputs=[pipeline_state, index_out]
     )
 
-    def chat(pipe, history, text):
+    def chat(pipe, history, text, session_id):
         if pipe is None:
-            return history + [{"role":"assistant","content":"⚠️ Спочатку натисни **Індексувати**."}], ""
-
-        result = pipe.ask(text)
-        answer = result["answer"] + format_sources(result["sources"])
+            yield history + [{"role":"assistant","content":"⚠️ Спочатку натисни **Індексувати**."}], "", session_id
+            return
 
+        session_id = session_id or uuid.uuid4().hex
         history = history + [{"role":"user","content":text}]
-        history = history + [{"role":"assistant","content":answer}]
-        return history, ""
-
-    send.click(chat, inputs=[pipeline_state, chatbot, msg], outputs=[chatbot, msg])
-    msg.submit(chat, inputs=[pipeline_state, chatbot, msg], outputs=[chatbot, msg])
+        answer, sources, cached = "", "", False
+        for ev in pipe.ask_stream(text, session_id=session_id):
+            if ev["type"] == "sources":
+                # джерела приходять першими — показуємо їх одразу, відповідь допишеться над ними
+                sources, cached = format_sources(ev["sources"]), ev["cached"]
+            elif ev["type"] == "token":
+                answer += ev["text"]
+            else:
+                answer = ev["answer"]
+
+            content = (answer or "_генерую…_") + sources
+            if cached:
+                content += "\n\n_⚡ відповідь з кешу_"
+            yield history + [{"role":"assistant","content":content}], "", session_id
+
+    def reset_chat(pipe, session_id):
+        if pipe is not None and session_id:
+            pipe.sessions.reset(session_id)
+        return [], None
+
+    send.click(chat, inputs=[pipeline_state, chatbot, msg, session_state], outputs=[chatbot, msg, session_state])
+    msg.submit(chat, inputs=[pipeline_state, chatbot, msg, session_state], outputs=[chatbot, msg, session_state])
+    new_chat.click(reset_chat, inputs=[pipeline_state, session_state], outputs=[chatbot, session_state])
 
 if __name__ == "__main__":
+    # e5 вантажиться у фоні, поки піднімається UI; перший клік лише дочекається його
+    shared_embedder(PipelineConfig(), background=True)
     demo.launch()
@@ -0,0 +1,128 @@
+from __future__ import annotations
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Dict, Optional, Sequence
+import hashlib
+import re
+import threading
+import time
+
+import numpy as np
+
+_PUNCT_RE = re.compile(r"[^\w\s]+")
+
+def normalize_question(q: str) -> str:
+    # "Різниця між мітозом і мейозом?" == "різниця між  мітозом і мейозом"
+    q = _PUNCT_RE.sub(" ", (q or "").lower().replace("ё", "е"))
+    return " ".join(q.split())
+
+def answer_key(question: str, chunk_ids: Sequence[str], model: str, prompt_version: str,
+               history: str = "") -> str:
+    """history — відбиток розмови, що йде в промпт (Conversation.digest()); "" — запит без сесії."""
+    h = hashlib.sha1()
+    parts = [normalize_question(question), "\x1f".join(chunk_ids), model, prompt_version]
+    if history:
+        parts.append(history)
+    for part in parts:
+        h.update(part.encode("utf-8"))
+        h.update(b"\x00")
+    return h.hexdigest()
+
+@dataclass
+class _Entry:
+    value: Dict[str, Any]
+    created: float
+    model: str
+    generation: int
+    q_emb: Optional[np.ndarray] = None
+
+class AnswerCache:
+    """
+    Кеш готових відповідей: (нормалізоване питання, id чанків, модель, версія промпту
+    [, відбиток розмови]) -> відповідь.
+
+    - LRU на max_entries + TTL;
+    - опційний пошук майже-дублікатів за косинусною схожістю ембеддінгу запиту
+      (similarity > 0 вмикає; ембеддінги мають бути нормалізовані);
+    - invalidate() — при зміні індексу всі записи стають недійсними.
+    """
+
+    def __init__(self, max_entries: int = 512, ttl: float = 3600.0, similarity: float = 0.0):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.similarity = similarity
+        self.generation = 0
+        self._data: "OrderedDict[str, _Entry]" = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+
+    def _alive(self, e: _Entry, now: float) -> bool:
+        return e.generation == self.generation and (self.ttl <= 0 or now - e.created <= self.ttl)
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        now = time.time()
+        with self._lock:
+            e = self._data.get(key)
+            if e is None or not self._alive(e, now):
+                if e is not None:
+                    del self._data[key]
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return e.value
+
+    def get_similar(self, q_emb, model: str) -> Optional[Dict[str, Any]]:
+        """Найближчий збережений запит тієї ж моделі, якщо схожість >= similarity."""
+        if self.similarity <= 0:
+            return None
+        q = np.asarray(q_emb, dtype=np.float32)
+        now = time.time()
+        with self._lock:
+            keys, embs = [], []
+            for k, e in self._data.items():
+                if e.q_emb is not None and e.model == model and self._alive(e, now):
+                    keys.append(k)
+                    embs.append(e.q_emb)
+            if not embs:
+                return None
+            sims = np.stack(embs) @ q
+            best = int(np.argmax(sims))
+            if float(sims[best]) < self.similarity:
+                return None
+            self._data.move_to_end(keys[best])
+            self.semantic_hits += 1
+            return self._data[keys[best]].value
+
+    def put(self, key: str, value: Dict[str, Any], model: str, q_emb=None):
+        e = _Entry(
+            value=value,
+            created=time.time(),
+            model=model,
+            generation=self.generation,
+            q_emb=None if q_emb is None else np.asarray(q_emb, dtype=np.float32),
+        )
+        with self._lock:
+            self._data[key] = e
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def invalidate(self):
+        with self._lock:
+            self.generation += 1
+            self._data.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.hits + self.semantic_hits + self.misses
+        return {
+            "entries": len(self._data),
+            "hits": self.hits,
+            "semantic_hits": self.semantic_hits,
+            "misses": self.misses,
+            "hit_rate": ((self.hits + self.semantic_hits) / total) if total else 0.0,
+            "generation": self.generation,
+        }
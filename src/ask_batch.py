@@ -0,0 +1,102 @@
+"""
+Пакетні відповіді на набір запитань (екзаменаційні білети тощо) -> JSONL.
+
+    python -m src.ask_batch questions.txt --out answers.jsonl --concurrency 8
+    python -m src.ask_batch questions.jsonl --out answers.jsonl --resume   # дорахувати невдалі
+
+Вхід: .txt — одне запитання на рядок; .jsonl — {"id": ..., "question": ...} (id необов'язковий).
+Вихід: по рядку на запитання {"id", "question", "ok", "answer", "sources", ...} або {"ok": false, "error"}.
+--resume читає наявний --out, пропускає запитання з ok=true і дописує решту (рядки з тим самим id,
+що пізніші, перекривають попередні).
+"""
+from __future__ import annotations
+import argparse
+import json
+import os
+import sys
+import time
+from typing import Dict, List
+
+from src.llm import LLMConfig
+from src.rag_pipeline import PipelineConfig, RAGPipeline
+
+def load_questions(path: str) -> List[Dict[str, str]]:
+    items = []
+    with open(path, "r", encoding="utf-8") as f:
+        for n, line in enumerate(f, start=1):
+            line = line.strip()
+            if not line:
+                continue
+            if path.endswith(".jsonl"):
+                row = json.loads(line)
+                items.append({"id": str(row.get("id", n)), "question": row["question"]})
+            else:
+                items.append({"id": str(n), "question": line})
+    return items
+
+def done_ids(path: str) -> set:
+    """id запитань, на які у файлі вже є успішна відповідь (останній рядок для id — головний)."""
+    status: Dict[str, bool] = {}
+    if os.path.exists(path):
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    row = json.loads(line)
+                    status[str(row.get("id"))] = bool(row.get("ok"))
+    return {k for k, ok in status.items() if ok}
+
+def main():
+    ap = argparse.ArgumentParser(description="Пакетні відповіді RAGPipeline -> JSONL")
+    ap.add_argument("questions", help=".txt (запитання на рядок) або .jsonl (id, question)")
+    ap.add_argument("--out", default="", help="JSONL з відповідями (типово — stdout)")
+    ap.add_argument("--resume", action="store_true", help="пропустити вже успішні id з --out і дописати решту")
+    ap.add_argument("--concurrency", type=int, default=4, help="одночасних генерацій")
+    ap.add_argument("--retries", type=int, default=LLMConfig.retries,
+                    help="повторів на провайдера при 429/5xx/таймауті (у LLM, перед резервним)")
+    ap.add_argument("--unordered", action="store_true", help="писати в міру готовності, а не в порядку запитань")
+    ap.add_argument("--provider", default="openai", choices=["openai", "ollama"])
+    ap.add_argument("--model", default="gpt-4o-mini")
+    ap.add_argument("--ollama-url", default=os.getenv("OLLAMA_BASE_URL", "http://localhost:11434"))
+    ap.add_argument("--openai-url", default="", help="базовий URL OpenAI-сумісного API (напр. локальний стаб)")
+    ap.add_argument("--fallbacks", default="", help='резервні провайдери: "ollama:llama3.1"')
+    ap.add_argument("--deadline", type=float, default=0.0, help="с на одну відповідь з повторами; 0 — без ліміту")
+    ap.add_argument("--top-k", type=int, default=PipelineConfig.top_k)
+    args = ap.parse_args()
+
+    items = load_questions(args.questions)
+    if args.resume and args.out:
+        skip = done_ids(args.out)
+        items = [it for it in items if it["id"] not in skip]
+    if not items:
+        print("Немає запитань для відповіді", file=sys.stderr)
+        return
+
+    cfg = PipelineConfig(top_k=args.top_k)
+    llm_cfg = LLMConfig(provider=args.provider, model=args.model, base_url=args.ollama_url,
+                        openai_base_url=args.openai_url, fallbacks=args.fallbacks, deadline=args.deadline,
+                        retries=args.retries)
+    pipe = RAGPipeline(cfg, llm_cfg)
+
+    out = open(args.out, "a" if args.resume else "w", encoding="utf-8") if args.out else sys.stdout
+    t0, failed = time.perf_counter(), 0
+    try:
+        results = pipe.ask_batch(
+            [it["question"] for it in items],
+            concurrency=args.concurrency,
+            ordered=not args.unordered,
+        )
+        for res in results:
+            res["id"] = items[res.pop("i")]["id"]
+            failed += not res["ok"]
+            out.write(json.dumps(res, ensure_ascii=False) + "\n")
+            out.flush()
+    finally:
+        if out is not sys.stdout:
+            out.close()
+
+    dt = time.perf_counter() - t0
+    print(f"{len(items)} запитань за {dt:.1f} с ({len(items) / dt:.2f}/с), невдалих: {failed}"
+          + (f" — повтор: --resume --out {args.out}" if failed and args.out else ""), file=sys.stderr)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+from __future__ import annotations
+from collections import deque
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, List, Sequence
+import asyncio
+import queue
+import threading
+import time
+
+_STOP = object()
+
+def _percentile(xs: Sequence[float], q: float) -> float:
+    if not xs:
+        return 0.0
+    s = sorted(xs)
+    return s[min(len(s) - 1, int(q * (len(s) - 1) + 0.5))]
+
+class QueryBatcher:
+    """
+    Зливає одночасні запити на ембеддінг в один виклик embed_fn.
+
+    Перший запит у черзі відкриває "вікно" на max_wait_ms (або до max_batch елементів);
+    усе, що прийшло за цей час, кодується одним batch-викликом, і кожен виклик
+    отримує свій результат через Future. max_wait_ms — це ціна в p50 за пропускну здатність.
+    """
+
+    def __init__(
+        self,
+        embed_fn: Callable[[List[str]], Sequence[Any]],
+        max_batch: int = 32,
+        max_wait_ms: float = 10.0,
+        history: int = 1024,
+    ):
+        self.embed_fn = embed_fn
+        self.max_batch = max(1, max_batch)
+        self.max_wait = max(0.0, max_wait_ms) / 1000.0
+
+        self._q: "queue.Queue" = queue.Queue()
+        self._lock = threading.Lock()
+        self._batch_sizes: deque = deque(maxlen=history)
+        self._delays_ms: deque = deque(maxlen=history)
+        self.batches = 0
+        self.items = 0
+
+        self._thread = threading.Thread(target=self._loop, daemon=True, name="query-batcher")
+        self._thread.start()
+
+    # ---------- API ----------
+    def submit(self, text: str) -> Future:
+        fut: Future = Future()
+        self._q.put((text, fut, time.perf_counter()))
+        return fut
+
+    def embed(self, text: str, timeout: float | None = None):
+        return self.submit(text).result(timeout=timeout)
+
+    async def aembed(self, text: str):
+        return await asyncio.wrap_future(self.submit(text))
+
+    def close(self):
+        self._q.put(_STOP)
+        self._thread.join(timeout=1.0)
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            sizes = list(self._batch_sizes)
+            delays = list(self._delays_ms)
+            return {
+                "batches": self.batches,
+                "items": self.items,
+                "avg_batch": (sum(sizes) / len(sizes)) if sizes else 0.0,
+                "max_batch_seen": max(sizes, default=0),
+                "queue_delay_p50_ms": _percentile(delays, 0.50),
+                "queue_delay_p95_ms": _percentile(delays, 0.95),
+                "max_batch": self.max_batch,
+                "max_wait_ms": self.max_wait * 1000.0,
+            }
+
+    # ---------- worker ----------
+    def _collect(self, first) -> tuple[list, bool]:
+        batch = [first]
+        deadline = first[2] + self.max_wait
+        while len(batch) < self.max_batch:
+            left = deadline - time.perf_counter()
+            try:
+                item = self._q.get(timeout=left) if left > 0 else self._q.get_nowait()
+            except queue.Empty:
+                break
+            if item is _STOP:
+                return batch, True
+            batch.append(item)
+        return batch, False
+
+    def _loop(self):
+        while True:
+            first = self._q.get()
+            if first is _STOP:
+                return
+            batch, stop = self._collect(first)
+
+            started = time.perf_counter()
+            texts = [t for t, _, _ in batch]
+            futs = {f for _, f, _ in batch if f.set_running_or_notify_cancel()}
+            try:
+                vecs = self.embed_fn(texts)
+                for (_, f, _), v in zip(batch, vecs):
+                    if f in futs:
+                        f.set_result(v)
+            except BaseException as e:
+                for f in futs:
+                    if not f.done():
+                        f.set_exception(e)
+
+            with self._lock:
+                self.batches += 1
+                self.items += len(batch)
+                self._batch_sizes.append(len(batch))
+                self._delays_ms.extend((started - t0) * 1000.0 for _, _, t0 in batch)
+            if stop:
+                return
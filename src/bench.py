@@ -0,0 +1,286 @@
+"""
+Офлайн-бенчмарк індексації та запитів (без мережі й GPU).
+
+    python -m src.bench --docs 200 --doc-kb 16 --queries 200 --out bench.json
+    python -m src.bench --backend numpy --retriever hybrid --compare bench.json
+
+Корпус синтезується з data/raw (абзаци перемішуються, частина слів підмінюється —
+щоб дедуплікація не з'їла все); ембеддер — детермінований hashing-трюк,
+LLM — заглушка з опційною затримкою. Виміри:
+  load_raw_docs / chunk_docs / embed_documents — пропускна здатність;
+  RAGPipeline.index — повна індексація;
+  retriever.query / RAGPipeline.ask — p50/p95/p99;
+  пікова RSS і розмір індексу на диску. Результат — JSON (--compare — різниця з попереднім).
+"""
+from __future__ import annotations
+import argparse
+import json
+import os
+import platform
+import random
+import re
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import zlib
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Sequence
+
+import numpy as np
+
+from src.chunking import chunk_docs
+from src.data_loader import load_raw_docs
+from src.llm import LLM, LLMConfig
+from src.rag_pipeline import PipelineConfig, RAGPipeline
+from src.registry import model_key, registry
+from src.retriever import tokenize
+
+STUB_MODEL = "stub-hash"
+
+# ---------- stubs ----------
+class _StubTokenizer:
+    def __call__(self, texts: List[str], add_special_tokens: bool = False) -> Dict[str, List[List[int]]]:
+        return {"input_ids": [[0] * len(re.findall(r"\w+|[^\w\s]", t)) for t in texts]}
+
+class StubSentenceModel:
+    """Інтерфейс SentenceTransformer, який чіпає EmbeddingEngine; вектори — hashing-трюк по словах і біграмах."""
+
+    def __init__(self, dim: int = 384, max_seq_length: int = 512):
+        self.dim = dim
+        self.max_seq_length = max_seq_length
+        self.device = "cpu"
+        self.tokenizer = _StubTokenizer()
+
+    def get_sentence_embedding_dimension(self) -> int:
+        return self.dim
+
+    def _vec(self, text: str) -> np.ndarray:
+        toks = tokenize(text)
+        feats = toks + [a + " " + b for a, b in zip(toks, toks[1:])]
+        v = np.zeros(self.dim, dtype=np.float32)
+        for f in feats:
+            h = zlib.crc32(f.encode("utf-8"))
+            v[h % self.dim] += 1.0 if h & 0x80000000 else -1.0
+        return v
+
+    def encode(self, texts: Sequence[str], normalize_embeddings: bool = True, **_) -> np.ndarray:
+        out = np.stack([self._vec(t) for t in texts]) if texts else np.zeros((0, self.dim), np.float32)
+        if normalize_embeddings:
+            out /= np.maximum(np.linalg.norm(out, axis=1, keepdims=True), 1e-12)
+        return out
+
+class StubLLM(LLM):
+    """Детермінована відповідь із контексту; delay_ms імітує час генерації."""
+
+    def __init__(self, delay_ms: float = 0.0):
+        super().__init__(LLMConfig(provider="stub", model="stub"))
+        self.delay = delay_ms / 1000.0
+
+    def generate(self, user_text: str, contexts: List[Dict[str, Any]]) -> str:
+        return "".join(self.stream(user_text, contexts)).strip()
+
+    def stream(self, user_text: str, contexts: List[Dict[str, Any]]) -> Iterator[str]:
+        if self.delay:
+            time.sleep(self.delay)
+        head = (contexts[0]["text"][:200] if contexts else "немає контексту").split()
+        for w in ["Відповідь:"] + head:
+            yield w + " "
+
+# ---------- corpus ----------
+def synthetic_corpus(src_dir: str, out_dir: str, n_docs: int, doc_kb: int, seed: int = 0,
+                     noise: float = 0.15) -> List[str]:
+    """n_docs .txt по ~doc_kb КБ з абзаців data/raw (перемішані речення + noise частка підмінених слів)."""
+    paras: List[str] = []
+    for p in sorted(Path(src_dir).rglob("*")):
+        if p.suffix.lower() in (".txt", ".md"):
+            paras += [x.strip() for x in re.split(r"\n\s*\n", p.read_text(encoding="utf-8", errors="ignore")) if x.strip()]
+    if not paras:
+        raise RuntimeError(f"No .txt/.md in {src_dir}")
+    vocab = sorted({w for x in paras for w in x.split()})
+
+    rng = random.Random(seed)
+    out = Path(out_dir)
+    out.mkdir(parents=True, exist_ok=True)
+    questions: List[str] = []
+    for d in range(n_docs):
+        parts, size = [], 0
+        while size < doc_kb * 1024:
+            sents = re.split(r"(?<=[.!?…])\s+", rng.choice(paras))
+            rng.shuffle(sents)
+            words = " ".join(sents).split(" ")
+            for i in range(len(words)):
+                if rng.random() < noise:
+                    words[i] = rng.choice(vocab)
+            para = " ".join(words)
+            parts.append(para)
+            size += len(para.encode("utf-8"))
+        (out / f"doc_{d:05d}.txt").write_text("\n\n".join(parts), encoding="utf-8")
+        # запит — шматок речення з документа (щоб у видачі було що знайти)
+        sent = rng.choice(re.split(r"(?<=[.!?…])\s+", rng.choice(parts)))
+        questions.append(" ".join(sent.split()[:12]))
+    return questions
+
+# ---------- measurement ----------
+def percentiles(xs: Sequence[float]) -> Dict[str, float]:
+    if not xs:
+        return {"p50_ms": 0.0, "p95_ms": 0.0, "p99_ms": 0.0, "mean_ms": 0.0}
+    a = np.asarray(xs, dtype=np.float64) * 1000.0
+    return {
+        "p50_ms": round(float(np.percentile(a, 50)), 3),
+        "p95_ms": round(float(np.percentile(a, 95)), 3),
+        "p99_ms": round(float(np.percentile(a, 99)), 3),
+        "mean_ms": round(float(a.mean()), 3),
+    }
+
+def rss_mb() -> float:
+    try:
+        with open("/proc/self/statm") as f:
+            return round(int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20, 1)
+    except (OSError, ValueError, IndexError):
+        return peak_rss_mb()
+
+def peak_rss_mb() -> float:
+    kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(kb / (2**20 if sys.platform == "darwin" else 1024), 1)
+
+def dir_size_mb(path: str) -> float:
+    total = sum(p.stat().st_size for p in Path(path).rglob("*") if p.is_file())
+    return round(total / 2**20, 2)
+
+def _git_rev() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              timeout=5).stdout.strip()
+    except (OSError, subprocess.SubprocessError):
+        return ""
+
+def _timed(fn):
+    t0 = time.perf_counter()
+    out = fn()
+    return out, time.perf_counter() - t0
+
+def run(args) -> Dict[str, Any]:
+    registry.provide(model_key(STUB_MODEL), StubSentenceModel(dim=args.dim), f"model:{STUB_MODEL}")
+    stages: Dict[str, Dict[str, Any]] = {}
+
+    with tempfile.TemporaryDirectory() as tmp:
+        raw_dir, store = f"{tmp}/raw", f"{tmp}/store"
+        questions, dt = _timed(lambda: synthetic_corpus(args.src, raw_dir, args.docs, args.doc_kb, args.seed))
+        corpus_mb = dir_size_mb(raw_dir)
+        stages["corpus"] = {"docs": args.docs, "mb": corpus_mb, "seconds": round(dt, 3)}
+
+        docs, dt = _timed(lambda: load_raw_docs(raw_dir))
+        stages["load_raw_docs"] = {"docs": len(docs), "seconds": round(dt, 3),
+                                   "docs_per_s": round(len(docs) / dt, 1), "mb_per_s": round(corpus_mb / dt, 2)}
+
+        chunks, dt = _timed(lambda: chunk_docs(docs))
+        stages["chunk_docs"] = {"chunks": len(chunks), "seconds": round(dt, 3),
+                                "chunks_per_s": round(len(chunks) / dt, 1), "mb_per_s": round(corpus_mb / dt, 2)}
+
+        cfg = PipelineConfig(
+            raw_dir=raw_dir,
+            persist_dir=store,
+            collection="bench",
+            embed_model=STUB_MODEL,
+            embed_cache_dir=f"{tmp}/embed_cache" if args.embed_cache else "",
+            top_k=args.top_k,
+            retriever=args.retriever,
+            vector_backend=args.backend,
+            answer_cache_size=512 if args.answer_cache else 0,
+            tracing=True,
+        )
+        pipe = RAGPipeline(cfg, LLMConfig(provider="stub", model="stub"))
+        pipe.llm = StubLLM(delay_ms=args.llm_ms)
+
+        texts = [c.text for c in chunks]
+        _, dt = _timed(lambda: pipe.embedder.embed_documents(texts))
+        stages["embed_documents"] = {"chunks": len(texts), "seconds": round(dt, 3),
+                                     "chunks_per_s": round(len(texts) / dt, 1)}
+
+        stats, dt = _timed(lambda: pipe.index(clear=True))
+        stages["index"] = {
+            "chunks": stats["chunks"],
+            "duplicates": stats.get("duplicates", 0),
+            "seconds": round(dt, 3),
+            "chunks_per_s": round(stats["chunks"] / dt, 1) if dt > 0 else 0.0,
+            "rss_mb": rss_mb(),
+        }
+
+        qs = [questions[i % len(questions)] for i in range(args.queries)]
+        lat = []
+        for q in qs:
+            _, dt = _timed(lambda: pipe.searcher.query(q, top_k=args.top_k))
+            lat.append(dt)
+        stages["query"] = {"queries": len(qs), **percentiles(lat), "qps": round(len(lat) / sum(lat), 1)}
+
+        lat, saved, spans = [], 0, {}
+        for q in qs:
+            res, dt = _timed(lambda: pipe.ask(q))
+            lat.append(dt)
+            saved += res.get("context", {}).get("saved", 0)
+            for k, v in res.get("timings", {}).items():
+                spans[k] = spans.get(k, 0.0) + v
+        stages["ask"] = {"queries": len(qs), **percentiles(lat), "qps": round(len(lat) / sum(lat), 1),
+                         "context_tokens_saved_avg": round(saved / len(qs), 1),
+                         **{f"avg_{k}": round(v / len(qs), 2) for k, v in sorted(spans.items())}}
+
+        index_mb = dir_size_mb(store)
+
+    return {
+        "config": {k: v for k, v in vars(args).items() if k not in ("out", "compare")},
+        "env": {
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "git": _git_rev(),
+        },
+        "stages": stages,
+        "peak_rss_mb": peak_rss_mb(),
+        "index_disk_mb": index_mb,
+    }
+
+def compare(new: Dict[str, Any], old: Dict[str, Any]) -> Dict[str, Dict[str, Any]]:
+    """Числові поля stages: old -> new і відношення new/old."""
+    out: Dict[str, Dict[str, Any]] = {}
+    flat_new = {**{f"{s}.{k}": v for s, d in new["stages"].items() for k, v in d.items()},
+                "peak_rss_mb": new["peak_rss_mb"], "index_disk_mb": new["index_disk_mb"]}
+    flat_old = {**{f"{s}.{k}": v for s, d in old.get("stages", {}).items() for k, v in d.items()},
+                "peak_rss_mb": old.get("peak_rss_mb"), "index_disk_mb": old.get("index_disk_mb")}
+    for k, v in flat_new.items():
+        o = flat_old.get(k)
+        if isinstance(v, (int, float)) and isinstance(o, (int, float)) and o:
+            out[k] = {"old": o, "new": v, "ratio": round(v / o, 3)}
+    return out
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--src", default="data/raw")
+    ap.add_argument("--docs", type=int, default=100)
+    ap.add_argument("--doc-kb", type=int, default=16)
+    ap.add_argument("--queries", type=int, default=200)
+    ap.add_argument("--top-k", type=int, default=4)
+    ap.add_argument("--dim", type=int, default=384)
+    ap.add_argument("--backend", choices=["chroma", "numpy"], default="chroma")
+    ap.add_argument("--retriever", choices=["dense", "bm25", "hybrid"], default="dense")
+    ap.add_argument("--llm-ms", type=float, default=0.0, help="штучна затримка заглушки LLM")
+    ap.add_argument("--embed-cache", action="store_true")
+    ap.add_argument("--answer-cache", action="store_true")
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--out", default="", help="зберегти JSON у файл")
+    ap.add_argument("--compare", default="", help="попередній JSON для порівняння")
+    args = ap.parse_args()
+
+    result = run(args)
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            result["compare"] = compare(result, json.load(f))
+    text = json.dumps(result, ensure_ascii=False, indent=2)
+    if args.out:
+        Path(args.out).write_text(text, encoding="utf-8")
+    print(text)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+"""
+Пропускна здатність чанкера на data/raw/biology_basics.txt, розмноженому в N разів.
+
+    python -m src.bench_chunking --scale 1 10 100 --max-tokens 200
+    python -m src.bench_chunking --tokenizer intfloat/e5-large-v2
+
+Однаковий MB/s на різних scale => час лінійний за розміром документа.
+"""
+from __future__ import annotations
+import argparse
+import json
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from src.chunking import CountFn, chunk_text
+
+def _hf_counter(name: str) -> CountFn:
+    from transformers import AutoTokenizer
+    tok = AutoTokenizer.from_pretrained(name)
+    return lambda texts: [len(x) for x in tok(list(texts), add_special_tokens=False)["input_ids"]]
+
+def run(path: str, scales: List[int], max_tokens: int, overlap: int, repeat: int,
+        count_tokens: Optional[CountFn] = None) -> Dict:
+    base = Path(path).read_text(encoding="utf-8", errors="ignore")
+    results = []
+    for scale in scales:
+        text = "\n\n".join([base] * scale)
+        best = float("inf")
+        for _ in range(repeat):
+            t0 = time.perf_counter()
+            chunks = chunk_text(text, "bench", max_tokens=max_tokens, overlap_tokens=overlap, count_tokens=count_tokens)
+            best = min(best, time.perf_counter() - t0)
+        mb = len(text.encode("utf-8")) / 2**20
+        results.append({
+            "scale": scale,
+            "mb": round(mb, 2),
+            "chunks": len(chunks),
+            "avg_tokens": round(sum(c.meta["tokens"] for c in chunks) / max(1, len(chunks)), 1),
+            "seconds": round(best, 4),
+            "mb_per_s": round(mb / best, 2) if best > 0 else 0.0,
+        })
+    return {"file": path, "max_tokens": max_tokens, "overlap_tokens": overlap, "results": results}
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--file", default="data/raw/biology_basics.txt")
+    ap.add_argument("--scale", type=int, nargs="+", default=[1, 10, 100])
+    ap.add_argument("--max-tokens", type=int, default=200)
+    ap.add_argument("--overlap", type=int, default=32)
+    ap.add_argument("--repeat", type=int, default=3)
+    ap.add_argument("--tokenizer", default="", help="HF-токенізатор замість approx_token_count")
+    args = ap.parse_args()
+
+    counter = _hf_counter(args.tokenizer) if args.tokenizer else None
+    out = run(args.file, args.scale, args.max_tokens, args.overlap, args.repeat, counter)
+    print(json.dumps(out, ensure_ascii=False, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -1,51 +1,166 @@
 from __future__ import annotations
 from dataclasses import dataclass
-from typing import List, Dict
+from typing import Callable, List, Dict, Optional, Sequence
+import math
+import re
 
 @dataclass
 class Chunk:
     text: str
     meta: Dict
 
+# кінець речення (з лапками/дужками після крапки) або кінець рядка
+_BOUNDARY_RE = re.compile(r"[.!?…]+[\"'»”)\]]*(?=\s|$)|\n")
+_SPACE_RE = re.compile(r"\s*")
+_WORD_RE = re.compile(r"\w+|[^\w\s]")
+
+# ліміт e5 / BERT — 512 токенів разом із [CLS]/[SEP] і префіксом "passage: "
+MAX_TOKENS = 512
+TOKEN_RESERVE = 8
+
+CountFn = Callable[[List[str]], Sequence[int]]
+
 def normalize(text: str) -> str:
     return " ".join((text or "").replace("\r", "").split()).strip()
 
+def approx_token_count(texts: List[str]) -> List[int]:
+    """Слова + розділові знаки. Сабворд-токенізатори дають більше — для точності передавай count_tokens моделі."""
+    return [len(_WORD_RE.findall(t)) for t in texts]
+
+def _units(text: str) -> tuple[List[int], List[int], List[bool]]:
+    """
+    Один прохід регуляркою: межі речень/рядків -> (starts, ends, para_end).
+    Пробіли між одиницями не входять у жодну з них; para_end — після одиниці йде порожній рядок.
+    """
+    starts, ends, para = [], [], []
+    n = len(text)
+    pos = _SPACE_RE.match(text, 0).end()
+    while pos < n:
+        m = _BOUNDARY_RE.search(text, pos)
+        end = n if m is None else (m.start() if m.group() == "\n" else m.end())
+        nxt = n if m is None else _SPACE_RE.match(text, m.end()).end()
+        # "\n" — рядок, що закінчився без крапки: сам перенос не є частиною тексту
+        while end > pos and text[end - 1].isspace():
+            end -= 1
+        if end > pos:
+            starts.append(pos)
+            ends.append(end)
+            para.append(text.count("\n", end, nxt) >= 2)
+        elif para and text.count("\n", end, nxt) >= 2:
+            para[-1] = True
+        pos = nxt
+    return starts, ends, para
+
+def _split_long(text: str, s: int, e: int, tokens: int, max_tokens: int) -> List[tuple[int, int]]:
+    """Одиниця довша за ліміт -> рівні шматки по пробілах (жорсткий розріз, якщо пробілів нема)."""
+    parts = math.ceil(tokens * 1.1 / max_tokens)
+    step = max(1, (e - s) // parts)
+    out, a = [], s
+    while e - a > step:
+        cut = a + step
+        ws = text.rfind(" ", a + step // 2, cut)
+        if ws == -1:
+            ws = text.find(" ", cut, min(e, cut + step // 2))
+        b = ws if ws != -1 else cut
+        out.append((a, b))
+        a = _SPACE_RE.match(text, b).end()
+    if a < e:
+        out.append((a, e))
+    return out
+
+def _fit(text: str, s: int, e: int, tokens: int, max_tokens: int, count: CountFn) -> List[tuple[int, int, int]]:
+    """_split_long, доки кожен шматок не вкладеться в max_tokens (ділення — за символами, не токенами)."""
+    pieces = _split_long(text, s, e, tokens, max_tokens)
+    out = []
+    for (a, b), cc in zip(pieces, count([text[a:b] for a, b in pieces])):
+        if cc > max_tokens and b - a > 1:
+            out.extend(_fit(text, a, b, cc, max_tokens, count))
+        else:
+            out.append((a, b, cc))
+    return out
+
 def chunk_text(
     text: str,
     source: str,
-    chunk_size: int = 900,
-    chunk_overlap: int = 150
+    max_tokens: int = MAX_TOKENS - TOKEN_RESERVE,
+    overlap_tokens: int = 64,
+    count_tokens: Optional[CountFn] = None,
+    min_fill: float = 0.5,
 ) -> List[Chunk]:
-    text = normalize(text)
-    if not text:
+    """
+    Чанки за кількістю токенів з межами по реченнях/абзацах, за лінійний час.
+
+    - текст не нормалізується: chunk.text == text[meta["start"]:meta["end"]];
+    - речення не розрізаються (крім тих, що самі довші за max_tokens);
+    - якщо в чанку вже >= min_fill*max_tokens і далі почався новий абзац — чанк
+      закінчується на межі абзацу без перекриття; інакше наступний чанк
+      починається з останніх речень попереднього (до overlap_tokens).
+    """
+    text = text or ""
+    count = count_tokens or approx_token_count
+    starts, ends, para = _units(text)
+    if not starts:
         return []
+    counts = list(count([text[s:e] for s, e in zip(starts, ends)]))
+
+    # дуже довгі "речення" (таблиці, PDF без крапок) ріжемо заздалегідь
+    if max(counts) > max_tokens:
+        s2, e2, p2, c2 = [], [], [], []
+        for s, e, p, c in zip(starts, ends, para, counts):
+            if c <= max_tokens:
+                s2.append(s), e2.append(e), p2.append(p), c2.append(c)
+                continue
+            pieces = _fit(text, s, e, c, max_tokens, count)
+            for k, (a, b, cc) in enumerate(pieces):
+                s2.append(a), e2.append(b), p2.append(p and k == len(pieces) - 1), c2.append(cc)
+        starts, ends, para, counts = s2, e2, p2, c2
 
     chunks: List[Chunk] = []
+    n = len(starts)
     i = 0
-    n = len(text)
-
     while i < n:
-        end = min(n, i + chunk_size)
-        chunk = text[i:end].strip()
-
-        if chunk:
-            chunks.append(Chunk(
-                text=chunk,
-                meta={
-                    "source": source,
-                    "start": i,
-                    "end": end
-                }
-            ))
-
-        if end == n:
+        j, total, cut, cut_total = i, 0, -1, 0
+        while j < n and (j == i or total + counts[j] <= max_tokens):
+            total += counts[j]
+            if para[j] and total >= min_fill * max_tokens:
+                cut, cut_total = j, total
+            j += 1
+
+        last = j - 1
+        if j < n and cut >= 0:
+            last, total = cut, cut_total
+
+        chunks.append(Chunk(
+            text=text[starts[i]:ends[last]],
+            meta={
+                "source": source,
+                "start": starts[i],
+                "end": ends[last],
+                "tokens": total
+            }
+        ))
+
+        if last == n - 1:
             break
-        i = max(0, end - chunk_overlap)
+        if para[last]:
+            i = last + 1
+            continue
+        k, acc = last, 0
+        while k > i and acc + counts[k] <= overlap_tokens:
+            acc += counts[k]
+            k -= 1
+        i = k + 1
 
     return chunks
 
-def chunk_docs(raw_docs, chunk_size=900, chunk_overlap=150) -> List[Chunk]:
+def chunk_docs(raw_docs, max_tokens=MAX_TOKENS - TOKEN_RESERVE, overlap_tokens=64, count_tokens=None) -> List[Chunk]:
     all_chunks: List[Chunk] = []
     for d in raw_docs:
-        all_chunks.extend(chunk_text(d.text, source=d.source, chunk_size=chunk_size, chunk_overlap=chunk_overlap))
+        all_chunks.extend(chunk_text(
+            d.text,
+            source=d.source,
+            max_tokens=max_tokens,
+            overlap_tokens=overlap_tokens,
+            count_tokens=count_tokens
+        ))
     return all_chunks
@@ -0,0 +1,107 @@
+"""
+Порівняння recall@k / затримки / пам'яті: Chroma vs VectorIndex (exact / ivf / float16 / int8).
+
+    python -m src.compare_indexes --n 20000 --dim 1024 --queries 200 --k 4 --rescore 4
+
+Дані синтетичні (кластеризовані нормалізовані вектори), тож мережа/модель не потрібні.
+Еталон — точний перебір (brute force) по тій самій матриці.
+"""
+from __future__ import annotations
+import argparse
+import json
+import tempfile
+import time
+from typing import Callable, Dict, List
+
+import numpy as np
+
+from src.retriever import VectorIndex
+
+def synthetic(n: int, dim: int, clusters: int, seed: int = 0) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(clusters, dim)).astype(np.float32)
+    x = centers[rng.integers(0, clusters, size=n)] + 0.35 * rng.normal(size=(n, dim)).astype(np.float32)
+    return x / np.linalg.norm(x, axis=1, keepdims=True)
+
+def _measure(search: Callable[[np.ndarray], List[int]], queries: np.ndarray, truth: List[set], k: int) -> Dict:
+    lat, hits = [], 0
+    for q, t in zip(queries, truth):
+        t0 = time.perf_counter()
+        got = search(q)
+        lat.append((time.perf_counter() - t0) * 1000.0)
+        hits += len(t & set(got[:k]))
+    lat.sort()
+    return {
+        f"recall@{k}": round(hits / (k * len(queries)), 4),
+        "p50_ms": round(lat[len(lat) // 2], 3),
+        "p95_ms": round(lat[int(len(lat) * 0.95) - 1], 3),
+    }
+
+def run(n: int, dim: int, n_queries: int, k: int, clusters: int, nprobes: List[int], with_chroma: bool,
+        rescore: int = 4) -> Dict:
+    x = synthetic(n, dim, clusters)
+    rng = np.random.default_rng(1)
+    queries = x[rng.choice(n, n_queries, replace=False)] + 0.05 * rng.normal(size=(n_queries, dim)).astype(np.float32)
+    queries /= np.linalg.norm(queries, axis=1, keepdims=True)
+    truth = [set(np.argsort(-(x @ q))[:k].tolist()) for q in queries]
+
+    ids = [str(i) for i in range(n)]
+    results: Dict[str, Dict] = {}
+
+    with tempfile.TemporaryDirectory() as tmp:
+        exact = VectorIndex(tmp, "exact", mode="exact")
+        exact.upsert(ids, [""] * n, [{}] * n, x)
+        results["numpy_exact"] = _measure(lambda q: exact.search(q, k)[0].tolist(), queries, truth, k)
+        results["numpy_exact"]["memory_mb"] = round(exact.memory_bytes() / 2**20, 2)
+
+        for dtype in ("float16", "int8"):
+            for r in (0, rescore) if rescore else (0,):
+                idx = VectorIndex(tmp, f"{dtype}_{r}", mode="exact", dtype=dtype, rescore=r)
+                idx.upsert(ids, [""] * n, [{}] * n, x)
+                name = f"numpy_{dtype}" + (f"_rescore{r}" if r else "")
+                results[name] = _measure(lambda q: idx.search(q, k)[0].tolist(), queries, truth, k)
+                results[name]["memory_mb"] = round(idx.memory_bytes() / 2**20, 2)
+
+        ivf = VectorIndex(tmp, "ivf", mode="ivf", ivf_min_size=0)
+        ivf.upsert(ids, [""] * n, [{}] * n, x)
+        t0 = time.perf_counter()
+        ivf.train_ivf()
+        results["ivf_train_s"] = round(time.perf_counter() - t0, 2)
+        for p in nprobes:
+            ivf.nprobe = p
+            results[f"numpy_ivf_nprobe{p}"] = _measure(lambda q: ivf.search(q, k)[0].tolist(), queries, truth, k)
+
+        if with_chroma:
+            import chromadb
+            from chromadb.config import Settings
+            client = chromadb.PersistentClient(path=f"{tmp}/chroma", settings=Settings(anonymized_telemetry=False))
+            col = client.get_or_create_collection("bench", metadata={"hnsw:space": "ip"})
+            for a in range(0, n, 5000):
+                col.add(ids=ids[a:a + 5000], embeddings=x[a:a + 5000])
+
+            def chroma_search(q):
+                res = col.query(query_embeddings=[q], n_results=k, include=[])
+                return [int(i) for i in res["ids"][0]]
+
+            results["chroma_hnsw"] = _measure(chroma_search, queries, truth, k)
+
+    return {"n": n, "dim": dim, "queries": n_queries, "k": k, "results": results}
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--n", type=int, default=20000)
+    ap.add_argument("--dim", type=int, default=1024)
+    ap.add_argument("--queries", type=int, default=200)
+    ap.add_argument("--k", type=int, default=4)
+    ap.add_argument("--clusters", type=int, default=64)
+    ap.add_argument("--nprobe", type=int, nargs="+", default=[4, 8, 16, 32])
+    ap.add_argument("--rescore", type=int, default=4, help="множник кандидатів для точного переранжування (0 — вимкнено)")
+    ap.add_argument("--no-chroma", action="store_true")
+    args = ap.parse_args()
+
+    out = run(args.n, args.dim, args.queries, args.k, args.clusters, args.nprobe, not args.no_chroma,
+              args.rescore)
+    print(json.dumps(out, ensure_ascii=False, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,228 @@
+from __future__ import annotations
+from dataclasses import asdict, dataclass
+from typing import Any, Callable, Dict, List, Optional, Sequence
+import math
+import re
+
+import numpy as np
+
+from src.retriever import tokenize
+
+# грубо для GPT-токенізаторів: ~4 символи на токен в англ. тексті, ~3–3.5 в укр.
+CHARS_PER_TOKEN = 3.5
+
+_SENT_END_RE = re.compile(r"[.!?…][\"'»”)\]]*\s")
+
+def estimate_tokens(text: str) -> int:
+    """Наближена кількість токенів за довжиною (без токенізатора; похибка ~±20%)."""
+    return math.ceil(len(text) / CHARS_PER_TOKEN) if text else 0
+
+def tiktoken_counter(model: str) -> Optional[Callable[[str], int]]:
+    """
+    Точний лічильник токенів моделі OpenAI через tiktoken; None — tiktoken не встановлено
+    або словник не завантажився (tiktoken качає його при першому використанні).
+    """
+    try:
+        import tiktoken
+    except ImportError:
+        return None
+    try:
+        try:
+            enc = tiktoken.encoding_for_model(model)
+        except KeyError:
+            enc = tiktoken.get_encoding("o200k_base")
+    except Exception:
+        return None
+    return lambda text: len(enc.encode(text, disallowed_special=())) if text else 0
+
+@dataclass
+class PackStats:
+    chunks_in: int = 0
+    chunks_out: int = 0
+    tokens_in: int = 0
+    tokens_out: int = 0
+    merged: int = 0       # скільки чанків злито з сусідами
+    dropped: int = 0      # відкинуто як надлишкові або через бюджет
+    truncated: int = 0
+
+    @property
+    def saved(self) -> int:
+        return self.tokens_in - self.tokens_out
+
+    def to_dict(self) -> Dict[str, int]:
+        return {**asdict(self), "saved": self.saved}
+
+def _source_key(c: Dict[str, Any]) -> str:
+    meta = c.get("meta") or {}
+    return str(meta.get("source") or meta.get("title") or c.get("title") or "")
+
+def _merge_adjacent(contexts: List[Dict[str, Any]], max_gap: int) -> tuple[List[Dict[str, Any]], List[List[int]]]:
+    """
+    Чанки одного джерела, що перекриваються/стикаються за start/end, -> один фрагмент.
+    Повертає (фрагменти у порядку найкращого рангу, індекси вихідних чанків у кожному).
+    """
+    groups: Dict[str, List[int]] = {}
+    for i, c in enumerate(contexts):
+        meta = c.get("meta") or {}
+        if "start" in meta and "end" in meta:
+            groups.setdefault(_source_key(c), []).append(i)
+
+    parent = list(range(len(contexts)))
+    merged_text: Dict[int, tuple[int, int, str]] = {}
+    for idx in groups.values():
+        idx.sort(key=lambda i: contexts[i]["meta"]["start"])
+        head = idx[0]
+        s, e, text = contexts[head]["meta"]["start"], contexts[head]["meta"]["end"], contexts[head]["text"]
+        for i in idx[1:]:
+            m = contexts[i]["meta"]
+            if m["start"] > e + max_gap:
+                merged_text[head] = (s, e, text)
+                head, s, e, text = i, m["start"], m["end"], contexts[i]["text"]
+                continue
+            if m["end"] > e:
+                tail = contexts[i]["text"][max(0, e - m["start"]):]
+                text = text + ("" if m["start"] <= e else "\n\n") + tail
+                e = m["end"]
+            parent[i] = head
+        merged_text[head] = (s, e, text)
+
+    members: Dict[int, List[int]] = {}
+    for i in range(len(contexts)):
+        members.setdefault(parent[i], []).append(i)
+
+    out, parts = [], []
+    for head in sorted(members, key=lambda h: min(members[h])):
+        c = dict(contexts[head])
+        if len(members[head]) > 1:
+            s, e, text = merged_text[head]
+            c["text"] = text
+            c["meta"] = {**(c.get("meta") or {}), "start": s, "end": e}
+            c["ids"] = [contexts[i].get("id") for i in sorted(members[head])]
+            c["id"] = contexts[min(members[head])].get("id", c.get("id"))
+        out.append(c)
+        parts.append(sorted(members[head]))
+    return out, parts
+
+def _similarity(texts: List[str], embeddings: Optional[np.ndarray]) -> np.ndarray:
+    if embeddings is not None:
+        e = np.asarray(embeddings, dtype=np.float32)
+        e = e / np.maximum(np.linalg.norm(e, axis=1, keepdims=True), 1e-12)
+        return e @ e.T
+    # без ембеддінгів — Жаккар по словах
+    sets = [set(tokenize(t)) for t in texts]
+    n = len(sets)
+    sim = np.eye(n, dtype=np.float32)
+    for i in range(n):
+        for j in range(i + 1, n):
+            u = len(sets[i] | sets[j])
+            sim[i, j] = sim[j, i] = (len(sets[i] & sets[j]) / u) if u else 0.0
+    return sim
+
+def _truncate(text: str, tokens: int, count: Callable[[str], int] = estimate_tokens) -> str:
+    """Обрізає до tokens (за count), по можливості на кінці речення."""
+    limit = int(tokens * CHARS_PER_TOKEN)
+    out = _cut(text, limit)
+    # з точним лічильником оцінка в символах може промахнутися — ужимаємо пропорційно
+    for _ in range(4):
+        n = count(out)
+        if n <= tokens or limit <= 1:
+            break
+        limit = int(limit * tokens / n * 0.95)
+        out = _cut(text, limit)
+    return out
+
+def _cut(text: str, limit: int) -> str:
+    if len(text) <= limit:
+        return text
+    cut = 0
+    for m in _SENT_END_RE.finditer(text, 0, limit + 1):
+        cut = m.end()
+    if cut < limit // 2:
+        ws = text.rfind(" ", 0, limit)
+        cut = ws if ws > limit // 2 else limit
+        return text[:cut].rstrip() + " …"
+    return text[:cut].rstrip()
+
+def _embeddings(contexts: List[Dict[str, Any]], embed_fn) -> Optional[np.ndarray]:
+    """Ембеддінги чанків: з видачі сховища, а відсутні (напр. BM25) — embed_fn; None — нема чим."""
+    vecs = [c.get("embedding") for c in contexts]
+    missing = [i for i, v in enumerate(vecs) if v is None]
+    if missing:
+        if embed_fn is None:
+            return None
+        fresh = np.asarray(embed_fn([contexts[i].get("text") or "" for i in missing]), dtype=np.float32)
+        for i, v in zip(missing, fresh):
+            vecs[i] = v
+    return np.stack([np.asarray(v, dtype=np.float32) for v in vecs])
+
+def pack_context(
+    contexts: List[Dict[str, Any]],
+    budget_tokens: int,
+    embed_fn: Optional[Callable[[List[str]], Sequence]] = None,
+    mmr_lambda: float = 0.7,
+    max_similarity: float = 0.92,
+    min_tokens: int = 48,
+    max_gap: int = 4,
+    count_tokens: Callable[[str], int] = estimate_tokens,
+) -> tuple[List[Dict[str, Any]], PackStats]:
+    """
+    Збирає контекст для промпту в межах budget_tokens (токени рахує count_tokens: типово —
+    наближено за довжиною, estimate_tokens; для моделей OpenAI точно — tiktoken_counter()):
+      1) сусідні чанки одного джерела зливаються за start/end (перекриття не дублюється;
+         між чанками без перекриття — лише пробіли/переноси, звідси max_gap);
+      2) MMR: релевантність — ранг у видачі ретривера, надлишковість — косинус ембеддінгів
+         (c["embedding"] зі сховища; для чанків без нього — embed_fn, якщо задано) або Жаккар;
+         фрагменти зі схожістю >= max_similarity до вже взятого відкидаються;
+      3) поки бюджет не вичерпано; останній фрагмент обрізається на межі речення,
+         якщо лишилось хоча б min_tokens.
+    contexts — у порядку релевантності; повертає (вибрані у порядку MMR, PackStats).
+    """
+    stats = PackStats(chunks_in=len(contexts))
+    stats.tokens_in = sum(count_tokens(c.get("text") or "") for c in contexts)
+    if not contexts or budget_tokens <= 0:
+        stats.chunks_out, stats.tokens_out = len(contexts), stats.tokens_in
+        return list(contexts), stats
+
+    frags, parts = _merge_adjacent(contexts, max_gap)
+    stats.merged = len(contexts) - len(frags)
+    texts = [c.get("text") or "" for c in frags]
+    tokens = [count_tokens(t) for t in texts]
+
+    embs = None
+    if len(frags) > 1:
+        raw = _embeddings(contexts, embed_fn)
+        if raw is not None:
+            embs = np.stack([raw[p].mean(axis=0) for p in parts])
+    sim = _similarity(texts, embs) if len(frags) > 1 else np.ones((1, 1), dtype=np.float32)
+
+    n = len(frags)
+    rel = 1.0 - np.arange(n, dtype=np.float32) / n
+    left = list(range(n))
+    chosen: List[int] = []
+    out: List[Dict[str, Any]] = []
+    budget = budget_tokens
+    while left and budget >= min(min_tokens, min(tokens[i] for i in left)):
+        if chosen:
+            red = sim[np.ix_(left, chosen)].max(axis=1)
+        else:
+            red = np.zeros(len(left), dtype=np.float32)
+        score = mmr_lambda * rel[left] - (1.0 - mmr_lambda) * red
+        k = int(np.argmax(score))
+        i = left.pop(k)
+        if chosen and red[k] >= max_similarity:
+            continue
+
+        c = frags[i]
+        if tokens[i] > budget:
+            if budget < min_tokens:
+                continue
+            c = {**c, "text": _truncate(texts[i], budget, count_tokens)}
+            stats.truncated += 1
+        chosen.append(i)
+        out.append(c)
+        budget -= count_tokens(c["text"])
+
+    stats.chunks_out = len(out)
+    stats.dropped = len(frags) - len(out)
+    stats.tokens_out = sum(count_tokens(c["text"]) for c in out)
+    return out, stats
@@ -0,0 +1,261 @@
+from __future__ import annotations
+from collections import Counter, OrderedDict, deque
+from dataclasses import dataclass, field
+from itertools import groupby
+from typing import Any, Deque, Dict, FrozenSet, List, Optional
+import hashlib
+import math
+import re
+import threading
+import time
+
+from src.context_packer import estimate_tokens
+from src.retriever import tokenize
+
+# службові слова — не несуть теми запиту
+_STOP = frozenset("""
+а і й та але або чи що це як де коли чому навіщо скільки хто який яка яке які якого якої яких
+в у на з із зі до від по за про для при між над під через без після перед
+не ні ще вже теж також так таке такий така такі лише тільки саме ж же би б
+є був була було були бути буде може можна треба
+мені мене ти тебе ми нас ви вас
+поясни розкажи опиши назви наведи скажи дай порівняй
+""".split())
+
+# займенники/вказівні слова — ознака запитання-продовження («а її функції?»)
+_ANAPHORA = frozenset("""
+він вона воно вони його її їх їм ним нею ними нього неї них
+цей ця ці цього цієї цих цим цією цими той того тієї тих там
+""".split())
+
+_FOLLOWUP_RE = re.compile(r"^\s*(а|і|й|та|ну|теж|також|ще|а якщо|а що|а як)\b", re.IGNORECASE)
+_SENT_END_RE = re.compile(r"[.!?…][\"'»”)\]]*\s")
+
+def _content(tokens: List[str]) -> List[str]:
+    return [t for t in tokens if t not in _STOP and t not in _ANAPHORA and len(t) > 1]
+
+def _sentences(text: str) -> List[str]:
+    text = " ".join((text or "").split())
+    out, start = [], 0
+    for m in _SENT_END_RE.finditer(text + " "):
+        out.append(text[start:m.end()].strip())
+        start = m.end()
+    out.append(text[start:].strip())
+    return [x for x in out if x]
+
+def _head(text: str, tokens: int) -> str:
+    """Перші речення text у межах ~tokens."""
+    text = " ".join((text or "").split())
+    if estimate_tokens(text) <= tokens:
+        return text
+    limit = int(tokens * 3.5)
+    cut = 0
+    for m in _SENT_END_RE.finditer(text, 0, limit + 1):
+        cut = m.end()
+    if cut < limit // 3:
+        ws = text.rfind(" ", 0, limit)
+        return text[:ws if ws > 0 else limit].rstrip() + " …"
+    return text[:cut].rstrip()
+
+@dataclass
+class Turn:
+    question: str
+    answer: str
+    query: str        # запит, з яким шукали контекст (після переписування)
+    full_answer: str = ""  # answer до обрізання під вікно — з нього стискається підсумок
+
+@dataclass
+class _Sentence:
+    turn: int         # порядковий номер згорнутої репліки
+    pos: int          # місце в репліці (спершу речення запитання)
+    question: bool
+    text: str
+    terms: FrozenSet[str] = field(default_factory=frozenset)
+
+class Conversation:
+    """
+    Стан однієї сесії: останні recent_turns реплік дослівно (у межах recent_tokens)
+    + екстрактивний підсумок старіших (у межах summary_tokens).
+
+    Репліка, що випадає з вікна, стискається разом із наявним підсумком: її речення
+    (повна відповідь, не обрізана під вікно) змагаються з реченнями підсумку, і лишаються
+    найвагоміші, що вміщаються в бюджет. Вага слова — його частота в усій згорнутій історії
+    (старіше поступово згасає), тож тема, до якої розмова повертається, тримається в підсумку,
+    а разові деталі витісняються. Результат зберігається і стає входом наступного стиснення:
+    розмір промпту не залежить від довжини сесії, а старі репліки повторно не розбираються.
+    """
+
+    def __init__(self, recent_turns: int = 3, recent_tokens: int = 600, summary_tokens: int = 300,
+                 line_tokens: int = 60, decay: float = 0.8):
+        self.recent_turns = recent_turns
+        self.recent_tokens = recent_tokens
+        self.summary_tokens = summary_tokens
+        self.line_tokens = line_tokens     # межа одного речення підсумку
+        self.decay = decay
+        self.turns: Deque[Turn] = deque()
+        self.summary: List[_Sentence] = []
+        self._weights: Counter = Counter()
+        self._folded = 0
+        self.touched = time.time()
+        self.n_turns = 0
+        self.lock = threading.Lock()
+
+    # ---------- retrieval ----------
+    def is_followup(self, question: str) -> bool:
+        toks = tokenize(question)
+        if not toks:
+            return False
+        # «а в рослин?», «які його фази?», «чому?»; коротке, але самодостатнє «Що таке АТФ?» — ні
+        return (
+            bool(_FOLLOWUP_RE.match(question))
+            or any(t in _ANAPHORA for t in toks)
+            or not _content(toks)
+        )
+
+    def rewrite(self, question: str, max_terms: int = 6) -> str:
+        """
+        Запит для пошуку: самодостатнє запитання — як є; продовження («а в рослин?») —
+        з додаванням тематичних слів попереднього запитання, а за ними — його власних
+        доповнень (тож тема тягнеться через ланцюжок уточнень, але не накопичується).
+        """
+        if not self.turns or not self.is_followup(question):
+            return question
+        prev = self.turns[-1]
+        have = set(tokenize(question))
+        extra: List[str] = []
+        for t in _content(tokenize(prev.question)) + _content(tokenize(prev.query)):
+            if t not in have and t not in extra:
+                extra.append(t)
+        if not extra:
+            return question
+        return f"{question} ({' '.join(extra[:max_terms])})"
+
+    # ---------- prompt ----------
+    def summary_text(self) -> str:
+        """Підсумок по рядку на репліку: «— запитання → збережені речення відповіді»."""
+        lines = []
+        for _, group in groupby(self.summary, key=lambda x: x.turn):
+            group = list(group)
+            q = " ".join(x.text for x in group if x.question)
+            a = " ".join(x.text for x in group if not x.question)
+            lines.append(f"— {q or '…'} → {a}" if a else f"— {q}")
+        return "\n".join(lines)
+
+    def history(self) -> List[Dict[str, str]]:
+        """Останні репліки у форматі chat-повідомлень (для API з ролями)."""
+        out = []
+        for t in self.turns:
+            out.append({"role": "user", "content": t.question})
+            out.append({"role": "assistant", "content": t.answer})
+        return out
+
+    def digest(self) -> str:
+        """Відбиток підсумку й останніх реплік (частина ключа кешу відповідей); "" — розмова порожня."""
+        with self.lock:
+            if not self.turns and not self.summary:
+                return ""
+            h = hashlib.sha1(self.summary_text().encode("utf-8"))
+            for t in self.turns:
+                h.update(b"\x00" + t.question.encode("utf-8") + b"\x1f" + t.answer.encode("utf-8"))
+        return h.hexdigest()
+
+    def frame(self, question: str) -> str:
+        """Запит для LLM без ролей (Responses API / Ollama generate): підсумок + останні репліки + запитання."""
+        if not self.turns and not self.summary:
+            return question
+        parts = []
+        if self.summary:
+            parts.append("Попередня розмова (стисло):\n" + self.summary_text())
+        if self.turns:
+            parts.append("Останні репліки:\n" + "\n".join(
+                f"Користувач: {t.question}\nАсистент: {t.answer}" for t in self.turns
+            ))
+        parts.append(f"Поточне запитання: {question}")
+        return "\n\n".join(parts)
+
+    # ---------- update ----------
+    def _recent_size(self) -> int:
+        return sum(estimate_tokens(t.question) + estimate_tokens(t.answer) for t in self.turns)
+
+    def _score(self, s: _Sentence) -> float:
+        if not s.terms:
+            return 0.0
+        score = sum(self._weights[t] for t in s.terms) / math.sqrt(len(s.terms))
+        # запитання називає тему репліки — без нього речення відповіді гірше читаються
+        return score * 1.5 if s.question else score
+
+    def _fold(self, turn: Turn):
+        self._folded += 1
+        texts = [(True, x) for x in _sentences(turn.question)]
+        texts += [(False, x) for x in _sentences(turn.full_answer or turn.answer)]
+        new = []
+        for pos, (question, text) in enumerate(texts):
+            text = _head(text, self.line_tokens)
+            new.append(_Sentence(self._folded, pos, question, text, frozenset(_content(tokenize(text)))))
+
+        self._weights = Counter({t: c * self.decay for t, c in self._weights.items() if c * self.decay >= 0.05})
+        for s in new:
+            self._weights.update(s.terms)
+
+        # жадібний відбір за вагою в межах бюджету; майже-повтори вже відібраного пропускаємо
+        picked: List[_Sentence] = []
+        size = 0
+        for s in sorted(self.summary + new, key=self._score, reverse=True):
+            n = estimate_tokens(s.text) + 1
+            if size + n > self.summary_tokens:
+                continue
+            if any(s.terms and len(s.terms & p.terms) >= 0.8 * len(s.terms | p.terms) for p in picked):
+                continue
+            picked.append(s)
+            size += n
+        picked.sort(key=lambda x: (x.turn, x.pos))
+        self.summary = picked
+
+    def add(self, question: str, answer: str, query: Optional[str] = None):
+        # відповідь у вікні теж обмежена: одна довга відповідь не витіснить решту
+        per_turn = max(self.line_tokens, self.recent_tokens // max(1, self.recent_turns))
+        with self.lock:
+            self.turns.append(Turn(question, _head(answer, per_turn), query or question, answer))
+            self.n_turns += 1
+            self.touched = time.time()
+            while self.turns and (len(self.turns) > self.recent_turns or self._recent_size() > self.recent_tokens):
+                self._fold(self.turns.popleft())
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "turns": self.n_turns,
+            "recent": len(self.turns),
+            "recent_tokens": self._recent_size(),
+            "summary_tokens": estimate_tokens(self.summary_text()),
+        }
+
+class SessionStore:
+    """session_id -> Conversation; LRU на max_sessions + TTL неактивності (у пам'яті процесу)."""
+
+    def __init__(self, max_sessions: int = 1000, ttl: float = 3600.0, **conversation_kw):
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self.conversation_kw = conversation_kw
+        self._data: "OrderedDict[str, Conversation]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, session_id: str) -> Conversation:
+        now = time.time()
+        with self._lock:
+            conv = self._data.get(session_id)
+            if conv is not None and self.ttl > 0 and now - conv.touched > self.ttl:
+                conv = None
+            if conv is None:
+                conv = self._data[session_id] = Conversation(**self.conversation_kw)
+            self._data.move_to_end(session_id)
+            conv.touched = now
+            while len(self._data) > self.max_sessions:
+                self._data.popitem(last=False)
+            return conv
+
+    def reset(self, session_id: str):
+        with self._lock:
+            self._data.pop(session_id, None)
+
+    def __len__(self) -> int:
+        return len(self._data)
@@ -1,7 +1,11 @@
 from __future__ import annotations
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
 from dataclasses import dataclass
 from pathlib import Path
-from typing import List, Dict, Optional
+from typing import Iterable, Iterator, List, Dict, Optional
+import os
+
+SUPPORTED_EXTS = (".txt", ".md", ".pdf")
 
 @dataclass
 class RawDoc:
@@ -12,7 +16,7 @@ class RawDoc:
 def _read_text_file(p: Path) -> str:
     return p.read_text(encoding="utf-8", errors="ignore")
 
-def _read_pdf_file(p: Path) -> str:
+def _read_pdf_pages(p: Path) -> List[str]:
     # легкий PDF рідер без OCR (працює з текстовими PDF)
     from pypdf import PdfReader
     reader = PdfReader(str(p))
@@ -22,43 +26,102 @@ def _read_pdf_file(p: Path) -> str:
             pages.append(page.extract_text() or "")
         except Exception:
             pages.append("")
-    return "\n".join(pages)
+    return pages
 
-def load_raw_docs(raw_dir: str = "data/raw") -> List[RawDoc]:
+def _read_pdf_file(p: Path) -> str:
+    return "\n".join(_read_pdf_pages(p))
+
+def _page_offsets(pages: List[str], lead: int) -> List[int]:
+    """Початок кожної сторінки у "\n".join(pages) після strip() (lead — зрізані пробіли зліва)."""
+    offsets, pos = [], 0
+    for page in pages:
+        offsets.append(max(0, pos - lead))
+        pos += len(page) + 1
+    return offsets
+
+def iter_raw_files(raw_dir: str = "data/raw") -> Iterator[Path]:
     raw_path = Path(raw_dir)
     raw_path.mkdir(parents=True, exist_ok=True)
+    for p in sorted(raw_path.rglob("*")):
+        if p.is_file() and p.suffix.lower() in SUPPORTED_EXTS:
+            yield p
 
-    docs: List[RawDoc] = []
-    for p in raw_path.rglob("*"):
-        if not p.is_file():
-            continue
+def read_raw_doc(p: Path) -> Optional[RawDoc]:
+    """Читає один файл; None — якщо файл порожній або битий."""
+    suffix = p.suffix.lower()
+    pages = None
+    try:
+        if suffix in [".txt", ".md"]:
+            text = _read_text_file(p)
+        elif suffix == ".pdf":
+            pages = _read_pdf_pages(p)
+            text = "\n".join(pages)
+        else:
+            return None
+    except Exception:
+        # якщо один файл битий — не валимо весь пайплайн
+        return None
 
-        suffix = p.suffix.lower()
-        try:
-            if suffix in [".txt", ".md"]:
-                text = _read_text_file(p)
-            elif suffix == ".pdf":
-                text = _read_pdf_file(p)
+    text = text or ""
+    stripped = text.strip()
+    if not stripped:
+        return None
+
+    meta = {"path": str(p), "ext": suffix}
+    if pages is not None:
+        meta["page_offsets"] = _page_offsets(pages, len(text) - len(text.lstrip()))
+    return RawDoc(text=stripped, source=p.name, meta=meta)
+
+def iter_raw_docs(
+    raw_dir: str = "data/raw",
+    paths: Optional[Iterable[Path]] = None,
+    workers: Optional[int] = None,
+    max_pending: Optional[int] = None,
+) -> Iterator[RawDoc]:
+    """
+    Потоковий завантажувач: PDF розбираються у пулі процесів, документи
+    віддаються в міру готовності (порядок не гарантується).
+    max_pending обмежує кількість PDF "у польоті", тож пам'ять не росте з корпусом.
+    workers=0 — усе послідовно в поточному процесі.
+    """
+    files = iter_raw_files(raw_dir) if paths is None else paths
+    if workers is None:
+        workers = max(1, (os.cpu_count() or 2) - 1)
+    max_pending = max_pending or max(1, workers * 2)
+
+    pool: Optional[ProcessPoolExecutor] = None
+    pending = set()
+    try:
+        for p in files:
+            if workers == 0 or p.suffix.lower() != ".pdf":
+                d = read_raw_doc(p)
+                if d is not None:
+                    yield d
             else:
-                continue
+                if pool is None:
+                    pool = ProcessPoolExecutor(max_workers=workers)
+                pending.add(pool.submit(read_raw_doc, p))
 
-            text = (text or "").strip()
-            if not text:
-                continue
+            # що вже готове — віддаємо одразу; якщо черга повна — чекаємо
+            if pending:
+                block = len(pending) >= max_pending
+                done, pending = wait(pending, timeout=None if block else 0, return_when=FIRST_COMPLETED)
+                for f in done:
+                    d = f.result()
+                    if d is not None:
+                        yield d
 
-            docs.append(RawDoc(
-                text=text,
-                source=p.name,
-                meta={"path": str(p), "ext": suffix}
-            ))
-        except Exception as e:
-            # якщо один файл битий — не валимо весь пайплайн
-            docs.append(RawDoc(
-                text="",
-                source=p.name,
-                meta={"path": str(p), "ext": suffix, "error": str(e)}
-            ))
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for f in done:
+                d = f.result()
+                if d is not None:
+                    yield d
+    finally:
+        if pool is not None:
+            pool.shutdown(wait=False, cancel_futures=True)
 
-    # відфільтруємо порожні
-    docs = [d for d in docs if d.text.strip()]
+def load_raw_docs(raw_dir: str = "data/raw") -> List[RawDoc]:
+    docs = list(iter_raw_docs(raw_dir))
+    docs.sort(key=lambda d: d.meta["path"])
     return docs
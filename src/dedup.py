@@ -0,0 +1,239 @@
+from __future__ import annotations
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+import hashlib
+import json
+import os
+import zlib
+
+import numpy as np
+
+from src.retriever import tokenize
+
+_PRIME = (1 << 31) - 1
+
+def text_hash(text: str) -> str:
+    # точна копія з точністю до регістру/пробілів/розділових знаків
+    return hashlib.sha1(" ".join(tokenize(text)).encode("utf-8")).hexdigest()
+
+class ChunkDeduper:
+    """
+    Дедуплікація чанків перед ембеддінгом.
+
+    - точні копії — за text_hash();
+    - майже-дублікати — MinHash по словесних шинглах + LSH (bands x rows),
+      кандидат приймається, якщо оцінка Жаккара >= threshold;
+    - дублікат не ембедиться і не пишеться; його файл записується в aliases
+      вцілілого чанка (also()) — щоб у джерелах було видно, що ще він представляє.
+
+    Стан: dedup_<collection>.npz (сигнатури) + .json (ids, хеші, власники, aliases).
+    release(keys) — забути чанки файлів, що переіндексовуються/видалені; повертає
+    інші файли, чиї дублікати вказували на ці чанки (їх теж треба переіндексувати).
+    """
+
+    def __init__(self, persist_dir: str, collection_name: str, threshold: float = 0.9,
+                 num_perm: int = 64, bands: int = 16, shingle: int = 3, seed: int = 1):
+        if num_perm % bands:
+            raise ValueError("num_perm must be divisible by bands")
+        self.persist_dir = persist_dir
+        self.collection_name = collection_name
+        self.threshold = threshold
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.shingle = shingle
+        rng = np.random.default_rng(seed)
+        self._a = rng.integers(1, _PRIME, size=num_perm, dtype=np.uint64)
+        self._b = rng.integers(0, _PRIME, size=num_perm, dtype=np.uint64)
+        self.duplicates = 0
+        self._reset()
+
+    def _reset(self):
+        self._owner: Dict[str, str] = {}            # chunk id -> ключ файлу
+        self._by_key: Dict[str, List[str]] = {}     # ключ файлу -> chunk ids
+        self._hash: Dict[str, str] = {}             # text_hash -> chunk id
+        self._hash_of: Dict[str, str] = {}
+        self._sig: Dict[str, np.ndarray] = {}
+        self._buckets: List[Dict[bytes, Set[str]]] = [{} for _ in range(self.bands)]
+        self._aliases: Dict[str, Set[str]] = {}     # chunk id -> файли з його дублікатами
+        self._dup_in: Dict[str, Set[str]] = {}      # файл -> chunk ids, на які вказують його дублікати
+
+    @property
+    def _base(self) -> Path:
+        return Path(self.persist_dir) / f"dedup_{self.collection_name}"
+
+    def __len__(self) -> int:
+        return len(self._owner)
+
+    # ---------- MinHash ----------
+    def signature(self, text: str) -> np.ndarray:
+        toks = tokenize(text)
+        k = self.shingle if len(toks) >= self.shingle else 1
+        grams = {" ".join(toks[i:i + k]) for i in range(max(1, len(toks) - k + 1))}
+        x = np.fromiter((zlib.crc32(g.encode("utf-8")) % _PRIME for g in grams), dtype=np.uint64, count=len(grams))
+        # (a*x + b) mod p: x, a < 2^31 => добуток вміщається в uint64
+        h = (np.outer(self._a, x) + self._b[:, None]) % _PRIME
+        return h.min(axis=1).astype(np.uint32)
+
+    def _band_keys(self, sig: np.ndarray) -> List[bytes]:
+        return [sig[i * self.rows:(i + 1) * self.rows].tobytes() for i in range(self.bands)]
+
+    def _near(self, sig: np.ndarray) -> Optional[str]:
+        seen: Set[str] = set()
+        best, best_sim = None, self.threshold
+        for band, key in zip(self._buckets, self._band_keys(sig)):
+            for cid in band.get(key, ()):
+                if cid in seen:
+                    continue
+                seen.add(cid)
+                sim = float(np.mean(self._sig[cid] == sig))
+                if sim >= best_sim:
+                    best, best_sim = cid, sim
+        return best
+
+    # ---------- registry ----------
+    def _register(self, key: str, cid: str, h: str, sig: Optional[np.ndarray]):
+        self._owner[cid] = key
+        self._by_key.setdefault(key, []).append(cid)
+        self._hash.setdefault(h, cid)
+        self._hash_of[cid] = h
+        if sig is not None:
+            self._sig[cid] = sig
+            for band, bk in zip(self._buckets, self._band_keys(sig)):
+                band.setdefault(bk, set()).add(cid)
+
+    def _unregister(self, cid: str):
+        self._owner.pop(cid, None)
+        h = self._hash_of.pop(cid, None)
+        if h is not None and self._hash.get(h) == cid:
+            del self._hash[h]
+        sig = self._sig.pop(cid, None)
+        if sig is not None:
+            for band, bk in zip(self._buckets, self._band_keys(sig)):
+                ids = band.get(bk)
+                if ids is not None:
+                    ids.discard(cid)
+                    if not ids:
+                        del band[bk]
+
+    def release(self, keys: Iterable[str]) -> Set[str]:
+        keys = set(keys)
+        affected: Set[str] = set()
+        for key in keys:
+            for cid in self._by_key.pop(key, []):
+                self._unregister(cid)
+                affected |= self._aliases.pop(cid, set())
+            for cid in self._dup_in.pop(key, set()):
+                if cid in self._aliases:
+                    self._aliases[cid].discard(key)
+        return affected - keys
+
+    def filter(self, key: str, items: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """items: [{id, text, meta}] одного файлу -> ті, що треба ембедити."""
+        kept = []
+        for it in items:
+            cid, text = it["id"], it["text"]
+            if cid in self._owner:
+                # той самий чанк (id враховує текст) уже в індексі
+                kept.append(it)
+                continue
+            h = text_hash(text)
+            dup = self._hash.get(h)
+            sig = None
+            if dup is None and self.threshold < 1.0:
+                sig = self.signature(text)
+                dup = self._near(sig)
+            if dup is not None:
+                self._aliases.setdefault(dup, set()).add(key)
+                self._dup_in.setdefault(key, set()).add(dup)
+                self.duplicates += 1
+                continue
+            if sig is None and self.threshold < 1.0:
+                sig = self.signature(text)
+            self._register(key, cid, h, sig)
+            kept.append(it)
+        return kept
+
+    def also(self, chunk_id: str) -> List[str]:
+        """Інші файли (ключі), дублікати з яких представляє цей чанк."""
+        owner = self._owner.get(chunk_id)
+        return sorted(k for k in self._aliases.get(chunk_id, ()) if k != owner)
+
+    # ---------- persistence ----------
+    def clear(self):
+        self._reset()
+        for ext in (".npz", ".json"):
+            Path(f"{self._base}{ext}").unlink(missing_ok=True)
+
+    def state(self) -> Tuple[Dict[str, Any], np.ndarray]:
+        """Повний стан: (JSON-частина — ids, власники, хеші, aliases; сигнатури uint32 n x num_perm)."""
+        ids = list(self._owner)
+        sig_ids = [cid for cid in ids if cid in self._sig]
+        sigs = np.stack([self._sig[c] for c in sig_ids]) if sig_ids else np.zeros((0, self.num_perm), np.uint32)
+        side = {
+            "num_perm": self.num_perm,
+            "shingle": self.shingle,
+            "ids": ids,
+            "owners": [self._owner[c] for c in ids],
+            "hashes": [self._hash_of[c] for c in ids],
+            "sig_ids": sig_ids,
+            "aliases": {c: sorted(v) for c, v in self._aliases.items() if v},
+        }
+        return side, sigs
+
+    def set_state(self, side: Dict[str, Any], sigs: Optional[np.ndarray] = None,
+                  texts: Optional[Dict[str, str]] = None) -> bool:
+        """
+        Стан з state(). Сигнатури іншої конфігурації (num_perm/shingle) або відсутні —
+        перераховуються з texts (chunk id -> текст); без texts такий стан не приймається.
+        """
+        same = side.get("num_perm") == self.num_perm and side.get("shingle") == self.shingle
+        if (sigs is None or not same) and texts is None:
+            return False
+        self._reset()
+        by_id = dict(zip(side["sig_ids"], sigs)) if sigs is not None and same else {}
+        for cid, key, h in zip(side["ids"], side["owners"], side["hashes"]):
+            sig = by_id.get(cid)
+            if sig is None and texts is not None and self.threshold < 1.0 and cid in texts:
+                sig = self.signature(texts[cid])
+            self._register(key, cid, h, sig)
+        for cid, keys in side["aliases"].items():
+            self._aliases[cid] = set(keys)
+            for k in keys:
+                self._dup_in.setdefault(k, set()).add(cid)
+        return True
+
+    def save(self):
+        base = self._base
+        base.parent.mkdir(parents=True, exist_ok=True)
+        side, sigs = self.state()
+        np.savez(f"{base}.npz", sigs=sigs)
+        tmp = f"{base}.json.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(side, f, ensure_ascii=False)
+        os.replace(tmp, f"{base}.json")
+
+    def load(self) -> bool:
+        base = self._base
+        if not (Path(f"{base}.npz").exists() and Path(f"{base}.json").exists()):
+            return False
+        with open(f"{base}.json", encoding="utf-8") as f:
+            side = json.load(f)
+        if side.get("num_perm") != self.num_perm or side.get("shingle") != self.shingle:
+            return False
+        with np.load(f"{base}.npz") as z:
+            sigs = z["sigs"]
+        return self.set_state(side, sigs)
+
+    def reload(self):
+        """Відкинути незбережені зміни (напр. після збою індексації): стан — як на диску."""
+        if not self.load():
+            self._reset()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "chunks": len(self._owner),
+            "duplicates": self.duplicates,
+            "aliased": sum(1 for v in self._aliases.values() if v),
+            "threshold": self.threshold,
+        }
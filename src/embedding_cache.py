@@ -0,0 +1,310 @@
+from __future__ import annotations
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Sequence
+import atexit
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows: міжпроцесного замка немає, лишається лише потоковий
+    fcntl = None
+
+KEY_BYTES = 20  # sha1 digest
+
+def cache_key(model_name: str, prefix: str, text: str) -> bytes:
+    h = hashlib.sha1()
+    h.update(model_name.encode("utf-8"))
+    h.update(b"\x00")
+    h.update(prefix.encode("utf-8"))
+    h.update(b"\x00")
+    h.update(text.encode("utf-8", errors="ignore"))
+    return h.digest()
+
+class EmbeddingCache:
+    """
+    Дисковий кеш ембеддінгів, адресований вмістом: (model, prefix, sha1(text)) -> float32[dim].
+
+    Файли в <cache_dir>/<model>/:
+      vectors.f32 — суцільна матриця float32 (rows x dim), читається через np.memmap
+      keys.bin    — 20-байтові ключі, по одному на рядок
+      ticks.u64   — "час" останнього звернення до рядка (для LRU-витіснення)
+      meta.json   — dim / rows / gen (лічильник записів)
+      .lock       — файловий замок (fcntl) на час запису
+
+    Нові рядки накопичуються в пам'яті й дописуються в кінець vectors.f32 і keys.bin
+    (без переписування наявних), коли їх набереться flush_rows або мине flush_secs від
+    попереднього запису, — тож промах одного запиту не пише на диск. ticks.u64 (лише
+    підказка для LRU) переписується при flush() — наприкінці індексації та на виході процесу —
+    і при витісненні.
+
+    Кеш можуть ділити кілька процесів (воркери сервера, індексатор): кожен запис іде під
+    файловим замком, і якщо gen на диску змінився, спершу перечитується чужий стан,
+    а власні нескинуті рядки дописуються після нього.
+    """
+
+    def __init__(self, cache_dir: str, model_name: str, max_entries: int = 200_000,
+                 flush_rows: int = 1024, flush_secs: float = 30.0):
+        self.model_name = model_name
+        self.max_entries = max_entries
+        self.flush_rows = flush_rows
+        self.flush_secs = flush_secs
+        slug = re.sub(r"[^A-Za-z0-9_.-]+", "_", model_name) or "default"
+        self.dir = Path(cache_dir) / slug
+        self.dir.mkdir(parents=True, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._index: Dict[bytes, int] = {}
+        self._ticks: List[int] = []
+        self._tick = 0
+        self._dim = 0
+        self._rows = 0          # рядків на диску
+        self._gen = 0           # gen із meta.json на момент останнього читання/запису
+        self._mm: Optional[np.memmap] = None
+        self._pending: List[np.ndarray] = []   # ще не скинуті на диск рядки
+        self._pending_keys: List[bytes] = []
+        self._flushed_at = time.monotonic()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._load()
+        atexit.register(self.flush)
+
+    # ---------- storage ----------
+    @property
+    def _vectors_path(self) -> Path:
+        return self.dir / "vectors.f32"
+
+    @property
+    def _meta_path(self) -> Path:
+        return self.dir / "meta.json"
+
+    @contextmanager
+    def _file_lock(self):
+        if fcntl is None:
+            yield
+            return
+        with open(self.dir / ".lock", "a+b") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _disk_gen(self) -> int:
+        try:
+            return int(json.loads(self._meta_path.read_text(encoding="utf-8")).get("gen", 0))
+        except (OSError, ValueError, AttributeError):
+            return 0
+
+    def _load(self):
+        meta_p = self._meta_path
+        if not meta_p.exists():
+            return
+        try:
+            meta = json.loads(meta_p.read_text(encoding="utf-8"))
+            dim, rows = int(meta["dim"]), int(meta["rows"])
+            gen = int(meta.get("gen", 0))
+            keys = (self.dir / "keys.bin").read_bytes()
+            ticks = np.fromfile(self.dir / "ticks.u64", dtype=np.uint64)
+        except (OSError, ValueError, KeyError):
+            return
+        # неконсистентний кеш (обірваний запис) — просто починаємо з нуля;
+        # хвости vectors.f32/keys.bin за межами rows обрізаються при наступному дописуванні
+        if len(keys) < rows * KEY_BYTES:
+            return
+        if not self._vectors_path.exists() or self._vectors_path.stat().st_size < rows * dim * 4:
+            return
+
+        self._dim, self._rows, self._gen = dim, rows, gen
+        self._index = {keys[i * KEY_BYTES:(i + 1) * KEY_BYTES]: i for i in range(rows)}
+        # ticks пишуться рідше за рядки: нових рядків бракує часу звернення — вважаємо їх найстарішими
+        self._ticks = ticks[:rows].astype(np.int64).tolist() + [0] * max(0, rows - len(ticks))
+        self._tick = max(self._ticks, default=0)
+        self._open_mm()
+
+    def _open_mm(self):
+        self._mm = None
+        if self._rows and self._dim:
+            self._mm = np.memmap(self._vectors_path, dtype=np.float32, mode="r", shape=(self._rows, self._dim))
+
+    def _row(self, i: int) -> np.ndarray:
+        if i < self._rows:
+            return self._mm[i]
+        return self._pending[i - self._rows]
+
+    def flush(self):
+        """Усе на диск, разом із часами звернень (кінець індексації, вихід процесу)."""
+        with self._lock:
+            self._flush_locked(ticks=True)
+
+    def _maybe_flush_locked(self):
+        if len(self._pending) >= self.flush_rows or (
+            self._pending and time.monotonic() - self._flushed_at >= self.flush_secs
+        ):
+            self._flush_locked()
+
+    def _sync_locked(self):
+        """Під файловим замком: якщо кеш на диску переписав інший процес — беремо його стан."""
+        gen = self._disk_gen()
+        if gen == self._gen:
+            return
+        pending = list(zip(self._pending_keys, self._pending))
+        self._mm = None
+        self._index, self._ticks, self._rows, self._tick = {}, [], 0, 0
+        self._pending, self._pending_keys = [], []
+        self._load()
+        self._gen = gen
+        for k, v in pending:
+            if k in self._index:
+                continue
+            self._tick += 1
+            self._index[k] = self._rows + len(self._pending)
+            self._ticks.append(self._tick)
+            self._pending.append(v)
+            self._pending_keys.append(k)
+
+    def _flush_locked(self, ticks: bool = False):
+        self._flushed_at = time.monotonic()
+        if not self._pending and not ticks:
+            return
+        with self._file_lock():
+            self._sync_locked()
+            self._write_locked(ticks)
+
+    def _write_locked(self, ticks: bool):
+        if self._pending:
+            # обрізаємо хвости від можливого обірваного попереднього запису
+            with open(self._vectors_path, "ab") as f:
+                f.truncate(self._rows * self._dim * 4)
+                f.write(np.ascontiguousarray(np.stack(self._pending), dtype=np.float32).tobytes())
+            with open(self.dir / "keys.bin", "ab") as f:
+                f.truncate(self._rows * KEY_BYTES)
+                f.write(b"".join(self._pending_keys))
+            self._rows += len(self._pending)
+            self._pending, self._pending_keys = [], []
+            self._open_mm()
+
+        if len(self._index) > self.max_entries:
+            self._evict_locked()
+        elif ticks:
+            np.asarray(self._ticks, dtype=np.uint64).tofile(self.dir / "ticks.u64")
+        self._write_meta()
+
+    def _write_meta(self):
+        # атомарний запис: спершу tmp, потім replace (як IndexManifest.save)
+        self._gen += 1
+        tmp = self._meta_path.with_suffix(".json.tmp")
+        tmp.write_text(
+            json.dumps({"model": self.model_name, "dim": self._dim, "rows": self._rows, "gen": self._gen}),
+            encoding="utf-8",
+        )
+        os.replace(tmp, self._meta_path)
+
+    def _evict_locked(self):
+        # лишаємо ~90% ліміту найсвіжіших рядків і переписуємо матрицю
+        keep_n = int(self.max_entries * 0.9)
+        order = np.argsort(np.asarray(self._ticks, dtype=np.int64))[::-1][:keep_n]
+        order.sort()
+        by_row = {i: k for k, i in self._index.items()}
+
+        vecs = np.array(self._mm[order], dtype=np.float32)
+        tmp = self._vectors_path.with_suffix(".tmp")
+        vecs.tofile(tmp)
+        self._mm = None
+        os.replace(tmp, self._vectors_path)
+
+        self.evictions += len(self._index) - len(order)
+        self._index = {by_row[int(old)]: new for new, old in enumerate(order)}
+        self._ticks = [self._ticks[int(old)] for old in order]
+        self._rows = len(order)
+        self._open_mm()
+
+        keys = bytearray(self._rows * KEY_BYTES)
+        for k, i in self._index.items():
+            keys[i * KEY_BYTES:(i + 1) * KEY_BYTES] = k
+        tmp = self.dir / "keys.bin.tmp"
+        tmp.write_bytes(bytes(keys))
+        os.replace(tmp, self.dir / "keys.bin")
+        np.asarray(self._ticks, dtype=np.uint64).tofile(self.dir / "ticks.u64")
+
+    # ---------- API ----------
+    def get_many(self, texts: Sequence[str], prefix: str = "") -> List[Optional[np.ndarray]]:
+        out: List[Optional[np.ndarray]] = []
+        with self._lock:
+            for t in texts:
+                i = self._index.get(cache_key(self.model_name, prefix, t))
+                if i is None:
+                    self.misses += 1
+                    out.append(None)
+                    continue
+                self.hits += 1
+                self._tick += 1
+                self._ticks[i] = self._tick
+                out.append(np.array(self._row(i), dtype=np.float32))
+        return out
+
+    def put_many(self, texts: Sequence[str], vectors, prefix: str = ""):
+        vectors = np.asarray(vectors, dtype=np.float32)
+        with self._lock:
+            if not self._dim:
+                self._dim = int(vectors.shape[1])
+            elif vectors.shape[1] != self._dim:
+                raise ValueError(f"Embedding dim mismatch: cache={self._dim}, got={vectors.shape[1]}")
+            for t, v in zip(texts, vectors):
+                k = cache_key(self.model_name, prefix, t)
+                if k in self._index:
+                    continue
+                self._tick += 1
+                self._index[k] = self._rows + len(self._pending)
+                self._ticks.append(self._tick)
+                self._pending.append(v)
+                self._pending_keys.append(k)
+            self._maybe_flush_locked()
+
+    def embed(
+        self,
+        texts: Sequence[str],
+        embed_fn: Callable[[List[str]], "np.ndarray"],
+        prefix: str = "",
+    ) -> np.ndarray:
+        """
+        Повертає float32 (len(texts) x dim): хіти беруться з кешу,
+        промахи (без дублікатів) рахуються одним викликом embed_fn.
+        """
+        cached = self.get_many(texts, prefix)
+        miss_pos: Dict[str, List[int]] = {}
+        for i, (t, v) in enumerate(zip(texts, cached)):
+            if v is None:
+                miss_pos.setdefault(t, []).append(i)
+
+        if miss_pos:
+            miss_texts = list(miss_pos)
+            fresh = np.asarray(embed_fn(miss_texts), dtype=np.float32)
+            self.put_many(miss_texts, fresh, prefix)
+            for t, v in zip(miss_texts, fresh):
+                for i in miss_pos[t]:
+                    cached[i] = v
+
+        if not cached:
+            return np.zeros((0, self._dim), dtype=np.float32)
+        return np.ascontiguousarray(np.stack(cached), dtype=np.float32)
+
+    def stats(self) -> Dict[str, float]:
+        total = self.hits + self.misses
+        return {
+            "entries": len(self._index),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": (self.hits / total) if total else 0.0,
+            "evictions": self.evictions,
+            "bytes": (self._rows + len(self._pending)) * self._dim * 4,
+        }
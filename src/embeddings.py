@@ -1,19 +1,214 @@
 from __future__ import annotations
-from typing import List
+from typing import Dict, Iterable, Iterator, List, Optional, TYPE_CHECKING
 import os
+import threading
+import time
+
+import numpy as np
+
+from src.tracing import span
+
+if TYPE_CHECKING:
+    from src.embedding_cache import EmbeddingCache
+
+# грубо: скільки байт активацій на один токен * вимір (трансформер тримає кілька копій)
+_ACT_FACTOR = 12
+
+def _available_memory(device: str) -> int:
+    if device.startswith("cuda"):
+        import torch
+        free, _total = torch.cuda.mem_get_info(torch.device(device))
+        return int(free)
+    try:
+        import psutil
+        return int(psutil.virtual_memory().available)
+    except ImportError:
+        pass
+    try:
+        return int(os.sysconf("SC_AVPHYS_PAGES") * os.sysconf("SC_PAGE_SIZE"))
+    except (ValueError, OSError, AttributeError):
+        return 2 << 30
+
+def _is_oom(e: BaseException) -> bool:
+    return "out of memory" in str(e).lower()
+
+def _windows(texts: Iterable[str], size: int) -> Iterator[List[str]]:
+    buf: List[str] = []
+    for t in texts:
+        buf.append(t)
+        if len(buf) >= size:
+            yield buf
+            buf = []
+    if buf:
+        yield buf
+
+class EmbeddingEngine:
+    """
+    Пакетне кодування потоку текстів:
+    - потік набирається вікнами по window текстів (типово 16 батчів), і в межах
+      вікна тексти сортуються за довжиною — сусіди в батчі схожої довжини, менше паддінгу;
+    - розмір батча підбирається під вільну пам'ять пристрою і зменшується при OOM;
+    - результат — суцільний float32 масив у вихідному порядку, без Python-списків.
+    """
+
+    def __init__(
+        self,
+        model,
+        batch_size: Optional[int] = None,
+        min_batch_size: int = 4,
+        max_batch_size: int = 256,
+        mem_fraction: float = 0.5,
+        window: int = 0,
+    ):
+        self.model = model
+        self.min_batch_size = min_batch_size
+        self.max_batch_size = max_batch_size
+        self.mem_fraction = mem_fraction
+        self.batch_size = batch_size or self.auto_batch_size()
+        # у вікні одного батча сортувати нічого — беремо з запасом
+        self.window = window or 16 * self.batch_size
+        self.last_stats: Dict[str, float] = {}
+        self.total_chunks = 0
+        self.total_seconds = 0.0
+
+    @property
+    def device(self) -> str:
+        return str(getattr(self.model, "device", "cpu"))
+
+    @property
+    def dim(self) -> int:
+        return int(self.model.get_sentence_embedding_dimension())
+
+    def auto_batch_size(self) -> int:
+        seq = int(getattr(self.model, "max_seq_length", None) or 512)
+        per_item = seq * self.dim * 4 * _ACT_FACTOR
+        budget = _available_memory(self.device) * self.mem_fraction
+        bs = int(budget // max(1, per_item))
+        if not self.device.startswith("cuda"):
+            # на CPU великі батчі не пришвидшують, лише з'їдають RAM
+            bs = min(bs, 64)
+        return max(self.min_batch_size, min(self.max_batch_size, bs))
+
+    def _encode_batch(self, batch: List[str]) -> np.ndarray:
+        try:
+            return self.model.encode(
+                batch,
+                batch_size=len(batch),
+                normalize_embeddings=True,
+                convert_to_numpy=True,
+                show_progress_bar=False,
+            )
+        except RuntimeError as e:
+            if not _is_oom(e) or len(batch) <= self.min_batch_size:
+                raise
+            if self.device.startswith("cuda"):
+                import torch
+                torch.cuda.empty_cache()
+            # OOM — зменшуємо батч і кодуємо половинками
+            self.batch_size = max(self.min_batch_size, len(batch) // 2)
+            half = len(batch) // 2
+            return np.concatenate([self._encode_batch(batch[:half]), self._encode_batch(batch[half:])])
+
+    def _encode_window(self, texts: List[str], out: np.ndarray):
+        order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+        i = 0
+        while i < len(order):
+            idx = order[i:i + self.batch_size]
+            out[idx] = self._encode_batch([texts[j] for j in idx])
+            i += len(idx)
+
+    def throughput(self) -> float:
+        """Середня швидкість за весь час життя рушія, чанків/с."""
+        return (self.total_chunks / self.total_seconds) if self.total_seconds > 0 else 0.0
+
+    def encode_stream(self, texts: Iterable[str], prefix: str = "") -> Iterator[np.ndarray]:
+        """Кодує потік вікнами по self.window текстів; кожне вікно — float32 (n x dim)."""
+        for buf in _windows(texts, self.window):
+            yield self._run([prefix + t for t in buf])
+
+    def encode(self, texts: List[str], prefix: str = "") -> np.ndarray:
+        if not texts:
+            return np.zeros((0, self.dim), dtype=np.float32)
+        return self._run([prefix + t for t in texts])
+
+    def _run(self, texts: List[str]) -> np.ndarray:
+        t0 = time.perf_counter()
+        out = np.empty((len(texts), self.dim), dtype=np.float32)
+        self._encode_window(texts, out)
+        dt = time.perf_counter() - t0
+        self.total_chunks += len(texts)
+        self.total_seconds += dt
+        self.last_stats = {
+            "chunks": len(texts),
+            "seconds": dt,
+            "chunks_per_s": (len(texts) / dt) if dt > 0 else 0.0,
+            "batch_size": self.batch_size,
+        }
+        return out
 
 class EmbeddingModel:
-    def __init__(self, model_name: str = "intfloat/e5-large-v2", device: str | None = None):
-        from sentence_transformers import SentenceTransformer
+    def __init__(
+        self,
+        model_name: str = "intfloat/e5-large-v2",
+        device: str | None = None,
+        cache: Optional["EmbeddingCache"] = None,
+        batch_size: Optional[int] = None,
+        query_batch_ms: float = 0.0,
+        query_batch_max: int = 32,
+    ):
+        from src.registry import sentence_transformer
         self.model_name = model_name
         self.device = device
-        self.model = SentenceTransformer(model_name, device=device)
+        # модель спільна на процес (src.registry): повторне створення не перевантажує ваги
+        self.model = sentence_transformer(model_name, device=device)
+        self.engine = EmbeddingEngine(self.model, batch_size=batch_size)
+        self.cache = cache
+        self._tokenizer = None
+        self._tok_lock = threading.Lock()
+
+        # query_batch_ms > 0 — одночасні embed_query зливаються в один encode
+        self.query_batcher = None
+        if query_batch_ms > 0:
+            from src.batching import QueryBatcher
+            self.query_batcher = QueryBatcher(
+                lambda texts: self._encode(texts, "query: "),
+                max_batch=query_batch_max,
+                max_wait_ms=query_batch_ms,
+            )
+
+    @property
+    def max_tokens(self) -> int:
+        return int(getattr(self.model, "max_seq_length", None) or 512)
+
+    def count_tokens(self, texts: List[str]) -> List[int]:
+        """Кількість токенів без спецтокенів (для чанкера)."""
+        with self._tok_lock:
+            # окрема копія: fast-токенізатор не можна ділити з encode() в іншому потоці
+            if self._tokenizer is None:
+                import copy
+                self._tokenizer = copy.deepcopy(self.model.tokenizer)
+            ids = self._tokenizer(list(texts), add_special_tokens=False)["input_ids"]
+        return [len(x) for x in ids]
+
+    def _encode(self, texts: List[str], prefix: str) -> np.ndarray:
+        def run(items: List[str]) -> np.ndarray:
+            return self.engine.encode(items, prefix=prefix)
+
+        if self.cache is None:
+            return run(list(texts))
+        return self.cache.embed(texts, run, prefix=prefix)
+
+    def embed_documents(self, texts: List[str]) -> np.ndarray:
+        # e5: рекомендовано prefix "passage: "; повертає float32 (n x dim)
+        return self._encode(texts, "passage: ")
 
-    def embed_documents(self, texts: List[str]) -> List[List[float]]:
-        # e5: рекомендовано prefix "passage: "
-        passages = [f"passage: {t}" for t in texts]
-        return self.model.encode(passages, normalize_embeddings=True).tolist()
+    def embed_queries(self, texts: List[str]) -> np.ndarray:
+        """Пакет запитів одним encode (оцінка, пакетні запити); float32 (n x dim)."""
+        with span("embed"):
+            return self._encode(list(texts), "query: ")
 
     def embed_query(self, text: str) -> List[float]:
-        q = f"query: {text}"
-        return self.model.encode([q], normalize_embeddings=True)[0].tolist()
+        with span("embed"):
+            if self.query_batcher is not None:
+                return self.query_batcher.embed(text).tolist()
+            return self._encode([text], "query: ")[0].tolist()
@@ -0,0 +1,225 @@
+"""
+Офлайн-оцінка retrieval по «золотому» набору запитань.
+
+    python -m src.evaluate --golden data/eval/golden.jsonl --ks 1,2,4,8
+    python -m src.evaluate --golden data/eval/golden.jsonl \\
+        --set embed_model=intfloat/e5-large-v2,intfloat/e5-small-v2 --set chunk_tokens=0,256 \\
+        --set vector_backend=numpy --set vector_dtype=float32,int8 --out eval.json
+
+Формат golden (JSONL), один рядок — одне запитання:
+    {"question": "Що таке мітоз?", "sources": ["biology_basics.txt"], "contains": ["МІТОЗ — ПРИЗНАЧЕННЯ"]}
+  sources  — очікувані файли (meta["source"]); contains — необов'язково: фрагменти тексту,
+  які мають потрапити у видачу (регістр не важливий). Якщо contains задано, ціль — кожен фрагмент
+  (з очікуваних файлів), інакше — кожен файл.
+
+Кожна комбінація --set — окремий індекс у --work-dir (повторний запуск дочищує його інкрементально);
+top_k не потребує переіндексації: запит робиться один раз на max(--ks), метрики рахуються для кожного k.
+Усі запитання ембедяться одним пакетом (retriever.query_batch), затримка — на запит у середньому.
+Рекомендація — найдешевша (менший k, менший індекс, швидший запит) конфігурація, чия метрика
+не гірша за найкращу більш ніж на --tolerance.
+"""
+from __future__ import annotations
+import argparse
+import dataclasses
+import itertools
+import json
+import math
+import re
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Sequence
+
+from src.llm import LLMConfig
+from src.rag_pipeline import PipelineConfig, RAGPipeline
+from src.tracing import Tracer
+
+# параметри, від яких не залежить індекс (не впливають на назву робочої теки)
+QUERY_ONLY = {
+    "hybrid_skip_dense_at", "query_batch_ms", "query_batch_max",
+    "rerank_model", "rerank_candidates", "rerank_batch_size", "rerank_cache_size", "rerank_max_ms",
+}
+
+def load_golden(path: str) -> List[Dict[str, Any]]:
+    items = []
+    with open(path, "r", encoding="utf-8") as f:
+        for n, line in enumerate(f, start=1):
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            row = json.loads(line)
+            sources = row.get("sources") or ([row["source"]] if row.get("source") else [])
+            contains = row.get("contains") or []
+            if not row.get("question") or not (sources or contains):
+                raise ValueError(f"{path}:{n}: потрібні question і sources/contains")
+            items.append({"question": row["question"], "sources": [Path(s).name for s in sources],
+                          "contains": [c.lower() for c in contains]})
+    return items
+
+def _covers(hit: Dict[str, Any], item: Dict[str, Any]) -> List[int]:
+    """Індекси цілей item, які покриває чанк hit."""
+    meta = hit.get("meta") or {}
+    src = Path(str(meta.get("source") or meta.get("title") or "")).name
+    if item["contains"]:
+        if item["sources"] and src not in item["sources"]:
+            return []
+        text = (hit.get("text") or "").lower()
+        return [i for i, c in enumerate(item["contains"]) if c in text]
+    return [i for i, s in enumerate(item["sources"]) if s == src]
+
+def score(hits: Sequence[Dict[str, Any]], item: Dict[str, Any], k: int) -> Dict[str, float]:
+    """recall@k, MRR@k, nDCG@k (бінарна релевантність; повторне влучання в ту саму ціль — не рахується)."""
+    n_targets = len(item["contains"]) or len(item["sources"])
+    found: set = set()
+    rr, dcg = 0.0, 0.0
+    for rank, hit in enumerate(hits[:k], start=1):
+        cov = _covers(hit, item)
+        if cov and not rr:
+            rr = 1.0 / rank
+        new = [i for i in cov if i not in found]
+        if new:
+            dcg += 1.0 / math.log2(rank + 1)
+            found.update(new)
+    idcg = sum(1.0 / math.log2(r + 1) for r in range(1, min(n_targets, k) + 1))
+    return {"recall": len(found) / n_targets, "mrr": rr, "ndcg": dcg / idcg if idcg else 0.0}
+
+def _parse_value(field: dataclasses.Field, raw: str):
+    t = type(field.default)
+    if t is bool:
+        return raw.lower() in ("1", "true", "yes")
+    return t(raw) if t in (int, float) else raw
+
+def config_grid(base: PipelineConfig, sets: List[str]) -> List[Dict[str, Any]]:
+    fields = {f.name: f for f in dataclasses.fields(PipelineConfig)}
+    axes = []
+    for s in sets:
+        name, _, values = s.partition("=")
+        name = name.strip()
+        if name not in fields:
+            raise ValueError(f"Unknown PipelineConfig field: {name}")
+        if name == "top_k":
+            raise ValueError("top_k задається через --ks")
+        axes.append([(name, _parse_value(fields[name], v.strip())) for v in values.split(",")])
+    return [dict(combo) for combo in itertools.product(*axes)] if axes else [{}]
+
+def _slug(overrides: Dict[str, Any]) -> str:
+    parts = [f"{k}-{v}" for k, v in sorted(overrides.items()) if k not in QUERY_ONLY]
+    return re.sub(r"[^\w.-]+", "_", "__".join(parts)) or "default"
+
+def _index_mb(pipe: RAGPipeline) -> float:
+    index = getattr(pipe.retriever, "index", None)
+    if index is not None:
+        return round(index.memory_bytes() / 2**20, 3)
+    # Chroma: розмір теки на диску (HNSW + sqlite з текстами)
+    total = sum(p.stat().st_size for p in Path(pipe.cfg.persist_dir).rglob("*") if p.is_file())
+    return round(total / 2**20, 3)
+
+def _search(pipe: RAGPipeline, questions: List[str], top_k: int) -> List[List[Dict[str, Any]]]:
+    searcher = pipe.searcher
+    k = max(top_k, pipe.cfg.rerank_candidates) if pipe.reranker is not None else top_k
+    if hasattr(searcher, "query_batch"):
+        found = searcher.query_batch(questions, top_k=k)
+    else:
+        # bm25 / hybrid — без пакетного шляху
+        found = [searcher.query(q, top_k=k) for q in questions]
+    if pipe.reranker is not None:
+        found = [pipe.reranker.rerank(q, hits, top_k) for q, hits in zip(questions, found)]
+    return found
+
+def evaluate(base: PipelineConfig, golden: List[Dict[str, Any]], ks: List[int], sets: List[str],
+             work_dir: str, repeat: int = 1) -> List[Dict[str, Any]]:
+    questions = [g["question"] for g in golden]
+    max_k = max(ks)
+    rows = []
+    for overrides in config_grid(base, sets):
+        cfg = dataclasses.replace(base, **overrides, persist_dir=str(Path(work_dir) / _slug(overrides)),
+                                  answer_cache_size=0, tracing=False)
+        pipe = RAGPipeline(cfg, LLMConfig())
+        stats = pipe.index(incremental=True)
+
+        _search(pipe, questions[:1], max_k)  # прогрів (ліниві структури, кеші ОС)
+        tracer = Tracer()
+        t0 = time.perf_counter()
+        for _ in range(max(1, repeat)):
+            if pipe.reranker is not None:
+                pipe.reranker.clear()  # міряємо без кешу оцінок
+            with tracer.trace() as tr:
+                results = _search(pipe, questions, max_k)
+        per_q = (time.perf_counter() - t0) * 1000.0 / (max(1, repeat) * len(questions))
+        spans = {f"{k}_per_q": round(v / len(questions), 3)
+                 for k, v in tr.timings().items() if k != "total_ms"}
+
+        base_row = {
+            "config": overrides,
+            "chunks": stats["chunks"],
+            "dim": pipe.embedder.engine.dim,
+            "index_mb": _index_mb(pipe),
+            "ms_per_query": round(per_q, 3),
+            **spans,
+        }
+        for k in ks:
+            agg = {"recall": 0.0, "mrr": 0.0, "ndcg": 0.0}
+            misses = []
+            for item, hits in zip(golden, results):
+                sc = score(hits, item, k)
+                for m in agg:
+                    agg[m] += sc[m]
+                if sc["recall"] < 1.0:
+                    misses.append(item["question"])
+            n = len(golden)
+            rows.append({
+                **base_row, "k": k,
+                "recall": round(agg["recall"] / n, 4),
+                "mrr": round(agg["mrr"] / n, 4),
+                "ndcg": round(agg["ndcg"] / n, 4),
+                "misses": misses,
+            })
+    return rows
+
+def recommend(rows: List[Dict[str, Any]], metric: str, tolerance: float) -> Dict[str, Any]:
+    best = max(r[metric] for r in rows)
+    ok = [r for r in rows if r[metric] >= best - tolerance]
+    return min(ok, key=lambda r: (r["k"], r["index_mb"], r["ms_per_query"]))
+
+def _label(cfg: Dict[str, Any], keys: List[str]) -> str:
+    return " ".join(f"{k}={cfg[k]}" for k in keys) or "(base)"
+
+def main():
+    ap = argparse.ArgumentParser(description="recall@k / MRR / nDCG і затримка retrieval по golden-набору")
+    ap.add_argument("--golden", required=True, help="JSONL: question, sources[, contains]")
+    ap.add_argument("--ks", default="1,2,4,8", help="значення top_k через кому")
+    ap.add_argument("--set", action="append", default=[], metavar="FIELD=V1,V2",
+                    help="варіанти поля PipelineConfig (повторюваний; комбінуються декартово)")
+    ap.add_argument("--raw-dir", default=PipelineConfig.raw_dir)
+    ap.add_argument("--work-dir", default="vectorstore/eval", help="індекси для кожної конфігурації")
+    ap.add_argument("--metric", choices=["recall", "mrr", "ndcg"], default="recall")
+    ap.add_argument("--tolerance", type=float, default=0.02, help="допустима втрата метрики відносно найкращої")
+    ap.add_argument("--repeat", type=int, default=1, help="повторів пакетного запиту (для стабільнішої затримки)")
+    ap.add_argument("--out", default="", help="зберегти всі рядки в JSON")
+    args = ap.parse_args()
+
+    golden = load_golden(args.golden)
+    ks = sorted({int(k) for k in args.ks.split(",")})
+    base = PipelineConfig(raw_dir=args.raw_dir)
+    rows = evaluate(base, golden, ks, args.set, args.work_dir, repeat=args.repeat)
+
+    # у таблиці — лише поля, що змінюються між конфігураціями
+    keys = [k for k in rows[0]["config"] if len({str(r["config"][k]) for r in rows}) > 1]
+    fixed = {k: v for k, v in rows[0]["config"].items() if k not in keys}
+    print(f"{len(golden)} запитань" + (f"; спільне: {_label(fixed, list(fixed))}" if fixed else "") + "\n")
+    print(f"{'config':<48} {'k':>3} {'recall':>7} {'mrr':>6} {'ndcg':>6} {'ms/q':>8} {'index_mb':>9}")
+    for r in rows:
+        print(f"{_label(r['config'], keys):<48} {r['k']:>3} {r['recall']:>7.3f} {r['mrr']:>6.3f} {r['ndcg']:>6.3f} "
+              f"{r['ms_per_query']:>8.2f} {r['index_mb']:>9.2f}")
+
+    rec = recommend(rows, args.metric, args.tolerance)
+    print(f"\nНайдешевше з {args.metric} ≥ найкраще − {args.tolerance}: {_label(rec['config'], keys)} top_k={rec['k']} "
+          f"({args.metric}={rec[args.metric]:.3f})")
+    if rec["misses"]:
+        print("Не знайдено повністю:", *rec["misses"][:10], sep="\n  ")
+
+    if args.out:
+        Path(args.out).write_text(json.dumps({"golden": args.golden, "rows": rows, "recommended": rec},
+                                             ensure_ascii=False, indent=2), encoding="utf-8")
+
+if __name__ == "__main__":
+    main()
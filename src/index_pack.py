@@ -0,0 +1,380 @@
+"""
+Експорт/імпорт готового індексу одним файлом — новий вузол не переембедить корпус.
+
+    python -m src.index_pack export vectorstore/kb.ragpack --persist-dir vectorstore --collection kb
+    python -m src.index_pack import vectorstore/kb.ragpack --persist-dir vectorstore --collection kb --bm25
+    python -m src.index_pack info vectorstore/kb.ragpack
+
+Формат (версія FORMAT_VERSION, little-endian):
+    "RAGPACK\\0" | u32 версія | u32 прапорці (0)
+    записи:   на чанк — u32 довжина + id, u32 + текст, u32 + meta (JSON), усе UTF-8
+    (вирівнювання до 64 байт)
+    матриця:  count x dim, float32 або float16, суцільним блоком — читається через np.memmap
+    масиви:   додаткові іменовані блоки (напр. сигнатури MinHash дедупу), кожен вирівняний до 64 байт
+    футер:    JSON {count, dim, dtype, records_offset, matrix_offset, arrays, embed_model, manifest, dedup, ...}
+    u64 довжина футера | sha256 усього, що вище (32 байти) | "RAGPEND\\0"
+Футер у кінці — експорт іде потоком (кількість чанків наперед не потрібна); sha256 — теж потоком.
+Маніфест зберігається з шляхами відносно raw_dir: після імпорту `index(incremental=True)` на тих
+самих файлах нічого не переембедить (mtime інші, але sha1 збігається). Так само — повний стан
+дедупу (ChunkDeduper.state(): хеші, сигнатури, aliases), інакше після імпорту правка файлу,
+на чанках якого трималися дублікати інших файлів, не повернула б ті файли в індекс.
+"""
+from __future__ import annotations
+import argparse
+import hashlib
+import json
+import os
+import struct
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from src.manifest import FileEntry, IndexManifest
+
+FORMAT_VERSION = 1
+MAGIC = b"RAGPACK\0"
+END_MAGIC = b"RAGPEND\0"
+ALIGN = 64
+PACK_DTYPES = ("float32", "float16")
+
+_U32 = struct.Struct("<I")
+_HEAD = struct.Struct("<8sII")
+_TAIL = struct.Struct("<Q32s8s")
+
+class PackWriter:
+    """
+    with PackWriter(path, dim, "float16", embed_model=...) as w: w.add(chunks, embs)
+    Записи пишуться одразу у файл, матриця — у тимчасовий поруч, і в кінці дописується
+    (файл з'являється під остаточним ім'ям лише після успішного close()).
+    """
+
+    def __init__(self, path: str, dtype: str = "float16", **meta: Any):
+        if dtype not in PACK_DTYPES:
+            raise ValueError(f"Unknown pack dtype: {dtype}")
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.dtype = dtype
+        self.meta = meta
+        self.count = 0
+        self.dim = 0
+        self._tmp = self.path.with_name(self.path.name + ".tmp")
+        self._f = open(self._tmp, "wb")
+        self._mat = tempfile.TemporaryFile(dir=self.path.parent)
+        self._arrays: Dict[str, np.ndarray] = {}
+        self._sha = hashlib.sha256()
+        self._pos = 0
+        self._write(_HEAD.pack(MAGIC, FORMAT_VERSION, 0))
+        self.records_offset = self._pos
+
+    def _write(self, data: bytes):
+        self._f.write(data)
+        self._sha.update(data)
+        self._pos += len(data)
+
+    def _pad(self):
+        pad = -self._pos % ALIGN
+        if pad:
+            self._write(b"\0" * pad)
+
+    def add(self, chunks: List[Dict[str, Any]], embeddings):
+        embs = np.asarray(embeddings, dtype=np.float32)
+        if len(chunks) != len(embs):
+            raise ValueError(f"{len(chunks)} chunks vs {len(embs)} embeddings")
+        if not len(chunks):
+            return
+        if self.dim and embs.shape[1] != self.dim:
+            raise ValueError(f"Embedding dim changed: {self.dim} -> {embs.shape[1]}")
+        self.dim = int(embs.shape[1])
+        parts = []
+        for c in chunks:
+            for field in (c["id"], c["text"] or "", json.dumps(c.get("meta") or {}, ensure_ascii=False)):
+                b = field.encode("utf-8")
+                parts.append(_U32.pack(len(b)))
+                parts.append(b)
+        self._write(b"".join(parts))
+        self._mat.write(np.ascontiguousarray(embs.astype(np.dtype(self.dtype).newbyteorder("<"))).tobytes())
+        self.count += len(chunks)
+
+    def add_array(self, name: str, array):
+        """Іменований числовий масив (пишеться після матриці; PackReader.array(name))."""
+        self._arrays[name] = np.ascontiguousarray(array)
+
+    def close(self):
+        self._pad()
+        matrix_offset = self._pos
+        self._mat.seek(0)
+        while True:
+            buf = self._mat.read(1 << 22)
+            if not buf:
+                break
+            self._write(buf)
+        self._mat.close()
+
+        arrays = {}
+        for name, a in self._arrays.items():
+            self._pad()
+            a = a.astype(a.dtype.newbyteorder("<"))
+            arrays[name] = {"offset": self._pos, "dtype": a.dtype.name, "shape": list(a.shape)}
+            self._write(a.tobytes())
+
+        footer = json.dumps({
+            "format": "ragpack",
+            "version": FORMAT_VERSION,
+            "count": self.count,
+            "dim": self.dim,
+            "dtype": self.dtype,
+            "records_offset": self.records_offset,
+            "matrix_offset": matrix_offset,
+            "arrays": arrays,
+            "created": time.time(),
+            **self.meta,
+        }, ensure_ascii=False).encode("utf-8")
+        self._write(footer)
+        self._f.write(_TAIL.pack(len(footer), self._sha.digest(), END_MAGIC))
+        self._f.close()
+        os.replace(self._tmp, self.path)
+
+    def abort(self):
+        self._mat.close()
+        self._f.close()
+        self._tmp.unlink(missing_ok=True)
+
+    def __enter__(self) -> "PackWriter":
+        return self
+
+    def __exit__(self, exc_type, *exc):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+        return False
+
+class PackReader:
+    """
+    Читання .ragpack: header (футер), chunks() — записи, embeddings — np.memmap (без копії в RAM),
+    batches(n) — (чанки, float32 n x dim) для пакетного запису у сховище.
+    verify=True — звірити sha256 (один послідовний прохід файлом).
+    """
+
+    def __init__(self, path: str, verify: bool = True):
+        self.path = Path(path)
+        size = self.path.stat().st_size
+        with open(self.path, "rb") as f:
+            magic, version, _ = _HEAD.unpack(f.read(_HEAD.size))
+            if magic != MAGIC:
+                raise ValueError(f"{path}: not a ragpack file")
+            if version != FORMAT_VERSION:
+                raise ValueError(f"{path}: unsupported ragpack version {version} (expected {FORMAT_VERSION})")
+            f.seek(size - _TAIL.size)
+            footer_len, digest, end = _TAIL.unpack(f.read(_TAIL.size))
+            if end != END_MAGIC:
+                raise ValueError(f"{path}: truncated ragpack file")
+            body_end = size - _TAIL.size
+            f.seek(body_end - footer_len)
+            self.header: Dict[str, Any] = json.loads(f.read(footer_len).decode("utf-8"))
+        self._digest, self._body_end = digest, body_end
+        if verify:
+            self.verify()
+
+        h = self.header
+        self.count, self.dim, self.dtype = int(h["count"]), int(h["dim"]), h["dtype"]
+        if self.dtype not in PACK_DTYPES:
+            raise ValueError(f"{path}: unknown matrix dtype {self.dtype}")
+        self.embeddings = np.memmap(self.path, dtype=np.dtype(self.dtype).newbyteorder("<"), mode="r",
+                                    offset=h["matrix_offset"], shape=(self.count, self.dim)) \
+            if self.count else np.zeros((0, self.dim), dtype=np.float32)
+
+    def verify(self):
+        sha = hashlib.sha256()
+        with open(self.path, "rb") as f:
+            left = self._body_end
+            while left > 0:
+                buf = f.read(min(1 << 22, left))
+                if not buf:
+                    break
+                sha.update(buf)
+                left -= len(buf)
+        if sha.digest() != self._digest:
+            raise ValueError(f"{self.path}: checksum mismatch (file corrupted or incomplete)")
+
+    def array(self, name: str) -> Optional[np.ndarray]:
+        spec = (self.header.get("arrays") or {}).get(name)
+        if spec is None:
+            return None
+        dtype = np.dtype(spec["dtype"]).newbyteorder("<")
+        count = int(np.prod(spec["shape"]))
+        a = np.fromfile(self.path, dtype=dtype, count=count, offset=spec["offset"])
+        return a.reshape(spec["shape"])
+
+    def chunks(self) -> Iterator[Dict[str, Any]]:
+        h = self.header
+        with open(self.path, "rb") as f:
+            f.seek(h["records_offset"])
+            data = f.read(h["matrix_offset"] - h["records_offset"])
+        pos = 0
+        for _ in range(self.count):
+            fields = []
+            for _ in range(3):
+                (n,) = _U32.unpack_from(data, pos)
+                pos += _U32.size
+                fields.append(data[pos:pos + n].decode("utf-8"))
+                pos += n
+            yield {"id": fields[0], "text": fields[1], "meta": json.loads(fields[2])}
+
+    def batches(self, size: int = 4096) -> Iterator[Tuple[List[Dict[str, Any]], np.ndarray]]:
+        it = self.chunks()
+        for a in range(0, self.count, size):
+            b = min(self.count, a + size)
+            yield [next(it) for _ in range(b - a)], np.asarray(self.embeddings[a:b], dtype=np.float32)
+
+# ---------- сховище <-> файл ----------
+def _relative(key: str, raw_dir: str) -> str:
+    return Path(os.path.relpath(key, raw_dir)).as_posix()
+
+def _relative_manifest(manifest: IndexManifest, raw_dir: str) -> Dict[str, Any]:
+    out = {}
+    for key, e in manifest.files.items():
+        out[_relative(key, raw_dir)] = {"size": e.size, "mtime": e.mtime, "sha1": e.sha1, "chunk_ids": e.chunk_ids}
+    return out
+
+def _rekey_dedup(side: Dict[str, Any], fn) -> Dict[str, Any]:
+    """Ключі файлів у стані ChunkDeduper (власники й aliases) -> fn(ключ)."""
+    return dict(
+        side,
+        owners=[fn(k) for k in side["owners"]],
+        aliases={cid: [fn(k) for k in keys] for cid, keys in side["aliases"].items()},
+    )
+
+def export_store(store, path: str, dtype: str = "float16", embed_model: str = "",
+                 manifest: Optional[IndexManifest] = None, raw_dir: str = "", dedup=None,
+                 batch: int = 4096, **meta: Any) -> Dict[str, Any]:
+    """Усі чанки й ембеддінги store (Chroma/numpy/шарди — будь-що з iter_embedded()) -> один файл."""
+    t0 = time.perf_counter()
+    extra = dict(meta, embed_model=embed_model)
+    if manifest is not None:
+        extra["manifest"] = _relative_manifest(manifest, raw_dir)
+    sigs = None
+    if dedup is not None:
+        side, sigs = dedup.state()
+        extra["dedup"] = _rekey_dedup(side, lambda k: _relative(k, raw_dir))
+    with PackWriter(path, dtype=dtype, **extra) as w:
+        for chunks, embs in store.iter_embedded(batch):
+            w.add(chunks, embs)
+        if sigs is not None:
+            w.add_array("dedup_sigs", sigs)
+    return {"path": str(path), "chunks": w.count, "dim": w.dim, "dtype": dtype,
+            "mb": round(Path(path).stat().st_size / 2**20, 2), "seconds": round(time.perf_counter() - t0, 2)}
+
+def import_store(store, path: str, embed_model: str = "", manifest: Optional[IndexManifest] = None,
+                 raw_dir: str = "", bm25=None, dedup=None, batch: int = 4096, verify: bool = True) -> Dict[str, Any]:
+    """
+    Файл -> store (спершу store.clear()), пакетами по batch; ембеддер не потрібен.
+    embed_model — якщо задано, має збігатися з моделлю, якою ембедився експорт.
+    manifest/bm25/dedup — відновити поруч (маніфест і дедуп — з шляхами під raw_dir; BM25
+    перераховується з текстів — це CPU-секунди, не ембеддінг). Файл без стану дедупу (експорт
+    без нього) — дедуп будується з текстів чанків: дублікатів у такому індексі не відкидали.
+    """
+    t0 = time.perf_counter()
+    pack = PackReader(path, verify=verify)
+    h = pack.header
+    if embed_model and h.get("embed_model") and h["embed_model"] != embed_model:
+        raise ValueError(f"{path}: exported with {h['embed_model']}, this index uses {embed_model}")
+
+    store.clear()
+    all_chunks: List[Dict[str, Any]] = []
+    for chunks, embs in pack.batches(batch):
+        store.upsert(chunks, embs)
+        if bm25 is not None or dedup is not None:
+            all_chunks.extend(chunks)
+    if hasattr(store, "save"):
+        store.save()
+
+    if manifest is not None:
+        manifest.reset()
+        for rel, e in (h.get("manifest") or {}).items():
+            key = str(Path(raw_dir) / rel)
+            manifest.files[key] = FileEntry(path=key, **e)
+        manifest.save()
+    if dedup is not None:
+        dedup.clear()
+        texts = {c["id"]: c["text"] for c in all_chunks}
+        side = h.get("dedup")
+        if side is not None:
+            # aliases (які файли відкинуто як дублікати яких чанків) з текстів не відновити
+            dedup.set_state(_rekey_dedup(side, lambda rel: str(Path(raw_dir) / rel)),
+                            pack.array("dedup_sigs"), texts)
+        elif manifest is not None:
+            for key, e in manifest.files.items():
+                dedup.filter(key, [{"id": i, "text": texts[i]} for i in e.chunk_ids if i in texts])
+        dedup.save()
+    if bm25 is not None:
+        bm25.build(sorted(all_chunks, key=lambda c: c["id"]))
+        bm25.save()
+    return {"path": str(path), "chunks": pack.count, "dim": pack.dim, "dtype": pack.dtype,
+            "embed_model": h.get("embed_model", ""), "seconds": round(time.perf_counter() - t0, 2)}
+
+def main():
+    from src.dedup import ChunkDeduper
+    from src.manifest import manifest_path
+    from src.rag_pipeline import PipelineConfig
+    from src.retriever import BM25Retriever, ChromaRetriever, VectorRetriever
+    from src.sharding import ShardRouter, ShardedRetriever
+
+    ap = argparse.ArgumentParser(description="Експорт/імпорт готового індексу (.ragpack)")
+    ap.add_argument("command", choices=["export", "import", "info"])
+    ap.add_argument("path")
+    ap.add_argument("--persist-dir", default=PipelineConfig.persist_dir)
+    ap.add_argument("--collection", default=PipelineConfig.collection)
+    ap.add_argument("--backend", default=PipelineConfig.vector_backend, choices=["chroma", "numpy"])
+    ap.add_argument("--shard-rules", default="", help="як PipelineConfig.shard_rules / SHARD_RULES сервера")
+    ap.add_argument("--raw-dir", default=PipelineConfig.raw_dir, help="відносно нього зберігаються шляхи маніфесту")
+    ap.add_argument("--embed-model", default="", help="export: записати у файл; import: перевірити збіг")
+    ap.add_argument("--dtype", default="float16", choices=PACK_DTYPES, help="матриця ембеддінгів у файлі")
+    ap.add_argument("--bm25", action="store_true", help="import: перебудувати BM25 (retriever=bm25/hybrid, сервер)")
+    ap.add_argument("--dedup-threshold", type=float, default=PipelineConfig.dedup_threshold,
+                    help="export/import: зберегти/відновити стан дедуплікації; 0 — ні")
+    ap.add_argument("--no-verify", action="store_true", help="import/info: не звіряти sha256")
+    args = ap.parse_args()
+
+    if args.command == "info":
+        pack = PackReader(args.path, verify=not args.no_verify)
+        info = {k: v for k, v in pack.header.items() if k not in ("manifest", "dedup")}
+        info["files"] = len(pack.header.get("manifest") or {})
+        info["dedup_chunks"] = len((pack.header.get("dedup") or {}).get("ids", []))
+        print(json.dumps(info, ensure_ascii=False, indent=2))
+        return
+
+    def make(name: str):
+        if args.backend == "chroma":
+            return ChromaRetriever(args.persist_dir, name)
+        return VectorRetriever(args.persist_dir, name)
+
+    if args.shard_rules:
+        router = ShardRouter(args.shard_rules)
+        store = ShardedRetriever({name: make(name) for name in router.shards}, router)
+    else:
+        store = make(args.collection)
+    manifest = IndexManifest.load(manifest_path(args.persist_dir, args.collection))
+    dedup = None
+    if args.dedup_threshold > 0:
+        dedup = ChunkDeduper(args.persist_dir, args.collection, threshold=args.dedup_threshold)
+
+    if args.command == "export":
+        if not store.count():
+            sys.exit(f"Порожня колекція {args.collection} у {args.persist_dir}")
+        if dedup is not None and not dedup.load():
+            dedup = None  # індекс будувався без дедупу
+        out = export_store(store, args.path, dtype=args.dtype, embed_model=args.embed_model,
+                           manifest=manifest, raw_dir=args.raw_dir, dedup=dedup, collection=args.collection)
+    else:
+        bm25 = BM25Retriever(args.persist_dir, args.collection) if args.bm25 else None
+        out = import_store(store, args.path, embed_model=args.embed_model, manifest=manifest,
+                           raw_dir=args.raw_dir, bm25=bm25, dedup=dedup, verify=not args.no_verify)
+    print(json.dumps(out, ensure_ascii=False))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,175 @@
+from __future__ import annotations
+from dataclasses import dataclass, asdict
+from typing import Any, Callable, Dict, Iterable, List, Optional
+import queue
+import threading
+import time
+
+_STOP = object()
+
+@dataclass
+class IndexProgress:
+    docs_done: int = 0
+    docs_total: int = 0
+    chunks_queued: int = 0
+    chunks_embedded: int = 0
+    chunks_written: int = 0
+    elapsed: float = 0.0
+
+    @property
+    def fraction(self) -> float:
+        if not self.docs_total:
+            return 0.0
+        docs = min(1.0, self.docs_done / self.docs_total)
+        written = (self.chunks_written / self.chunks_queued) if self.chunks_queued else 1.0
+        return docs * written
+
+class StagedIndexer:
+    """
+    Конвеєр індексації: (завантаження+чанкінг) -> ембеддінг -> запис у сховище.
+
+    Кожна стадія працює у своєму потоці, між стадіями — обмежені черги,
+    тож повільна стадія гальмує попередні (backpressure), а загальний час
+    визначається найповільнішою стадією, а не сумою всіх.
+
+    embed_fn(texts) -> embeddings;  write_fn(batch, embeddings) -> None,
+    де batch — список {id, text, meta}.
+
+    embed_window — скільки чанків іде в один виклик embed_fn (0 — batch_size): рушій
+    ембеддінгу сортує їх за довжиною і сам ріже на батчі моделі, тож більше вікно —
+    менше паддінгу. batch_size — лише розмір пакета запису у сховище.
+    """
+
+    def __init__(
+        self,
+        embed_fn: Callable[[List[str]], Any],
+        write_fn: Callable[[List[Dict[str, Any]], Any], None],
+        batch_size: int = 64,
+        queue_size: int = 4,
+        embed_window: int = 0,
+        embed_workers: int = 1,
+        progress: Optional[Callable[[IndexProgress], None]] = None,
+    ):
+        self.embed_fn = embed_fn
+        self.write_fn = write_fn
+        self.batch_size = batch_size
+        self.embed_window = max(batch_size, embed_window)
+        self.queue_size = queue_size
+        self.embed_workers = max(1, embed_workers)
+        self.progress_cb = progress
+
+        self.progress = IndexProgress()
+        self._lock = threading.Lock()
+        self._error: Optional[BaseException] = None
+        self._failed = threading.Event()
+        self._t0 = 0.0
+
+    # ---------- helpers ----------
+    def _report(self, **inc):
+        with self._lock:
+            for k, v in inc.items():
+                setattr(self.progress, k, getattr(self.progress, k) + v)
+            self.progress.elapsed = time.perf_counter() - self._t0
+            snap = IndexProgress(**asdict(self.progress))
+        if self.progress_cb is not None:
+            try:
+                self.progress_cb(snap)
+            except Exception:
+                pass
+
+    def _fail(self, e: BaseException):
+        with self._lock:
+            if self._error is None:
+                self._error = e
+        self._failed.set()
+
+    def _put(self, q: queue.Queue, item) -> bool:
+        # put з перевіркою на аварійну зупинку, щоб не зависнути на повній черзі
+        while not self._failed.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    # ---------- stages ----------
+    def _embed_worker(self, in_q: queue.Queue, out_q: queue.Queue):
+        while True:
+            window = in_q.get()
+            if window is _STOP:
+                break
+            if self._failed.is_set():
+                continue
+            try:
+                embs = self.embed_fn([c["text"] for c in window])
+            except BaseException as e:
+                self._fail(e)
+                continue
+            self._report(chunks_embedded=len(window))
+            for i in range(0, len(window), self.batch_size):
+                if not self._put(out_q, (window[i:i + self.batch_size], embs[i:i + self.batch_size])):
+                    break
+
+    def _write_worker(self, in_q: queue.Queue):
+        while True:
+            item = in_q.get()
+            if item is _STOP:
+                break
+            if self._failed.is_set():
+                continue
+            batch, embs = item
+            try:
+                self.write_fn(batch, embs)
+            except BaseException as e:
+                self._fail(e)
+                continue
+            self._report(chunks_written=len(batch))
+
+    def run(self, docs: Iterable[List[Dict[str, Any]]], docs_total: int = 0) -> IndexProgress:
+        """
+        docs — потік чанків, згрупованих по документах (кожен елемент — чанки одного документа).
+        Генератор docs виконується у потоці виклику, тож завантаження і чанкінг
+        накладаються на ембеддінг і запис.
+        """
+        self._t0 = time.perf_counter()
+        self.progress = IndexProgress(docs_total=docs_total)
+
+        embed_q: queue.Queue = queue.Queue(maxsize=self.queue_size)
+        write_q: queue.Queue = queue.Queue(maxsize=self.queue_size)
+        embedders = [
+            threading.Thread(target=self._embed_worker, args=(embed_q, write_q), daemon=True, name=f"embed-{i}")
+            for i in range(self.embed_workers)
+        ]
+        writer = threading.Thread(target=self._write_worker, args=(write_q,), daemon=True, name="write")
+        for t in embedders + [writer]:
+            t.start()
+
+        try:
+            buf: List[Dict[str, Any]] = []
+            for chunks in docs:
+                if self._failed.is_set():
+                    break
+                buf.extend(chunks)
+                while len(buf) >= self.embed_window:
+                    window, buf = buf[:self.embed_window], buf[self.embed_window:]
+                    self._report(chunks_queued=len(window))
+                    if not self._put(embed_q, window):
+                        break
+                self._report(docs_done=1)
+            if buf and not self._failed.is_set():
+                self._report(chunks_queued=len(buf))
+                self._put(embed_q, buf)
+        except BaseException as e:
+            self._fail(e)
+        finally:
+            for _ in embedders:
+                embed_q.put(_STOP)
+            for t in embedders:
+                t.join()
+            write_q.put(_STOP)
+            writer.join()
+
+        if self._error is not None:
+            raise self._error
+        return self.progress
@@ -1,16 +1,47 @@
 from __future__ import annotations
 from dataclasses import dataclass
-from typing import Optional, List, Dict, Any
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import AsyncIterator, Callable, Iterator, Optional, List, Dict, Any, Tuple, TypeVar
+import asyncio
+import dataclasses
 import os
 import json
+import threading
+import time
 import requests
 
+from src.resilience import RETRY_STATUSES, CircuitBreaker, LatencyWindow, RetryableError, backoff_delay, parse_retry_after
+
+T = TypeVar("T")
+
 @dataclass
 class LLMConfig:
     provider: str = "openai"   # "openai" або "ollama"
     model: str = "gpt-4o-mini" # або "llama3.1"
     api_key: str = ""          # для openai
     base_url: str = ""         # для ollama (http://localhost:11434)
+    timeout: float = 0.0       # с; 0 — типові (OpenAI 60, Ollama 120)
+    max_connections: int = 32  # розмір пулу keep-alive з'єднань
+    openai_base_url: str = ""  # "" — OPENAI_BASE_URL або https://api.openai.com/v1 (напр. локальний стаб)
+    fallbacks: str = ""        # резервні провайдери по черзі: "ollama:llama3.1" (провайдер:модель, через кому)
+    retries: int = 2           # повторів на провайдера при 429/5xx/таймауті/обриві
+    backoff: float = 0.5       # с; експоненційно з jitter, не менше за Retry-After
+    backoff_max: float = 8.0   # довший Retry-After — одразу до резервного провайдера
+    deadline: float = 0.0      # с на весь виклик разом із повторами й резервами; 0 — без ліміту
+    hedge_quantile: float = 0.0  # > 0 (напр. 0.95) — дублюючий запит, якщо перший довший за цей квантиль
+    hedge_min_samples: int = 20  # ... але лише коли є стільки замірів провайдера
+    breaker_failures: int = 5  # невдач поспіль, після яких провайдер пропускається ...
+    breaker_reset: float = 30.0  # ... на стільки секунд (потім — одна проба)
+
+class UnknownProviderError(ValueError):
+    """Помилка конфігурації (невідомий провайдер) — не причина переходити до резервного."""
+
+OPENAI_URL = "https://api.openai.com/v1/responses"
+OPENAI_TIMEOUT = 60
+OLLAMA_TIMEOUT = 120
+
+# змінювати при будь-якій правці SYSTEM_PROMPT / формату контексту (ключ кешу відповідей)
+PROMPT_VERSION = "1"
 
 SYSTEM_PROMPT = """Ти — BioConsult, навчальний консультант з біології.
 Мова: українська. Стиль: чітко, структуровано, без зайвої води.
@@ -36,25 +67,415 @@ def _format_context(contexts: List[Dict[str, Any]]) -> str:
         blocks.append(f"[#{i} {src}] {txt}")
     return "\n\n".join(blocks)
 
+def _parse_sse_line(line: str) -> Optional[Dict[str, Any]]:
+    """Один рядок Server-Sent Events -> JSON з `data: ...` (None — пропустити)."""
+    if not line or not line.startswith("data:"):
+        return None
+    data = line[5:].strip()
+    if data == "[DONE]":
+        return {"type": "[DONE]"}
+    try:
+        return json.loads(data)
+    except ValueError:
+        return None
+
+def _openai_delta(ev: Dict[str, Any]) -> str:
+    t = ev.get("type")
+    if t == "response.output_text.delta":
+        return ev.get("delta") or ""
+    if t in ("response.failed", "error"):
+        raise RuntimeError(json.dumps(ev, ensure_ascii=False))
+    return ""
+
+def _openai_text(data: Dict[str, Any]) -> str:
+    # частий випадок: output_text
+    if isinstance(data.get("output_text"), str) and data["output_text"]:
+        return data["output_text"]
+
+    # fallback: витяг з output[]
+    out = data.get("output", [])
+    for item in out:
+        for c in item.get("content", []):
+            if c.get("type") in ("output_text", "text") and isinstance(c.get("text"), str):
+                return c["text"]
+
+    return ""
+
+def _check(status: int, text: str, headers) -> None:
+    """HTTP-відповідь з помилкою -> RetryableError (тимчасова) або RuntimeError."""
+    if status < 400:
+        return
+    if status in RETRY_STATUSES:
+        raise RetryableError(text or f"HTTP {status}", status=status,
+                             retry_after=parse_retry_after(headers.get("Retry-After")))
+    raise RuntimeError(text or f"HTTP {status}")
+
+def _ollama_part(line: str) -> tuple[str, bool]:
+    """Рядок NDJSON від Ollama (/api/generate або /api/chat) -> (шматок тексту, done)."""
+    part = json.loads(line)
+    if part.get("error"):
+        raise RuntimeError(part["error"])
+    text = part.get("response") or (part.get("message") or {}).get("content") or ""
+    return text, bool(part.get("done"))
+
+_session_lock = threading.Lock()
+_sessions: Dict[int, requests.Session] = {}
+
+def _session(pool_size: int) -> requests.Session:
+    """Спільна requests.Session з keep-alive пулом (без нового TLS-рукостискання на кожен запит)."""
+    with _session_lock:
+        s = _sessions.get(pool_size)
+        if s is None:
+            s = requests.Session()
+            adapter = requests.adapters.HTTPAdapter(pool_connections=4, pool_maxsize=pool_size)
+            s.mount("http://", adapter)
+            s.mount("https://", adapter)
+            _sessions[pool_size] = s
+        return s
+
+_hedge_lock = threading.Lock()
+_hedge_pool: Optional[ThreadPoolExecutor] = None
+
+def _pool() -> ThreadPoolExecutor:
+    # спроби з hedging виконуються тут: той, хто програв, добігає у фоні (до свого таймауту)
+    global _hedge_pool
+    with _hedge_lock:
+        if _hedge_pool is None:
+            _hedge_pool = ThreadPoolExecutor(max_workers=32, thread_name_prefix="llm")
+        return _hedge_pool
+
+class _Route:
+    """Один провайдер ланцюжка: конфіг + запобіжник + заміри затримки."""
+
+    def __init__(self, cfg: LLMConfig):
+        self.cfg = cfg
+        self.name = f"{cfg.provider}:{cfg.model}"
+        self.breaker = CircuitBreaker(cfg.breaker_failures, cfg.breaker_reset)
+        self.latency = LatencyWindow()
+        self.calls = 0
+        self.failures = 0
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "state": self.breaker.state,
+            "calls": self.calls,
+            "failures": self.failures,
+            "trips": self.breaker.trips,
+            "p95_ms": round(self.latency.quantile(0.95) * 1000.0, 1),
+        }
+
+def _routes(cfg: LLMConfig) -> List[_Route]:
+    routes = [_Route(cfg)]
+    for spec in cfg.fallbacks.split(","):
+        spec = spec.strip()
+        if not spec:
+            continue
+        provider, _, model = spec.partition(":")
+        if not model:
+            raise ValueError(f"Bad fallback provider: {spec!r} (expected 'provider:model')")
+        routes.append(_Route(dataclasses.replace(cfg, provider=provider.strip(), model=model.strip(), fallbacks="")))
+    return routes
+
 class LLM:
+    """
+    Генерація через ланцюжок провайдерів: cfg.provider, потім cfg.fallbacks по черзі.
+    Тимчасові помилки (429/5xx/таймаут/обрив) повторюються з backoff + jitter (з урахуванням
+    Retry-After); провайдер, що падає поспіль, вимикається запобіжником на breaker_reset с;
+    cfg.deadline обмежує весь виклик; з hedge_quantile довгий запит дублюється (generate()).
+    agenerate()/astream() — те саме без потоків, через пул keep-alive з'єднань httpx.AsyncClient.
+    У стрімінгу повтор/перемикання можливі лише до першого шматка відповіді.
+    """
+
     def __init__(self, cfg: LLMConfig):
         self.cfg = cfg
+        self._aclient = None
+        self.routes = _routes(cfg)
+        self.retries = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+        self.fallbacks = 0
+
+    def _timeout(self, default: float, cfg: Optional[LLMConfig] = None) -> float:
+        return (cfg or self.cfg).timeout or default
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "retries": self.retries,
+            "hedges": self.hedges,
+            "hedge_wins": self.hedge_wins,
+            "fallbacks": self.fallbacks,
+            "providers": {r.name: r.stats() for r in self.routes},
+        }
 
+    @property
+    def http(self) -> requests.Session:
+        return _session(self.cfg.max_connections)
+
+    def _async_client(self):
+        # httpx.AsyncClient тримає пул keep-alive з'єднань; створюється ліниво в event loop
+        if self._aclient is None:
+            import httpx
+            limits = httpx.Limits(
+                max_connections=self.cfg.max_connections,
+                max_keepalive_connections=self.cfg.max_connections,
+            )
+            self._aclient = httpx.AsyncClient(limits=limits, timeout=self._timeout(OLLAMA_TIMEOUT))
+        return self._aclient
+
+    async def aclose(self):
+        if self._aclient is not None:
+            await self._aclient.aclose()
+            self._aclient = None
+
+    # ---------- стійкість ----------
+    def _t_end(self) -> Optional[float]:
+        return time.monotonic() + self.cfg.deadline if self.cfg.deadline > 0 else None
+
+    def _attempt_timeout(self, route: _Route, t_end: Optional[float]) -> float:
+        timeout = self._timeout(OPENAI_TIMEOUT if route.cfg.provider == "openai" else OLLAMA_TIMEOUT, route.cfg)
+        if t_end is not None:
+            timeout = max(0.001, min(timeout, t_end - time.monotonic()))
+        return timeout
+
+    def _on_error(self, route: _Route, e: Exception, attempt: int, t_end: Optional[float],
+                  errors: List[str]) -> Optional[float]:
+        """Облік невдалої спроби: пауза перед повтором на тому ж провайдері або None — до наступного."""
+        if isinstance(e, UnknownProviderError):
+            raise e
+        route.failures += 1
+        errors.append(f"{route.name}: {str(e)[:200]}")
+        if isinstance(e, (requests.ConnectionError, requests.Timeout, requests.exceptions.ChunkedEncodingError)):
+            e = RetryableError(str(e))
+        if not isinstance(e, RetryableError):
+            # ключ/модель/формат запиту або непридатна відповідь (напр. HTML замість JSON) —
+            # повтор не допоможе (резервний провайдер — може); сам провайдер відповів,
+            # тож запобіжник не чіпаємо
+            route.breaker.success()
+            return None
+        route.breaker.failure()
+        if attempt >= self.cfg.retries or route.breaker.state == "open":
+            return None
+        if e.retry_after is not None and e.retry_after > self.cfg.backoff_max and route is not self.routes[-1]:
+            return None  # довгий ліміт — не чекаємо, є кому відповісти
+        delay = backoff_delay(attempt, self.cfg.backoff, self.cfg.backoff_max, e.retry_after)
+        if t_end is not None and time.monotonic() + delay >= t_end:
+            return None
+        self.retries += 1
+        return delay
+
+    def _on_success(self, route: _Route, t0: float):
+        route.latency.add(time.monotonic() - t0)
+        route.breaker.success()
+
+    def _failed(self, errors: List[str], t_end: Optional[float]) -> RuntimeError:
+        if t_end is not None and time.monotonic() >= t_end:
+            return RuntimeError(f"LLM deadline {self.cfg.deadline}s exceeded: " + "; ".join(errors))
+        return RuntimeError("All LLM providers failed: " + "; ".join(errors))
+
+    def _failover(self, call: Callable[[_Route, float], T]) -> T:
+        """call(route, timeout) по ланцюжку провайдерів з повторами — перший успішний результат."""
+        t_end = self._t_end()
+        errors: List[str] = []
+        for n, route in enumerate(self.routes):
+            if t_end is not None and time.monotonic() >= t_end:
+                break
+            if not route.breaker.allow():
+                errors.append(f"{route.name}: circuit open")
+                continue
+            if n:
+                self.fallbacks += 1
+            attempt = 0
+            while t_end is None or time.monotonic() < t_end:
+                route.calls += 1
+                t0 = time.monotonic()
+                try:
+                    out = call(route, self._attempt_timeout(route, t_end))
+                except Exception as e:
+                    delay = self._on_error(route, e, attempt, t_end, errors)
+                    if delay is None:
+                        break
+                    attempt += 1
+                    time.sleep(delay)
+                    continue
+                self._on_success(route, t0)
+                return out
+        raise self._failed(errors, t_end)
+
+    def _hedged(self, route: _Route, fn: Callable[[float], T], timeout: float) -> T:
+        """
+        fn(timeout); якщо відповіді немає довше за hedge_quantile-квантиль затримок провайдера —
+        паралельно ще один такий самий запит, береться перший успішний (хвости затримки — рідкісні,
+        тож другий запит зазвичай швидший).
+        """
+        cfg = self.cfg
+        if cfg.hedge_quantile <= 0 or len(route.latency) < cfg.hedge_min_samples:
+            return fn(timeout)
+        t0 = time.monotonic()
+        first = _pool().submit(fn, timeout)
+        done, _ = wait([first], timeout=min(route.latency.quantile(cfg.hedge_quantile), timeout))
+        if done:
+            return first.result()
+
+        self.hedges += 1
+        second = _pool().submit(fn, max(0.001, timeout - (time.monotonic() - t0)))
+        pending, err = {first, second}, None
+        while pending:
+            done, pending = wait(pending, timeout=max(0.0, t0 + timeout - time.monotonic()),
+                                 return_when=FIRST_COMPLETED)
+            if not done:
+                raise RetryableError(f"LLM timeout after {timeout:.1f}s (hedged)")
+            for f in done:
+                if f.exception() is None:
+                    if f is second:
+                        self.hedge_wins += 1
+                    return f.result()
+                err = f.exception()
+        raise err
+
+    # ---------- генерація ----------
     def generate(self, user_text: str, contexts: List[Dict[str, Any]]) -> str:
         ctx = _format_context(contexts)
+        return self._failover(lambda route, timeout: self._hedged(
+            route, lambda t: self._generate_once(route.cfg, user_text, ctx, t), timeout
+        ))
 
-        if self.cfg.provider == "openai":
-            return self._openai(user_text, ctx)
-        if self.cfg.provider == "ollama":
-            return self._ollama(user_text, ctx)
+    def _generate_once(self, cfg: LLMConfig, user_text: str, ctx: str, timeout: float) -> str:
+        if cfg.provider == "openai":
+            return self._openai(cfg, user_text, ctx, timeout)
+        if cfg.provider == "ollama":
+            return self._ollama(cfg, user_text, ctx, timeout)
 
-        raise ValueError(f"Unknown provider: {self.cfg.provider}")
+        raise UnknownProviderError(f"Unknown provider: {cfg.provider}")
 
-    def _openai(self, user_text: str, ctx: str) -> str:
-        # OpenAI Responses API (сучасна)
-        import requests
+    def stream(self, user_text: str, contexts: List[Dict[str, Any]]) -> Iterator[str]:
+        """Як generate(), але віддає відповідь шматками (токенами) в міру генерації."""
+        ctx = _format_context(contexts)
+
+        def open_stream(route: _Route, timeout: float) -> Tuple[str, Iterator[str]]:
+            cfg = route.cfg
+            if cfg.provider == "openai":
+                it = self._openai_stream(cfg, user_text, ctx, timeout)
+            elif cfg.provider == "ollama":
+                it = self._ollama_stream(cfg, user_text, ctx, timeout)
+            else:
+                raise UnknownProviderError(f"Unknown provider: {cfg.provider}")
+            # перший шматок — у межах спроби: помилка до нього ще дозволяє повтор/резерв
+            for piece in it:
+                return piece, it
+            return "", iter(())
 
-        api_key = self.cfg.api_key or os.getenv("OPENAI_API_KEY", "")
+        first, rest = self._failover(open_stream)
+        if first:
+            yield first
+        yield from rest
+
+    async def agenerate(self, user_text: str = "", contexts: Optional[List[Dict[str, Any]]] = None,
+                        messages: Optional[List[Dict[str, str]]] = None) -> str:
+        """Асинхронний generate() через спільний httpx.AsyncClient (messages — як в astream())."""
+        parts = [p async for p in self.astream(user_text, contexts, messages)]
+        return "".join(parts).strip()
+
+    async def astream(self, user_text: str = "", contexts: Optional[List[Dict[str, Any]]] = None,
+                      messages: Optional[List[Dict[str, str]]] = None) -> AsyncIterator[str]:
+        """
+        Асинхронний stream() з тими самими повторами/резервом/запобіжником/deadline (без hedging).
+        messages — готовий діалог [{role, content}] (напр. з історією сесії) замість
+        SYSTEM_PROMPT + user_text + contexts. Скасування задачі (клієнт відключився) закриває з'єднання.
+        """
+        ctx = _format_context(contexts or [])
+        t_end = self._t_end()
+        errors: List[str] = []
+        for n, route in enumerate(self.routes):
+            if t_end is not None and time.monotonic() >= t_end:
+                break
+            if not route.breaker.allow():
+                errors.append(f"{route.name}: circuit open")
+                continue
+            if n:
+                self.fallbacks += 1
+            attempt = 0
+            while t_end is None or time.monotonic() < t_end:
+                route.calls += 1
+                t0 = time.monotonic()
+                it = self._astream_once(route.cfg, user_text, ctx, messages, self._attempt_timeout(route, t_end))
+                try:
+                    first = await it.__anext__()
+                except StopAsyncIteration:
+                    self._on_success(route, t0)
+                    return
+                except asyncio.CancelledError:
+                    await it.aclose()
+                    route.breaker.release()  # проба half_open не відбулась — не блокуємо наступну
+                    raise
+                except Exception as e:
+                    await it.aclose()
+                    delay = self._on_error(route, e, attempt, t_end, errors)
+                    if delay is None:
+                        break
+                    attempt += 1
+                    await asyncio.sleep(delay)
+                    continue
+                self._on_success(route, t0)
+                try:
+                    yield first
+                    async for piece in it:
+                        yield piece
+                finally:
+                    await it.aclose()
+                return
+        raise self._failed(errors, t_end)
+
+    async def _astream_once(self, cfg: LLMConfig, user_text: str, ctx: str,
+                            messages: Optional[List[Dict[str, str]]], timeout: float) -> AsyncIterator[str]:
+        import httpx
+
+        if cfg.provider == "openai":
+            url, headers, payload = self._openai_request(cfg, user_text, ctx)
+            if messages is not None:
+                payload["input"] = [{"role": m["role"], "content": m["content"]} for m in messages]
+            payload["stream"] = True
+            req = dict(url=url, headers=headers, json=payload, timeout=timeout)
+        elif cfg.provider == "ollama":
+            url, payload = self._ollama_request(cfg, user_text, ctx)
+            if messages is not None:
+                # /api/chat зберігає ролі (історію сесії), /api/generate — лише один prompt
+                url = url.rsplit("/api/", 1)[0] + "/api/chat"
+                payload = {"model": cfg.model, "messages": messages}
+            payload["stream"] = True
+            req = dict(url=url, json=payload, timeout=timeout)
+        else:
+            raise UnknownProviderError(f"Unknown provider: {cfg.provider}")
+
+        try:
+            async with self._async_client().stream("POST", **req) as r:
+                if r.status_code >= 400:
+                    _check(r.status_code, (await r.aread()).decode("utf-8", errors="ignore"), r.headers)
+                ctype = r.headers.get("Content-Type", "")
+                if cfg.provider == "openai" and "text/event-stream" not in ctype:
+                    body = (await r.aread()).decode("utf-8", errors="ignore")
+                    raise RuntimeError(f"Unexpected stream response ({ctype or 'no content-type'}): {body[:200]}")
+                async for line in r.aiter_lines():
+                    if cfg.provider == "openai":
+                        ev = _parse_sse_line(line)
+                        if ev is None:
+                            continue
+                        if ev.get("type") == "[DONE]":
+                            break
+                        piece = _openai_delta(ev)
+                        if piece:
+                            yield piece
+                    elif line:
+                        piece, done = _ollama_part(line)
+                        if piece:
+                            yield piece
+                        if done:
+                            break
+        except httpx.TransportError as e:
+            raise RetryableError(f"{type(e).__name__}: {e}") from e
+
+    # ---------- OpenAI ----------
+    def _openai_request(self, cfg: LLMConfig, user_text: str, ctx: str) -> tuple[str, Dict[str, str], Dict[str, Any]]:
+        api_key = cfg.api_key or os.getenv("OPENAI_API_KEY", "")
         if not api_key:
             raise RuntimeError("OPENAI_API_KEY is missing")
 
@@ -63,48 +484,76 @@ class LLM:
             content += "\n\nКонтекст (RAG):\n" + ctx
 
         payload = {
-            "model": self.cfg.model,
+            "model": cfg.model,
             "input": [
                 {"role": "system", "content": [{"type": "text", "text": SYSTEM_PROMPT}]},
                 {"role": "user", "content": [{"type": "text", "text": content}]}
             ]
         }
+        headers = {"Authorization": f"Bearer {api_key}", "Content-Type": "application/json"}
+        base = cfg.openai_base_url or os.getenv("OPENAI_BASE_URL", "")
+        url = f"{base.rstrip('/')}/responses" if base else OPENAI_URL
+        return url, headers, payload
 
-        r = requests.post(
-            "https://api.openai.com/v1/responses",
-            headers={"Authorization": f"Bearer {api_key}", "Content-Type": "application/json"},
-            json=payload,
-            timeout=60
-        )
-        if not r.ok:
-            raise RuntimeError(r.text)
-
-        data = r.json()
-        # частий випадок: output_text
-        if isinstance(data.get("output_text"), str) and data["output_text"]:
-            return data["output_text"]
-
-        # fallback: витяг з output[]
-        out = data.get("output", [])
-        for item in out:
-            for c in item.get("content", []):
-                if c.get("type") in ("output_text", "text") and isinstance(c.get("text"), str):
-                    return c["text"]
+    def _openai(self, cfg: LLMConfig, user_text: str, ctx: str, timeout: float) -> str:
+        # OpenAI Responses API (сучасна)
+        url, headers, payload = self._openai_request(cfg, user_text, ctx)
 
-        return ""
+        r = self.http.post(url, headers=headers, json=payload, timeout=timeout)
+        _check(r.status_code, r.text, r.headers)
+        return _openai_text(r.json())
+
+    def _openai_stream(self, cfg: LLMConfig, user_text: str, ctx: str, timeout: float) -> Iterator[str]:
+        url, headers, payload = self._openai_request(cfg, user_text, ctx)
+        payload["stream"] = True
+
+        with self.http.post(url, headers=headers, json=payload, timeout=timeout, stream=True) as r:
+            _check(r.status_code, "" if r.ok else r.text, r.headers)
+            ctype = r.headers.get("Content-Type", "")
+            if "text/event-stream" not in ctype:
+                # напр. HTML від проксі з кодом 200 — інакше це виглядало б як порожня відповідь
+                raise RuntimeError(f"Unexpected stream response ({ctype or 'no content-type'}): {r.text[:200]}")
+            r.encoding = "utf-8"  # SSE — завжди UTF-8, навіть без charset у Content-Type
+            for line in r.iter_lines(decode_unicode=True):
+                ev = _parse_sse_line(line)
+                if ev is None:
+                    continue
+                if ev.get("type") == "[DONE]":
+                    break
+                piece = _openai_delta(ev)
+                if piece:
+                    yield piece
 
-    def _ollama(self, user_text: str, ctx: str) -> str:
-        base = self.cfg.base_url or os.getenv("OLLAMA_BASE_URL", "http://localhost:11434")
+    # ---------- Ollama ----------
+    def _ollama_request(self, cfg: LLMConfig, user_text: str, ctx: str) -> tuple[str, Dict[str, Any]]:
+        base = cfg.base_url or os.getenv("OLLAMA_BASE_URL", "http://localhost:11434")
         prompt = SYSTEM_PROMPT + "\n\n"
         if ctx:
             prompt += "Контекст (RAG):\n" + ctx + "\n\n"
         prompt += "Запит користувача:\n" + user_text
 
         # Ollama generate API
-        url = f"{base}/api/generate"
-        payload = {"model": self.cfg.model, "prompt": prompt, "stream": False}
+        return f"{base}/api/generate", {"model": cfg.model, "prompt": prompt, "stream": False}
 
-        r = requests.post(url, json=payload, timeout=120)
-        if not r.ok:
-            raise RuntimeError(r.text)
+    def _ollama(self, cfg: LLMConfig, user_text: str, ctx: str, timeout: float) -> str:
+        url, payload = self._ollama_request(cfg, user_text, ctx)
+
+        r = self.http.post(url, json=payload, timeout=timeout)
+        _check(r.status_code, r.text, r.headers)
         return (r.json().get("response") or "").strip()
+
+    def _ollama_stream(self, cfg: LLMConfig, user_text: str, ctx: str, timeout: float) -> Iterator[str]:
+        url, payload = self._ollama_request(cfg, user_text, ctx)
+        payload["stream"] = True
+
+        # stream=True в Ollama — NDJSON: по одному JSON-об'єкту на рядок
+        with self.http.post(url, json=payload, timeout=timeout, stream=True) as r:
+            _check(r.status_code, "" if r.ok else r.text, r.headers)
+            for line in r.iter_lines(decode_unicode=True):
+                if not line:
+                    continue
+                piece, done = _ollama_part(line)
+                if piece:
+                    yield piece
+                if done:
+                    break
@@ -0,0 +1,151 @@
+"""
+Локальний стаб LLM-провайдерів для перевірки стійкості src.llm (повтори, резерв, hedging, запобіжник).
+
+    python -m src.llm_stub --port 8081 --error-rate 0.2 --rate-limit-rate 0.1 --slow-rate 0.05 --slow-ms 5000
+
+Відповідає як OpenAI Responses API (POST /v1/responses, зі stream і без) та Ollama (POST /api/generate, /api/chat):
+  LLMConfig(openai_base_url="http://127.0.0.1:8081/v1", base_url="http://127.0.0.1:8081",
+            fallbacks="ollama:stub", retries=2, deadline=10, hedge_quantile=0.95)
+Частка запитів (незалежно): --error-rate -> 503, --rate-limit-rate -> 429 з Retry-After,
+--slow-rate -> затримка --slow-ms замість --latency-ms. GET /stats — лічильники.
+"""
+from __future__ import annotations
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict
+
+ANSWER = "Відповідь стабу: мітоз — поділ клітини з утворенням двох ідентичних дочірніх клітин."
+
+class StubState:
+    def __init__(self, latency_ms: float = 50.0, error_rate: float = 0.0, rate_limit_rate: float = 0.0,
+                 retry_after: float = 1.0, slow_rate: float = 0.0, slow_ms: float = 5000.0, seed: int = 0):
+        self.latency = latency_ms / 1000.0
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.retry_after = retry_after
+        self.slow_rate = slow_rate
+        self.slow = slow_ms / 1000.0
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.counts: Dict[str, int] = {"requests": 0, "ok": 0, "503": 0, "429": 0, "slow": 0}
+
+    def draw(self) -> str:
+        with self.lock:
+            self.counts["requests"] += 1
+            r = self.rng.random()
+            if r < self.error_rate:
+                outcome = "503"
+            elif r < self.error_rate + self.rate_limit_rate:
+                outcome = "429"
+            elif self.rng.random() < self.slow_rate:
+                outcome = "slow"
+            else:
+                outcome = "ok"
+            self.counts[outcome] += 1
+            return outcome
+
+def make_handler(state: StubState):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def _send(self, status: int, body: Dict[str, Any], headers: Dict[str, str] = None):
+            data = json.dumps(body, ensure_ascii=False).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json; charset=utf-8")
+            self.send_header("Content-Length", str(len(data)))
+            for k, v in (headers or {}).items():
+                self.send_header(k, v)
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):
+            if self.path == "/stats":
+                return self._send(200, state.counts)
+            self._send(404, {"error": "not found"})
+
+        def do_POST(self):
+            body = json.loads(self.rfile.read(int(self.headers.get("Content-Length") or 0)) or b"{}")
+            if self.path not in ("/v1/responses", "/responses", "/api/generate", "/api/chat"):
+                return self._send(404, {"error": "not found"})
+
+            outcome = state.draw()
+            if outcome == "503":
+                return self._send(503, {"error": {"message": "stub: overloaded"}})
+            if outcome == "429":
+                return self._send(429, {"error": {"message": "stub: rate limited"}},
+                                  {"Retry-After": f"{state.retry_after:g}"})
+            time.sleep(state.slow if outcome == "slow" else state.latency)
+
+            ollama = self.path.startswith("/api/")
+            chat = self.path == "/api/chat"
+            if not body.get("stream"):
+                if chat:
+                    return self._send(200, {"model": body.get("model"), "done": True,
+                                            "message": {"role": "assistant", "content": ANSWER}})
+                if ollama:
+                    return self._send(200, {"model": body.get("model"), "response": ANSWER, "done": True})
+                return self._send(200, {"output_text": ANSWER})
+
+            # стрім: Ollama — NDJSON, OpenAI — SSE
+            self.send_response(200)
+            self.send_header("Content-Type", "application/x-ndjson; charset=utf-8" if ollama
+                             else "text/event-stream; charset=utf-8")
+            self.send_header("Connection", "close")
+            self.end_headers()
+            for word in ANSWER.split(" "):
+                piece = word + " "
+                if chat:
+                    line = json.dumps({"message": {"role": "assistant", "content": piece}, "done": False},
+                                      ensure_ascii=False) + "\n"
+                elif ollama:
+                    line = json.dumps({"response": piece, "done": False}, ensure_ascii=False) + "\n"
+                else:
+                    ev = {"type": "response.output_text.delta", "delta": piece}
+                    line = f"data: {json.dumps(ev, ensure_ascii=False)}\n\n"
+                self.wfile.write(line.encode("utf-8"))
+                self.wfile.flush()
+            self.wfile.write((json.dumps({"response": "", "done": True}) + "\n").encode() if ollama
+                             else b"data: [DONE]\n\n")
+            self.close_connection = True
+
+        def log_message(self, *args):
+            pass
+
+    return Handler
+
+def serve(state: StubState, host: str = "127.0.0.1", port: int = 0) -> ThreadingHTTPServer:
+    """Стаб у фоновому потоці; порт — server.server_port (port=0 — вільний)."""
+    server = ThreadingHTTPServer((host, port), make_handler(state))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def main():
+    ap = argparse.ArgumentParser(description="Стаб OpenAI Responses / Ollama з відмовами й повільними відповідями")
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=8081)
+    ap.add_argument("--latency-ms", type=float, default=50.0)
+    ap.add_argument("--error-rate", type=float, default=0.0, help="частка відповідей 503")
+    ap.add_argument("--rate-limit-rate", type=float, default=0.0, help="частка відповідей 429")
+    ap.add_argument("--retry-after", type=float, default=1.0, help="Retry-After у 429, с")
+    ap.add_argument("--slow-rate", type=float, default=0.0, help="частка повільних відповідей")
+    ap.add_argument("--slow-ms", type=float, default=5000.0)
+    ap.add_argument("--seed", type=int, default=0)
+    args = ap.parse_args()
+
+    state = StubState(args.latency_ms, args.error_rate, args.rate_limit_rate, args.retry_after,
+                      args.slow_rate, args.slow_ms, args.seed)
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(state))
+    server.daemon_threads = True
+    print(f"LLM stub: http://{args.host}:{args.port} (OpenAI: /v1/responses, Ollama: /api/generate, /api/chat)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
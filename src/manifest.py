@@ -0,0 +1,127 @@
+from __future__ import annotations
+from dataclasses import dataclass, field, asdict
+from pathlib import Path
+from typing import Dict, List, Iterable
+import hashlib
+import json
+import os
+
+MANIFEST_VERSION = 1
+
+def file_sha1(p: Path, block: int = 1 << 20) -> str:
+    h = hashlib.sha1()
+    with open(p, "rb") as f:
+        while True:
+            buf = f.read(block)
+            if not buf:
+                break
+            h.update(buf)
+    return h.hexdigest()
+
+def manifest_path(persist_dir: str, collection: str) -> Path:
+    # лежить поруч зі сховищем Chroma, по одному файлу на колекцію
+    return Path(persist_dir) / f"manifest_{collection}.json"
+
+@dataclass
+class FileEntry:
+    path: str
+    size: int
+    mtime: float
+    sha1: str
+    chunk_ids: List[str] = field(default_factory=list)
+
+@dataclass
+class FileChange:
+    path: Path
+    status: str          # "added" | "updated" | "skipped"
+    size: int
+    mtime: float
+    sha1: str = ""
+
+class IndexManifest:
+    """
+    Маніфест індексу: path -> (size, mtime, sha1, chunk_ids).
+    Дає змогу переіндексовувати лише нові/змінені файли.
+    """
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.files: Dict[str, FileEntry] = {}
+
+    @classmethod
+    def load(cls, path: Path) -> "IndexManifest":
+        m = cls(path)
+        if m.path.exists():
+            try:
+                data = json.loads(m.path.read_text(encoding="utf-8"))
+            except (OSError, ValueError):
+                data = {}
+            if data.get("version") == MANIFEST_VERSION:
+                for key, e in data.get("files", {}).items():
+                    m.files[key] = FileEntry(**e)
+        return m
+
+    def save(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        data = {
+            "version": MANIFEST_VERSION,
+            "files": {k: asdict(v) for k, v in sorted(self.files.items())},
+        }
+        # атомарний запис: спершу tmp, потім replace
+        tmp = self.path.with_suffix(".json.tmp")
+        tmp.write_text(json.dumps(data, ensure_ascii=False), encoding="utf-8")
+        os.replace(tmp, self.path)
+
+    def reset(self):
+        self.files = {}
+
+    def diff(self, paths: Iterable[Path], force: bool = False) -> tuple[List[FileChange], List[str]]:
+        """
+        Повертає (зміни по наявних файлах, ключі видалених файлів).
+        Хеш рахується лише тоді, коли size/mtime не збігаються.
+        force=True — усі наявні файли вважаються зміненими (повна переіндексація).
+        """
+        changes: List[FileChange] = []
+        seen = set()
+        for p in paths:
+            key = str(p)
+            seen.add(key)
+            st = p.stat()
+            old = self.files.get(key)
+            if not force and old is not None and old.size == st.st_size and old.mtime == st.st_mtime:
+                changes.append(FileChange(p, "skipped", st.st_size, st.st_mtime, old.sha1))
+                continue
+
+            sha1 = file_sha1(p)
+            if old is None:
+                status = "added"
+            elif not force and old.sha1 == sha1:
+                # touch без зміни вмісту — лише оновимо mtime
+                status = "skipped"
+            else:
+                status = "updated"
+            changes.append(FileChange(p, status, st.st_size, st.st_mtime, sha1))
+
+        removed = [k for k in self.files if k not in seen]
+        return changes, removed
+
+    def record(self, change: FileChange, chunk_ids: List[str]):
+        self.files[str(change.path)] = FileEntry(
+            path=str(change.path),
+            size=change.size,
+            mtime=change.mtime,
+            sha1=change.sha1,
+            chunk_ids=list(chunk_ids),
+        )
+
+    def touch(self, change: FileChange):
+        e = self.files.get(str(change.path))
+        if e is not None:
+            e.size, e.mtime = change.size, change.mtime
+
+    def chunk_ids(self, key: str) -> List[str]:
+        e = self.files.get(key)
+        return list(e.chunk_ids) if e else []
+
+    def forget(self, key: str):
+        self.files.pop(key, None)
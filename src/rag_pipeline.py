@@ -1,18 +1,35 @@
 from __future__ import annotations
 from dataclasses import dataclass
-from typing import List, Dict, Any, Optional
+from typing import Callable, Iterator, List, Dict, Any, Optional, Sequence
 from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import bisect
+import dataclasses
 import hashlib
+import time
 
-from src.data_loader import load_raw_docs
-from src.chunking import chunk_docs
+from src.data_loader import iter_raw_files, iter_raw_docs
+from src.chunking import TOKEN_RESERVE, chunk_text
 from src.embeddings import EmbeddingModel
-from src.retriever import ChromaRetriever
-from src.llm import LLM, LLMConfig
+from src.embedding_cache import EmbeddingCache
+from src.retriever import BM25Retriever, ChromaRetriever, HybridRetriever, VectorRetriever
+from src.llm import LLM, LLMConfig, PROMPT_VERSION
+from src.answer_cache import AnswerCache, answer_key
+from src.context_packer import estimate_tokens, pack_context
+from src.conversation import SessionStore
+from src.dedup import ChunkDeduper
+from src.manifest import IndexManifest, manifest_path
+from src.index_pack import export_store, import_store
+from src.index_pipeline import IndexProgress, StagedIndexer
+from src.registry import registry
+from src.rerank import CrossEncoderReranker
+from src.sharding import ShardRouter, ShardedRetriever
+from src.tracing import Tracer, span
 
-def _chunk_id(source: str, idx: int, text: str) -> str:
-    h = hashlib.md5((source + str(idx) + text[:200]).encode("utf-8", errors="ignore")).hexdigest()
-    return f"{source}#{idx}#{h[:8]}"
+def _chunk_id(rel_path: str, idx: int, text: str) -> str:
+    # шлях відносно raw_dir, а не ім'я файлу: a/x.txt і b/x.txt не мають ділити id
+    h = hashlib.md5((rel_path + str(idx) + text[:200]).encode("utf-8", errors="ignore")).hexdigest()
+    return f"{rel_path}#{idx}#{h[:8]}"
 
 @dataclass
 class PipelineConfig:
@@ -21,50 +38,537 @@ class PipelineConfig:
     collection: str = "bioconsult"
     embed_model: str = "intfloat/e5-large-v2"
     top_k: int = 4
+    embed_cache_dir: str = "vectorstore/embed_cache"   # "" — без кешу
+    embed_cache_max_entries: int = 200_000
+    index_batch_size: int = 64            # пакет запису у сховище (не батч моделі — той підбирає EmbeddingEngine)
+    embed_window: int = 0                 # чанків на виклик ембеддера при індексації; 0 — вікно рушія (16 батчів)
+    query_batch_ms: float = 0.0           # > 0 — мікробатчинг одночасних запитів (напр. 10)
+    query_batch_max: int = 32
+    index_queue_size: int = 4
+    chunk_tokens: int = 0                 # 0 — ліміт токенізатора ембеддера (e5: 512) мінус резерв
+    chunk_overlap_tokens: int = 64
+    dedup_threshold: float = 0.9          # Жаккар (MinHash) для майже-дублікатів; 1 — лише точні; 0 — вимкнено
+    retriever: str = "dense"              # "dense" | "bm25" | "hybrid"
+    vector_backend: str = "chroma"        # "chroma" | "numpy" (VectorIndex у процесі)
+    vector_mode: str = "exact"            # для numpy: "exact" | "ivf"
+    vector_dtype: str = "float32"         # для numpy: "float32" | "float16" | "int8"
+    vector_rescore: int = 0               # > 0 — точне переранжування top_k*N кандидатів (напр. 4)
+    shard_rules: str = ""                 # "" — одна колекція; інакше "dir=en*->kb_en; *->kb" (src/sharding.py)
+    query_shards: str = ""                # шарди для пошуку через кому; "" — усі
+    shard_deadline_ms: float = 1000.0     # шард, що не відповів за цей час, пропускається; 0 — чекати всіх
+    hybrid_skip_dense_at: float = 0.55    # впевненість BM25, з якої ембеддер не викликається
+    rerank_model: str = ""                # cross-encoder (напр. "cross-encoder/mmarco-mMiniLMv2-L12-H384-v1"); "" — без
+    rerank_candidates: int = 20           # скільки кандидатів пошуку переранжувати до top_k
+    rerank_batch_size: int = 32
+    rerank_cache_size: int = 10_000       # LRU оцінок (запит, id чанка)
+    rerank_max_ms: float = 500.0          # не вкладається — лишається порядок пошуку; 0 — без ліміту
+    context_tokens: int = 1500            # бюджет контексту в промпті (≈ токени LLM, оцінка за довжиною); 0 — усі чанки
+    context_mmr_lambda: float = 0.7       # 1 — лише релевантність, менше — більше різноманітності
+    answer_cache_size: int = 512          # 0 — без кешу відповідей
+    answer_cache_ttl: float = 3600.0
+    answer_cache_similarity: float = 0.0  # > 0 — ще й пошук майже-дублікатів (напр. 0.95)
+    memory_turns: int = 3                 # останніх реплік сесії дослівно в промпті
+    memory_tokens: int = 600              # ... але не більше цього бюджету; старіші — в підсумок
+    summary_tokens: int = 300             # бюджет підсумку старіших реплік
+    max_sessions: int = 1000
+    session_ttl: float = 3600.0
+    tracing: bool = False                 # заміри етапів у відповіді ("timings") і лічильники (tracer.render())
+
+def shared_embedder(cfg: PipelineConfig, background: bool = False):
+    """
+    Один EmbeddingModel (разом із кешем ембеддінгів і батчером запитів) на процес
+    для однакових налаштувань: перебудова RAGPipeline не перевантажує e5.
+    background=True — почати завантаження у фоні й повернути Future (warm start).
+    """
+    key = (
+        "embedder", cfg.embed_model, cfg.embed_cache_dir, cfg.embed_cache_max_entries,
+        cfg.query_batch_ms, cfg.query_batch_max,
+    )
+
+    def build() -> EmbeddingModel:
+        cache = None
+        if cfg.embed_cache_dir:
+            cache = EmbeddingCache(cfg.embed_cache_dir, cfg.embed_model, max_entries=cfg.embed_cache_max_entries)
+        return EmbeddingModel(
+            model_name=cfg.embed_model,
+            cache=cache,
+            query_batch_ms=cfg.query_batch_ms,
+            query_batch_max=cfg.query_batch_max,
+        )
+
+    if background:
+        return registry.warm(key, build, f"embedder:{cfg.embed_model}")
+    return registry.get(key, build, f"embedder:{cfg.embed_model}")
 
 class RAGPipeline:
     def __init__(self, cfg: PipelineConfig, llm_cfg: LLMConfig):
         self.cfg = cfg
-        self.embedder = EmbeddingModel(model_name=cfg.embed_model)
-        self.retriever = ChromaRetriever(persist_dir=cfg.persist_dir, collection_name=cfg.collection)
+        self.embedder = shared_embedder(cfg)
+        if cfg.shard_rules:
+            # маніфест, дедуп і BM25 лишаються спільними (за cfg.collection) — шардуються лише вектори
+            router = ShardRouter(cfg.shard_rules)
+            self.retriever = ShardedRetriever(
+                {name: self._store(name) for name in router.shards},
+                router,
+                query_shards=[s.strip() for s in cfg.query_shards.split(",") if s.strip()],
+                deadline_ms=cfg.shard_deadline_ms,
+            )
+        else:
+            self.retriever = self._store(cfg.collection)
         self.retriever.attach_embedder(self.embedder)
         self.llm = LLM(llm_cfg)
+        self.tracer = Tracer(enabled=cfg.tracing)
+        self.sessions = SessionStore(
+            max_sessions=cfg.max_sessions,
+            ttl=cfg.session_ttl,
+            recent_turns=cfg.memory_turns,
+            recent_tokens=cfg.memory_tokens,
+            summary_tokens=cfg.summary_tokens,
+        )
+
+        self.dedup: Optional[ChunkDeduper] = None
+        if cfg.dedup_threshold > 0:
+            self.dedup = ChunkDeduper(cfg.persist_dir, cfg.collection, threshold=cfg.dedup_threshold)
+            self.dedup.load()
+
+        # retriever — сховище (запис/щільний пошук), searcher — те, чим відповідаємо на запити
+        self.bm25: Optional[BM25Retriever] = None
+        self.searcher = self.retriever
+        if cfg.retriever in ("bm25", "hybrid"):
+            self.bm25 = BM25Retriever(persist_dir=cfg.persist_dir, collection_name=cfg.collection)
+            self.bm25.load()
+            if cfg.retriever == "bm25":
+                self.searcher = self.bm25
+            else:
+                self.searcher = HybridRetriever(
+                    self.retriever.query, self.bm25, skip_dense_at=cfg.hybrid_skip_dense_at,
+                    dense_batch=self.retriever.query_batch,
+                )
+        elif cfg.retriever != "dense":
+            raise ValueError(f"Unknown retriever: {cfg.retriever}")
+
+        self.reranker: Optional[CrossEncoderReranker] = None
+        if cfg.rerank_model:
+            self.reranker = CrossEncoderReranker(
+                cfg.rerank_model,
+                batch_size=cfg.rerank_batch_size,
+                cache_size=cfg.rerank_cache_size,
+                max_ms=cfg.rerank_max_ms,
+            )
 
-    def index(self, clear: bool = False) -> Dict[str, Any]:
+        self.answers: Optional[AnswerCache] = None
+        if cfg.answer_cache_size > 0:
+            self.answers = AnswerCache(
+                max_entries=cfg.answer_cache_size,
+                ttl=cfg.answer_cache_ttl,
+                similarity=cfg.answer_cache_similarity,
+            )
+
+    def _store(self, collection: str):
+        cfg = self.cfg
+        if cfg.vector_backend == "chroma":
+            return ChromaRetriever(persist_dir=cfg.persist_dir, collection_name=collection)
+        if cfg.vector_backend == "numpy":
+            return VectorRetriever(
+                persist_dir=cfg.persist_dir,
+                collection_name=collection,
+                mode=cfg.vector_mode,
+                dtype=cfg.vector_dtype,
+                rescore=cfg.vector_rescore,
+            )
+        raise ValueError(f"Unknown vector backend: {cfg.vector_backend}")
+
+    def index(
+        self,
+        clear: bool = False,
+        incremental: bool = False,
+        progress: Optional[Callable[[IndexProgress], None]] = None,
+    ) -> Dict[str, Any]:
+        """
+        incremental=True — переіндексовуються лише нові/змінені файли (за маніфестом),
+        чанки видалених файлів прибираються з колекції.
+        Завантаження/чанкінг, ембеддінг і запис у Chroma йдуть конвеєром (StagedIndexer);
+        progress(IndexProgress) викликається з робочих потоків.
+        """
+        manifest = IndexManifest.load(manifest_path(self.cfg.persist_dir, self.cfg.collection))
         if clear:
             self.retriever.clear()
+            manifest.reset()
+            if self.dedup is not None:
+                self.dedup.clear()
 
-        raw_docs = load_raw_docs(self.cfg.raw_dir)
-        chunks = chunk_docs(raw_docs, chunk_size=900, chunk_overlap=150)
+        changes, removed = manifest.diff(iter_raw_files(self.cfg.raw_dir), force=not incremental)
+        stats = {"added": 0, "updated": 0, "deleted": 0, "skipped": 0, "duplicates": 0}
 
-        payload = []
-        for idx, ch in enumerate(chunks):
-            payload.append({
-                "id": _chunk_id(ch.meta["source"], idx, ch.text),
-                "text": ch.text,
-                "meta": ch.meta
-            })
+        if self.dedup is not None:
+            # файли, чиї дублікати трималися на чанках змінених/видалених файлів, — теж переіндексувати
+            touched = [str(ch.path) for ch in changes if ch.status != "skipped"] + removed
+            affected = self.dedup.release(touched)
+            changes = [
+                dataclasses.replace(ch, status="updated") if ch.status == "skipped" and str(ch.path) in affected else ch
+                for ch in changes
+            ]
+            dup0 = self.dedup.duplicates
+
+        try:
+            for key in removed:
+                self.retriever.delete_ids(manifest.chunk_ids(key))
+                manifest.forget(key)
+                stats["deleted"] += 1
 
-        if payload:
-            self.retriever.add_chunks(payload)
+            todo = {}
+            for ch in changes:
+                if ch.status == "skipped":
+                    manifest.touch(ch)
+                    stats["skipped"] += 1
+                else:
+                    todo[str(ch.path)] = ch
 
+            engine = self.embedder.engine
+            emb_n0, emb_t0 = engine.total_chunks, engine.total_seconds
+
+            def doc_payloads():
+                # документи приходять у міру розбору — одразу віддаємо їхні чанки далі
+                for doc in iter_raw_docs(paths=[ch.path for ch in todo.values()]):
+                    ch = todo.pop(doc.meta["path"])
+                    stats[ch.status] += 1
+                    yield self._prepare_doc(manifest, ch, doc)
+
+                # порожні/биті файли: лише прибираємо їхні старі чанки
+                for ch in list(todo.values()):
+                    stats[ch.status] += 1
+                    yield self._prepare_doc(manifest, ch, None)
+
+            indexer = StagedIndexer(
+                embed_fn=self.embedder.embed_documents,
+                write_fn=self.retriever.upsert,
+                batch_size=self.cfg.index_batch_size,
+                queue_size=self.cfg.index_queue_size,
+                embed_window=self.cfg.embed_window or getattr(engine, "window", 0),
+                progress=progress,
+            )
+            done = indexer.run(doc_payloads(), docs_total=len(todo))
+            n_chunks = done.chunks_written
+
+            if hasattr(self.retriever, "save"):
+                self.retriever.save()
+            manifest.save()
+            if self.dedup is not None:
+                self.dedup.save()
+                stats["duplicates"] = self.dedup.duplicates - dup0
+        except BaseException:
+            # release() уже змінив стан дедупу в пам'яті — повертаємо збережений, інакше наступний
+            # інкрементальний прогін не побачить файлів, що залежали від звільнених чанків
+            if self.dedup is not None:
+                self.dedup.reload()
+            raise
+
+        if self.embedder.cache is not None:
+            self.embedder.cache.flush()  # у робочому режимі кеш дописується пачками (див. EmbeddingCache)
+        if self.bm25 is not None:
+            self.bm25.build(sorted(self.retriever.all_chunks(), key=lambda c: c["id"]))
+            self.bm25.save()
+        if self.answers is not None:
+            self.answers.invalidate()
+        if self.reranker is not None:
+            self.reranker.clear()
+
+        emb_n, emb_t = engine.total_chunks - emb_n0, engine.total_seconds - emb_t0
         return {
-            "raw_docs": len(raw_docs),
-            "chunks": len(payload),
+            "raw_docs": sum(1 for e in manifest.files.values() if e.chunk_ids),
+            "chunks": n_chunks,
+            **stats,
+            "embedded": emb_n,
+            "embed_chunks_per_s": round(emb_n / emb_t, 1) if emb_t > 0 else 0.0,
             "persist_dir": self.cfg.persist_dir,
             "collection": self.cfg.collection
         }
 
-    def ask(self, question: str) -> Dict[str, Any]:
-        contexts = self.retriever.query(question, top_k=self.cfg.top_k)
-        answer = self.llm.generate(question, contexts)
+    def export_index(self, path: str, dtype: str = "float16") -> Dict[str, Any]:
+        """Готовий індекс (чанки, метадані, ембеддінги, маніфест, дедуп) -> один .ragpack (див. src.index_pack)."""
+        manifest = IndexManifest.load(manifest_path(self.cfg.persist_dir, self.cfg.collection))
+        return export_store(
+            self.retriever, path, dtype=dtype, embed_model=self.cfg.embed_model,
+            manifest=manifest, raw_dir=self.cfg.raw_dir, dedup=self.dedup, collection=self.cfg.collection,
+            chunk_tokens=self.cfg.chunk_tokens, chunk_overlap_tokens=self.cfg.chunk_overlap_tokens,
+        )
+
+    def import_index(self, path: str, verify: bool = True) -> Dict[str, Any]:
+        """
+        Замінити індекс вмістом .ragpack без ембеддингу корпусу. Після імпорту
+        index(incremental=True) переембедить лише файли, що відрізняються від експорту.
+        """
+        manifest = IndexManifest.load(manifest_path(self.cfg.persist_dir, self.cfg.collection))
+        out = import_store(
+            self.retriever, path, embed_model=self.cfg.embed_model, manifest=manifest,
+            raw_dir=self.cfg.raw_dir, bm25=self.bm25, dedup=self.dedup, verify=verify,
+        )
+        if self.answers is not None:
+            self.answers.invalidate()
+        if self.reranker is not None:
+            self.reranker.clear()
+        return out
+
+    def _prepare_doc(self, manifest: IndexManifest, ch, doc) -> List[Dict[str, Any]]:
+        old_ids = manifest.chunk_ids(str(ch.path))
+        chunks = []
+        if doc:
+            chunks = chunk_text(
+                doc.text,
+                source=doc.source,
+                max_tokens=self.cfg.chunk_tokens or self.embedder.max_tokens - TOKEN_RESERVE,
+                overlap_tokens=self.cfg.chunk_overlap_tokens,
+                count_tokens=self.embedder.count_tokens,
+            )
+            pages = doc.meta.get("page_offsets")
+            if pages:
+                for c in chunks:
+                    c.meta["page"] = bisect.bisect_right(pages, c.meta["start"])
+            # тека відносно raw_dir (data/raw/en/biology/x.txt -> "en/biology") — для правил шардів
+            try:
+                sub = Path(ch.path).parent.relative_to(self.cfg.raw_dir).as_posix()
+            except ValueError:
+                sub = ""
+            if sub and sub != ".":
+                for c in chunks:
+                    c.meta["dir"] = sub
+
+        try:
+            rel = Path(ch.path).relative_to(self.cfg.raw_dir).as_posix()
+        except ValueError:
+            rel = Path(ch.path).as_posix()
+        payload = []
+        for idx, c in enumerate(chunks):
+            payload.append({
+                "id": _chunk_id(rel, idx, c.text),
+                "text": c.text,
+                "meta": c.meta
+            })
+        if self.dedup is not None:
+            payload = self.dedup.filter(str(ch.path), payload)
+
+        new_ids = {p["id"] for p in payload}
+        self.retriever.delete_ids([i for i in old_ids if i not in new_ids])
+        manifest.record(ch, [p["id"] for p in payload])
+        return payload
 
+    def _sources(self, contexts: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
         sources = []
         for i, c in enumerate(contexts, start=1):
-            sources.append({
+            src = {
                 "n": i,
                 "source": c.get("meta", {}).get("source", ""),
                 "snippet": (c.get("text") or "")[:220] + ("…" if len(c.get("text") or "") > 220 else "")
-            })
+            }
+            also = self.dedup.also(c["id"]) if self.dedup is not None and c.get("id") else []
+            if also:
+                # той самий (майже) текст є ще в цих файлах — дублікати не індексувалися
+                src["also"] = [Path(k).name for k in also]
+            sources.append(src)
+        return sources
+
+    def _lookup(self, question: str, conv=None):
+        """
+        Кеш + retrieval: (готовий результат або None, контексти, ключ кешу, ембеддінг запиту).
+        conv — сесія: відповідь залежить і від її історії, тож та входить у ключ, а пошук
+        майже-дублікатів (лише за запитом) для таких відповідей вимкнено.
+        """
+        return self._lookup_batch([question], conv.digest() if conv is not None else "")[0]
+
+    def _lookup_batch(self, questions: List[str], history: str = ""):
+        """_lookup() для пакета: один encode на всі запитання і один searcher.query_batch на промахи кешу."""
+        model = f"{self.llm.cfg.provider}:{self.llm.cfg.model}"
+        out: List[Any] = [None] * len(questions)
+
+        q_embs = [None] * len(questions)
+        if self.answers is not None and self.answers.similarity > 0 and not history:
+            if len(questions) == 1:
+                q_embs = [self.embedder.embed_query(questions[0])]
+            else:
+                q_embs = list(self.embedder.embed_queries(questions))
+            for i, q_emb in enumerate(q_embs):
+                hit = self.answers.get_similar(q_emb, model)
+                if hit is not None:
+                    out[i] = (hit, [], "", q_emb)
+
+        todo = [i for i in range(len(questions)) if out[i] is None]
+        # з reranker'ом — ширший набір кандидатів, з якого в промпт іде top_k найкращих
+        k = max(self.cfg.top_k, self.cfg.rerank_candidates) if self.reranker is not None else self.cfg.top_k
+        if len(todo) == 1:
+            found = [self.searcher.query(questions[todo[0]], top_k=k)]
+        elif todo:
+            found = self.searcher.query_batch([questions[i] for i in todo], top_k=k)
+        else:
+            found = []
+        if self.reranker is not None:
+            found = [self.reranker.rerank(questions[i], hits, self.cfg.top_k) for i, hits in zip(todo, found)]
+
+        for i, contexts in zip(todo, found):
+            key = answer_key(questions[i], [c["id"] for c in contexts], model, PROMPT_VERSION, history)
+            hit = self.answers.get(key) if self.answers is not None else None
+            out[i] = (hit, contexts, key, q_embs[i])
+        return out
+
+    def _pack(self, contexts: List[Dict[str, Any]]):
+        # ембеддінги знайдених чанків приходять зі сховища; encode — лише для чанків без них
+        # (BM25) і лише з кешем ембеддінгів (там вони з індексації); інакше — Жаккар
+        embed_fn = self.embedder.embed_documents if self.embedder.cache is not None else None
+        return pack_context(
+            contexts,
+            self.cfg.context_tokens,
+            embed_fn=embed_fn,
+            mmr_lambda=self.cfg.context_mmr_lambda,
+        )
+
+    def _remember(self, key: str, result: Dict[str, Any], q_emb):
+        if self.answers is not None and result["answer"]:
+            model = f"{self.llm.cfg.provider}:{self.llm.cfg.model}"
+            self.answers.put(key, result, model, q_emb=q_emb)
+
+    def _count(self, question: str, answer: str, packed, cached: bool):
+        t = self.tracer
+        t.inc("requests_total", cached=str(cached).lower())
+        if cached:
+            return
+        # оцінка без токенізатора LLM (див. context_packer.CHARS_PER_TOKEN)
+        t.inc("tokens_in_total", packed.tokens_out + estimate_tokens(question))
+        t.inc("tokens_out_total", estimate_tokens(answer))
+        t.inc("context_chunks_total", packed.chunks_out)
+
+    def _session(self, session_id: Optional[str], question: str):
+        """(Conversation або None, запит для пошуку, текст запиту для LLM)."""
+        if not session_id:
+            return None, question, question
+        conv = self.sessions.get(session_id)
+        return conv, conv.rewrite(question), conv.frame(question)
+
+    def _session_info(self, conv, query: str) -> Dict[str, Any]:
+        return {"session": {"query": query, **conv.stats()}} if conv is not None else {}
+
+    def ask(self, question: str, session_id: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Відповідь + джерела. З cfg.tracing=True ще й "timings": {"retrieve_ms", "embed_ms",
+        "vector_search_ms", "prompt_ms", "generate_ms", "total_ms", ...}.
+        session_id — багатоходова розмова: уточнення («а в рослин?») доповнюються темою
+        попереднього запиту для пошуку, а LLM отримує підсумок + останні репліки сесії
+        (сталого розміру, див. src.conversation).
+        """
+        conv, query, prompt = self._session(session_id, question)
+        with self.tracer.trace() as tr:
+            with span("retrieve"):
+                hit, contexts, key, q_emb = self._lookup(query, conv)
+            if hit is not None:
+                out = {**hit, "cached": True}
+                self._count(prompt, hit["answer"], None, True)
+            else:
+                with span("prompt"):
+                    contexts, packed = self._pack(contexts)
+                with span("generate"):
+                    answer = self.llm.generate(prompt, contexts)
+
+                result = {"answer": answer, "sources": self._sources(contexts)}
+                self._remember(key, result, q_emb)
+                out = {**result, "cached": False, "context": packed.to_dict()}
+                self._count(prompt, answer, packed, False)
+        if conv is not None:
+            conv.add(question, out["answer"], query)
+        out.update(self._session_info(conv, query))
+        if tr is not None:
+            out["timings"] = tr.timings()
+        return out
+
+    def ask_stream(self, question: str, session_id: Optional[str] = None) -> Iterator[Dict[str, Any]]:
+        """
+        Події відповіді по черзі:
+          {"type": "sources", "sources": [...], "cached": bool}  — завжди першою, до токенів;
+          {"type": "token", "text": "..."}                         — шматки відповіді;
+          {"type": "done", "answer": "...", "context": {...}}      — повна відповідь (+ PackStats, крім кешу;
+                                                                     + "timings" з cfg.tracing=True,
+                                                                     + "session" з session_id).
+        """
+        conv, query, prompt = self._session(session_id, question)
+        # контекстна змінна траси не повинна жити між yield (генератор можуть
+        # відновлювати з інших контекстів), тож генерація міряється вручну
+        with self.tracer.trace(finish=False) as tr:
+            with span("retrieve"):
+                hit, contexts, key, q_emb = self._lookup(query, conv)
+            if hit is None:
+                with span("prompt"):
+                    contexts, packed = self._pack(contexts)
+
+        if hit is not None:
+            self._count(prompt, hit["answer"], None, True)
+            if conv is not None:
+                conv.add(question, hit["answer"], query)
+            if tr is not None:
+                tr.finish()
+            yield {"type": "sources", "sources": hit["sources"], "cached": True}
+            yield {"type": "token", "text": hit["answer"]}
+            yield {"type": "done", "answer": hit["answer"], **self._session_info(conv, query),
+                   **({"timings": tr.timings()} if tr else {})}
+            return
+
+        sources = self._sources(contexts)
+        yield {"type": "sources", "sources": sources, "cached": False}
+
+        parts: List[str] = []
+        t0 = time.perf_counter()
+        for piece in self.llm.stream(prompt, contexts):
+            if tr is not None and not parts:
+                tr.add("first_token", time.perf_counter() - t0)
+            parts.append(piece)
+            yield {"type": "token", "text": piece}
+
+        answer = "".join(parts).strip()
+        self._remember(key, {"answer": answer, "sources": sources}, q_emb)
+        self._count(prompt, answer, packed, False)
+        if conv is not None:
+            conv.add(question, answer, query)
+        done = {"type": "done", "answer": answer, "context": packed.to_dict(), **self._session_info(conv, query)}
+        if tr is not None:
+            tr.add("generate", time.perf_counter() - t0)
+            tr.finish()
+            done["timings"] = tr.timings()
+        yield done
+
+    def ask_batch(self, questions: Sequence[str], concurrency: int = 4,
+                  ordered: bool = True) -> Iterator[Dict[str, Any]]:
+        """
+        Пакет запитань (екзаменаційні набори): усі запитання ембедяться одним encode, пошук —
+        одним searcher.query_batch (Chroma: один collection.query), генерації йдуть паралельно,
+        не більше concurrency одночасно. Повтори 429/5xx/таймаутів і перемикання на резервного
+        провайдера робить сам LLM (LLMConfig.retries, fallbacks) — тут помилка лише записується.
+
+        Віддає по одному результату на запитання — у їхньому порядку (ordered) або в міру готовності:
+          {"i", "question", "ok": True, "answer", "sources", "cached", "context"}
+          {"i", "question", "ok": False, "error"} — такі запитання можна просто передати ще раз.
+        """
+        questions = list(questions)
+        lookups = self._lookup_batch(questions)
+
+        def answer(i: int) -> Dict[str, Any]:
+            question = questions[i]
+            hit, contexts, key, q_emb = lookups[i]
+            if hit is not None:
+                self._count(question, hit["answer"], None, True)
+                return {"i": i, "question": question, "ok": True, **hit, "cached": True}
+
+            contexts, packed = self._pack(contexts)
+            try:
+                text = self.llm.generate(question, contexts)
+            except Exception as e:
+                return {"i": i, "question": question, "ok": False, "error": str(e) or type(e).__name__}
+
+            result = {"answer": text, "sources": self._sources(contexts)}
+            self._remember(key, result, q_emb)
+            self._count(question, text, packed, False)
+            return {"i": i, "question": question, "ok": True, **result, "cached": False, "context": packed.to_dict()}
 
-        return {"answer": answer, "sources": sources}
+        pool = ThreadPoolExecutor(max_workers=max(1, concurrency), thread_name_prefix="ask_batch")
+        try:
+            futures = [pool.submit(answer, i) for i in range(len(questions))]
+            for fut in (futures if ordered else as_completed(futures)):
+                yield fut.result()
+        finally:
+            # споживач зупинився раніше — решту генерацій не запускаємо
+            pool.shutdown(wait=False, cancel_futures=True)
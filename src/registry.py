@@ -0,0 +1,132 @@
+from __future__ import annotations
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, Hashable, Optional
+import asyncio
+import threading
+import time
+
+class Registry:
+    """
+    Важкі об'єкти процесу (моделі, клієнти): по одному на ключ.
+
+    get()  — побудувати при першому зверненні (або дочекатися, якщо вже будується);
+    aget() — те саме для async-коду: будує у фоновому потоці, event loop не блокується;
+    warm() — почати будувати у фоновому потоці й одразу повернутися (старт сервера/UI);
+    status() / ready() — стан для /api/health. Після помилки наступний get() пробує знову.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._items: Dict[Hashable, Future] = {}
+        self._info: Dict[Hashable, Dict[str, Any]] = {}
+
+    def _future(self, key: Hashable, factory: Callable[[], Any], name: str, background: bool) -> Future:
+        with self._lock:
+            fut = self._items.get(key)
+            if fut is not None and not (fut.done() and fut.exception() is not None):
+                return fut
+            fut = Future()
+            self._items[key] = fut
+            self._info[key] = {"name": name, "started": time.time(), "seconds": None}
+
+        if background:
+            threading.Thread(target=self._build, args=(key, fut, factory), daemon=True, name=f"warm:{name}").start()
+        else:
+            self._build(key, fut, factory)
+        return fut
+
+    def _build(self, key: Hashable, fut: Future, factory: Callable[[], Any]):
+        fut.set_running_or_notify_cancel()
+        t0 = time.perf_counter()
+        try:
+            fut.set_result(factory())
+        except BaseException as e:
+            fut.set_exception(e)
+        finally:
+            self._info[key]["seconds"] = round(time.perf_counter() - t0, 3)
+
+    def get(self, key: Hashable, factory: Callable[[], Any], name: Optional[str] = None) -> Any:
+        return self._future(key, factory, name or str(key), background=False).result()
+
+    async def aget(self, key: Hashable, factory: Callable[[], Any], name: Optional[str] = None) -> Any:
+        return await asyncio.wrap_future(self._future(key, factory, name or str(key), background=True))
+
+    def warm(self, key: Hashable, factory: Callable[[], Any], name: Optional[str] = None) -> Future:
+        return self._future(key, factory, name or str(key), background=True)
+
+    def provide(self, key: Hashable, obj: Any, name: Optional[str] = None):
+        """Підкласти готовий об'єкт (заглушки в бенчмарках/тестах)."""
+        fut: Future = Future()
+        fut.set_result(obj)
+        with self._lock:
+            self._items[key] = fut
+            self._info[key] = {"name": name or str(key), "started": time.time(), "seconds": 0.0}
+
+    def peek(self, key: Hashable) -> Any:
+        """Готовий об'єкт або None (нічого не будує і не чекає)."""
+        with self._lock:
+            fut = self._items.get(key)
+        if fut is None or not fut.done() or fut.exception() is not None:
+            return None
+        return fut.result()
+
+    def status(self) -> Dict[str, Dict[str, Any]]:
+        out = {}
+        with self._lock:
+            items = list(self._items.items())
+        for key, fut in items:
+            info = self._info[key]
+            if not fut.done():
+                st = {"state": "loading", "seconds": round(time.time() - info["started"], 3)}
+            elif fut.exception() is not None:
+                st = {"state": "error", "error": str(fut.exception()), "seconds": info["seconds"]}
+            else:
+                st = {"state": "ready", "seconds": info["seconds"]}
+            out[info["name"]] = st
+        return out
+
+    def ready(self) -> bool:
+        with self._lock:
+            futs = list(self._items.values())
+        return all(f.done() and f.exception() is None for f in futs)
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+            self._info.clear()
+
+registry = Registry()
+
+def model_key(model_name: str, device: Optional[str] = None) -> tuple:
+    return ("sentence_transformer", model_name, device)
+
+def sentence_transformer(model_name: str, device: Optional[str] = None, background: bool = False):
+    def build():
+        from sentence_transformers import SentenceTransformer
+        return SentenceTransformer(model_name, device=device)
+
+    key, name = model_key(model_name, device), f"model:{model_name}"
+    if background:
+        return registry.warm(key, build, name)
+    return registry.get(key, build, name)
+
+def cross_encoder(model_name: str, device: Optional[str] = None, background: bool = False):
+    def build():
+        from sentence_transformers import CrossEncoder
+        return CrossEncoder(model_name, device=device)
+
+    key, name = ("cross_encoder", model_name, device), f"cross_encoder:{model_name}"
+    if background:
+        return registry.warm(key, build, name)
+    return registry.get(key, build, name)
+
+def chroma_client(path: str, background: bool = False):
+    def build():
+        import chromadb
+        from chromadb.config import Settings
+        return chromadb.PersistentClient(path=path, settings=Settings(anonymized_telemetry=False))
+
+    key, name = ("chroma", str(path)), f"chroma:{path}"
+    if background:
+        return registry.warm(key, build, name)
+    return registry.get(key, build, name)
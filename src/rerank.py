@@ -0,0 +1,119 @@
+from __future__ import annotations
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+from typing import Any, Dict, List, Optional, Tuple
+import threading
+
+from src.answer_cache import normalize_question
+from src.tracing import span
+
+class CrossEncoderReranker:
+    """
+    Переранжування кандидатів щільного пошуку локальним cross-encoder'ом (sentence-transformers).
+
+    - пари (запит, чанк) оцінюються пакетами по batch_size;
+    - оцінки кешуються: LRU на cache_size пар (нормалізований запит, id чанка) —
+      повторні й перефразовані лише регістром/пунктуацією запити не чіпають модель;
+    - max_ms > 0 — ліміт часу: модель рахує в окремому потоці, і якщо оцінки не готові за max_ms,
+      повертається початковий (щільний) порядок; потік дораховує й кладе оцінки в кеш,
+      тож повтор того самого запиту дешевший.
+    clear() — після переіндексації (id чанків могли отримати інший текст).
+    """
+
+    def __init__(self, model_name: str, device: Optional[str] = None, batch_size: int = 32,
+                 cache_size: int = 10_000, max_ms: float = 500.0):
+        from src.registry import cross_encoder
+        self.model_name = model_name
+        self.model = cross_encoder(model_name, device=device)
+        self.batch_size = max(1, batch_size)
+        self.cache_size = cache_size
+        self.max_ms = max_ms
+        self._cache: "OrderedDict[Tuple[str, str], float]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._pool: Optional[ThreadPoolExecutor] = None  # один потік: модель не ділиться між викликами
+
+        self.calls = 0
+        self.fallbacks = 0
+        self.cache_hits = 0
+        self.scored = 0
+
+    def _cached(self, keys: List[Tuple[str, str]]) -> List[Optional[float]]:
+        out: List[Optional[float]] = []
+        with self._lock:
+            for k in keys:
+                s = self._cache.get(k)
+                if s is not None:
+                    self._cache.move_to_end(k)
+                out.append(s)
+        return out
+
+    def _store(self, keys: List[Tuple[str, str]], scores: List[float]):
+        if self.cache_size <= 0:
+            return
+        with self._lock:
+            for k, s in zip(keys, scores):
+                self._cache[k] = s
+                self._cache.move_to_end(k)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def _worker(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="rerank")
+            return self._pool
+
+    def _score(self, pairs: List[Tuple[str, str]], keys: List[Tuple[str, str]]) -> List[float]:
+        out: List[float] = []
+        for b in range(0, len(pairs), self.batch_size):
+            pred = self.model.predict(pairs[b:b + self.batch_size], batch_size=self.batch_size,
+                                      show_progress_bar=False)
+            batch_scores = [float(x) for x in pred]
+            self._store(keys[b:b + self.batch_size], batch_scores)
+            self.scored += len(batch_scores)
+            out.extend(batch_scores)
+        return out
+
+    def rerank(self, query: str, candidates: List[Dict[str, Any]], top_n: int) -> List[Dict[str, Any]]:
+        """candidates — у порядку щільного пошуку; повертає top_n з "rerank_score" (або top_n як є при відкаті)."""
+        if len(candidates) <= 1:
+            return candidates[:top_n]
+        self.calls += 1
+        with span("rerank"):
+            q = normalize_question(query)
+            keys = [(q, c["id"]) for c in candidates]
+            scores = self._cached(keys)
+            todo = [i for i, s in enumerate(scores) if s is None]
+            self.cache_hits += len(candidates) - len(todo)
+
+            if todo:
+                pairs = [(query, candidates[i]["text"]) for i in todo]
+                todo_keys = [keys[i] for i in todo]
+                if self.max_ms > 0:
+                    fut = self._worker().submit(self._score, pairs, todo_keys)
+                    try:
+                        fresh = fut.result(timeout=self.max_ms / 1000.0)
+                    except FutureTimeout:
+                        self.fallbacks += 1
+                        return candidates[:top_n]
+                else:
+                    fresh = self._score(pairs, todo_keys)
+                for i, s in zip(todo, fresh):
+                    scores[i] = s
+
+            order = sorted(range(len(candidates)), key=lambda i: scores[i], reverse=True)[:top_n]
+            return [{**candidates[i], "rerank_score": scores[i]} for i in order]
+
+    def clear(self):
+        with self._lock:
+            self._cache.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "model": self.model_name,
+            "calls": self.calls,
+            "fallbacks": self.fallbacks,
+            "cache_hits": self.cache_hits,
+            "scored": self.scored,
+            "cache_entries": len(self._cache),
+        }
@@ -0,0 +1,114 @@
+from __future__ import annotations
+from collections import deque
+from email.utils import parsedate_to_datetime
+from typing import Deque, Optional
+import random
+import threading
+import time
+
+# статуси, після яких є сенс повторити запит (або піти до резервного провайдера)
+RETRY_STATUSES = frozenset({408, 409, 425, 429, 500, 502, 503, 504, 520, 522, 524, 529})
+
+class RetryableError(RuntimeError):
+    """Тимчасова помилка провайдера (перевантаження, ліміт, таймаут, обрив з'єднання)."""
+
+    def __init__(self, message: str, status: int = 0, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.status = status
+        self.retry_after = retry_after
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Заголовок Retry-After: секунди або HTTP-дата -> секунди очікування (None — немає/не розібрано)."""
+    if not value:
+        return None
+    value = value.strip()
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError, IndexError, OverflowError):
+        return None
+
+def backoff_delay(attempt: int, base: float, cap: float, retry_after: Optional[float] = None) -> float:
+    """
+    Пауза перед повтором attempt (0, 1, ...): «full jitter» — випадкова в [0, min(cap, base * 2^attempt)],
+    щоб клієнти, які впали разом, не повторювали теж разом. Retry-After — нижня межа.
+    """
+    delay = random.uniform(0.0, min(cap, base * (2 ** attempt)))
+    if retry_after is not None:
+        delay = max(delay, retry_after)
+    return delay
+
+class CircuitBreaker:
+    """
+    closed -> (failures невдач поспіль) -> open: запити не йдуть reset_after с ->
+    half_open: пропускається одна проба; успіх — closed, невдача — знову open.
+    """
+
+    def __init__(self, failures: int = 5, reset_after: float = 30.0):
+        self.failures = failures
+        self.reset_after = reset_after
+        self.state = "closed"
+        self.streak = 0
+        self.opened_at = 0.0
+        self.trips = 0
+        self._probe = False
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        if self.failures <= 0:
+            return True
+        with self._lock:
+            if self.state == "closed":
+                return True
+            if self.state == "open" and time.monotonic() - self.opened_at >= self.reset_after:
+                self.state = "half_open"
+                self._probe = False
+            if self.state == "half_open" and not self._probe:
+                self._probe = True
+                return True
+            return False
+
+    def success(self):
+        with self._lock:
+            self.state = "closed"
+            self.streak = 0
+            self._probe = False
+
+    def release(self):
+        """Спроба скасована до результату: проба half_open знову вільна."""
+        with self._lock:
+            self._probe = False
+
+    def failure(self):
+        with self._lock:
+            self.streak += 1
+            if self.state == "half_open" or (self.failures > 0 and self.streak >= self.failures):
+                if self.state != "open":
+                    self.trips += 1
+                self.state = "open"
+                self.opened_at = time.monotonic()
+                self._probe = False
+
+class LatencyWindow:
+    """Тривалості останніх size успішних викликів (для порогу hedging, напр. p95)."""
+
+    def __init__(self, size: int = 200):
+        self._data: Deque[float] = deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def add(self, seconds: float):
+        with self._lock:
+            self._data.append(seconds)
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def quantile(self, q: float) -> float:
+        with self._lock:
+            data = sorted(self._data)
+        if not data:
+            return 0.0
+        return data[min(len(data) - 1, int(q * len(data)))]
@@ -1,19 +1,43 @@
 from __future__ import annotations
-from typing import List, Dict, Any, Optional
+from typing import Callable, List, Dict, Any, Optional
 from pathlib import Path
+import json
+import os
+import re
+import threading
+
+import numpy as np
 
 from src.embeddings import EmbeddingModel
+from src.tracing import span
+
+_TOKEN_RE = re.compile(r"[^\W_]+")
+
+def tokenize(text: str) -> List[str]:
+    # як у src/rag.js: літери/цифри (укр + лат), нижній регістр, токени від 2 символів
+    t = (text or "").lower().replace("'", "").replace("’", "").replace("`", "")
+    return [w for w in _TOKEN_RE.findall(t) if len(w) >= 2]
+
+def iter_collection(collection, batch: int = 5000):
+    """Усі чанки колекції Chroma посторінково: {id, text, meta}."""
+    offset = 0
+    while True:
+        res = collection.get(include=["documents", "metadatas"], limit=batch, offset=offset)
+        if not res["ids"]:
+            break
+        for i, d, m in zip(res["ids"], res["documents"], res["metadatas"]):
+            yield {"id": i, "text": d or "", "meta": m or {}}
+        offset += len(res["ids"])
 
 class ChromaRetriever:
     def __init__(self, persist_dir: str = "vectorstore/chroma_db", collection_name: str = "bioconsult"):
-        import chromadb
-        from chromadb.config import Settings
+        from src.registry import chroma_client
 
         Path(persist_dir).mkdir(parents=True, exist_ok=True)
 
         self.persist_dir = persist_dir
         self.collection_name = collection_name
-        self.client = chromadb.PersistentClient(path=persist_dir, settings=Settings(anonymized_telemetry=False))
+        self.client = chroma_client(persist_dir)
         self.collection = self.client.get_or_create_collection(name=collection_name)
         self.embedder = None
 
@@ -24,6 +48,10 @@ class ChromaRetriever:
         self.client.delete_collection(self.collection_name)
         self.collection = self.client.get_or_create_collection(name=self.collection_name)
 
+    def delete_ids(self, ids: List[str]):
+        if ids:
+            self.collection.delete(ids=ids)
+
     def add_chunks(self, chunks: List[Dict[str, Any]]):
         """
         chunks: [{id, text, meta}]
@@ -31,31 +59,721 @@ class ChromaRetriever:
         if self.embedder is None:
             raise RuntimeError("Embedder not attached")
 
+        # float32 (n x dim) — Chroma приймає numpy напряму, без .tolist()
+        embs = self.embedder.embed_documents([c["text"] for c in chunks])
+        self.upsert(chunks, embs)
+
+    def upsert(self, chunks: List[Dict[str, Any]], embeddings):
+        """Запис уже порахованих ембеддінгів (для конвеєрної індексації)."""
         ids = [c["id"] for c in chunks]
         docs = [c["text"] for c in chunks]
         metas = [c["meta"] for c in chunks]
-        embs = self.embedder.embed_documents(docs)
 
         # Chroma upsert
-        self.collection.upsert(ids=ids, documents=docs, metadatas=metas, embeddings=embs)
+        self.collection.upsert(ids=ids, documents=docs, metadatas=metas, embeddings=embeddings)
+
+    def all_chunks(self) -> List[Dict[str, Any]]:
+        return list(iter_collection(self.collection))
+
+    def count(self) -> int:
+        return self.collection.count()
+
+    def iter_embedded(self, batch: int = 4096):
+        """Чанки разом з ембеддінгами посторінково: ([{id, text, meta}], float32 n x dim) — для експорту."""
+        offset = 0
+        while True:
+            res = self.collection.get(include=["documents", "metadatas", "embeddings"], limit=batch, offset=offset)
+            if not res["ids"]:
+                break
+            chunks = [{"id": i, "text": d or "", "meta": m or {}}
+                      for i, d, m in zip(res["ids"], res["documents"], res["metadatas"])]
+            yield chunks, np.asarray(res["embeddings"], dtype=np.float32)
+            offset += len(res["ids"])
+
+    def query(self, query_text: str, top_k: int = 4) -> List[Dict[str, Any]]:
+        if self.embedder is None:
+            raise RuntimeError("Embedder not attached")
+
+        return self.query_vectors([self.embedder.embed_query(query_text)], top_k)[0]
+
+    def query_batch(self, query_texts: List[str], top_k: int = 4) -> List[List[Dict[str, Any]]]:
+        """Кілька запитів: один encode на всіх і один виклик collection.query."""
+        if self.embedder is None:
+            raise RuntimeError("Embedder not attached")
+        if not query_texts:
+            return []
+
+        return self.query_vectors(self.embedder.embed_queries(query_texts), top_k)
+
+    def query_vectors(self, q_embs, top_k: int = 4) -> List[List[Dict[str, Any]]]:
+        """Пошук за готовими ембеддінгами запитів (n x dim) — один виклик collection.query."""
+        with span("vector_search"):
+            res = self.collection.query(
+                query_embeddings=q_embs,
+                n_results=top_k,
+                # ids повертаються завжди; ембеддінги — для MMR у pack_context (без повторного encode)
+                include=["documents", "metadatas", "distances", "embeddings"]
+            )
+        return [self._hits(res, q) for q in range(len(res["ids"]))]
+
+    @staticmethod
+    def _hits(res: Dict[str, Any], q: int) -> List[Dict[str, Any]]:
+        out = []
+        embs = res.get("embeddings")
+        for i in range(len(res["ids"][q])):
+            out.append({
+                "id": res["ids"][q][i],
+                "text": res["documents"][q][i],
+                "meta": res["metadatas"][q][i],
+                "distance": res["distances"][q][i],
+                "embedding": np.asarray(embs[q][i], dtype=np.float32) if embs is not None else None,
+            })
+        return out
+
+VECTOR_DTYPES = ("float32", "float16", "int8")
+
+def quantize(x: np.ndarray, dtype: str) -> tuple[np.ndarray, Optional[np.ndarray]]:
+    """
+    float32 -> компактна форма. int8 — симетрична скалярна квантизація
+    з окремим масштабом на кожен вектор: x ≈ codes * scale, scale = max|x| / 127.
+    """
+    x = np.asarray(x, dtype=np.float32)
+    if dtype == "float32":
+        return np.ascontiguousarray(x), None
+    if dtype == "float16":
+        return x.astype(np.float16), None
+    if dtype == "int8":
+        scales = np.abs(x).max(axis=1) / 127.0 if len(x) else np.zeros(0, dtype=np.float32)
+        scales = np.maximum(scales, 1e-12).astype(np.float32)
+        codes = np.clip(np.rint(x / scales[:, None]), -127, 127).astype(np.int8)
+        return codes, scales
+    raise ValueError(f"Unknown vector dtype: {dtype}")
+
+def dequantize(codes: np.ndarray, scales: Optional[np.ndarray]) -> np.ndarray:
+    x = np.asarray(codes, dtype=np.float32)
+    return x * scales[:, None] if scales is not None else x
+
+class VectorIndex:
+    """
+    Вбудований векторний індекс без клієнта/SQLite:
+      <dir>/vec_<name>.npy        — матриця для пошуку (float32 / float16 / int8), через mmap
+      <dir>/vec_<name>.scales.npy — масштаби по векторах (лише int8)
+      <dir>/vec_<name>.f32.npy    — повні float32 для точного переранжування (якщо rescore > 0)
+      <dir>/vec_<name>.json       — ids / texts / metas / dtype
+      <dir>/vec_<name>.ivf.npz    — (опційно) IVF: центроїди + списки рядків
+
+    Пошук — скалярні добутки (ембеддінги нормалізовані => косинус) і argpartition для top-k;
+    стиснута матриця розпаковується блоками, тож у RAM тримається лише компактна форма.
+    rescore=R — беремо top_k*R кандидатів за стиснутою формою і переранжовуємо
+    їх точними float32 (читаються з mmap лише потрібні рядки).
+    mode="ivf" — наближений пошук по nprobe найближчих кластерах; вмикається лише
+    від ivf_min_size векторів, менші колекції шукаються точно.
+    """
+
+    BLOCK = 8192
+
+    def __init__(self, persist_dir: str, name: str, mode: str = "exact",
+                 nlist: int = 0, nprobe: int = 8, ivf_min_size: int = 20_000,
+                 dtype: str = "float32", rescore: int = 0):
+        if mode not in ("exact", "ivf"):
+            raise ValueError(f"Unknown VectorIndex mode: {mode}")
+        if dtype not in VECTOR_DTYPES:
+            raise ValueError(f"Unknown vector dtype: {dtype}")
+        self.dir = Path(persist_dir)
+        self.name = name
+        self.mode = mode
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.ivf_min_size = ivf_min_size
+        self.dtype = dtype
+        self.rescore = rescore
+        self._lock = threading.RLock()
+        self._reset()
+
+    def _reset(self):
+        self.ids: List[str] = []
+        self.texts: List[str] = []
+        self.metas: List[Dict[str, Any]] = []
+        self._pos: Dict[str, int] = {}
+        self.codes = np.zeros((0, 0), dtype=np.float32)
+        self.scales: Optional[np.ndarray] = None
+        self.full: Optional[np.ndarray] = None
+        self._pending: List[np.ndarray] = []   # дописані float32, ще не злиті в codes
+        self._centroids: Optional[np.ndarray] = None
+        self._lists_order: Optional[np.ndarray] = None
+        self._lists_offsets: Optional[np.ndarray] = None
+
+    @property
+    def _base(self) -> Path:
+        return self.dir / f"vec_{self.name}"
+
+    @property
+    def _keep_full(self) -> bool:
+        return self.dtype != "float32" and self.rescore > 0
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    @property
+    def dim(self) -> int:
+        if self.codes.size:
+            return int(self.codes.shape[1])
+        return int(self._pending[0].shape[1]) if self._pending else 0
+
+    def memory_bytes(self) -> int:
+        """Скільки займає те, що читається при кожному пошуку (без mmap-копії float32)."""
+        with self._lock:
+            self._consolidate()
+            n = self.codes.nbytes
+            if self.scales is not None:
+                n += self.scales.nbytes
+            return int(n)
+
+    # ---------- mutation ----------
+    def _consolidate(self):
+        if not self._pending:
+            return
+        new = np.concatenate(self._pending).astype(np.float32)
+        self._pending = []
+        codes, scales = quantize(new, self.dtype)
+        if self.codes.size:
+            self.codes = np.concatenate([self.codes, codes])
+            if scales is not None:
+                self.scales = np.concatenate([self.scales, scales])
+            if self._keep_full:
+                self.full = np.concatenate([self.full, new])
+        else:
+            self.codes, self.scales = codes, scales
+            self.full = new if self._keep_full else None
+
+    def _writable(self):
+        # mmap (read-only) -> RAM перед зміною на місці
+        if self.codes.size and not self.codes.flags.writeable:
+            self.codes = np.array(self.codes)
+        if self.full is not None and not self.full.flags.writeable:
+            self.full = np.array(self.full)
+
+    def upsert(self, ids: List[str], texts: List[str], metas: List[Dict[str, Any]], vectors):
+        vectors = np.asarray(vectors, dtype=np.float32)
+        with self._lock:
+            self._consolidate()
+            self._writable()
+            new_rows = []
+            for i, (cid, txt, meta) in enumerate(zip(ids, texts, metas)):
+                row = self._pos.get(cid)
+                if row is not None:
+                    codes, scales = quantize(vectors[i:i + 1], self.dtype)
+                    self.codes[row] = codes[0]
+                    if scales is not None:
+                        self.scales[row] = scales[0]
+                    if self.full is not None:
+                        self.full[row] = vectors[i]
+                    self.texts[row], self.metas[row] = txt, meta
+                    continue
+                self._pos[cid] = len(self.ids)
+                self.ids.append(cid)
+                self.texts.append(txt)
+                self.metas.append(meta)
+                new_rows.append(i)
+            if new_rows:
+                self._pending.append(vectors[new_rows])
+            self._centroids = None  # IVF застарів
+
+    def delete(self, ids: List[str]):
+        with self._lock:
+            drop = {self._pos[i] for i in ids if i in self._pos}
+            if not drop:
+                return
+            self._consolidate()
+            keep = np.array([r for r in range(len(self.ids)) if r not in drop], dtype=np.int64)
+            self.codes = np.ascontiguousarray(self.codes[keep])
+            if self.scales is not None:
+                self.scales = np.ascontiguousarray(self.scales[keep])
+            if self.full is not None:
+                self.full = np.ascontiguousarray(self.full[keep])
+            self.ids = [self.ids[r] for r in keep]
+            self.texts = [self.texts[r] for r in keep]
+            self.metas = [self.metas[r] for r in keep]
+            self._pos = {cid: r for r, cid in enumerate(self.ids)}
+            self._centroids = None
+
+    def clear(self):
+        with self._lock:
+            self._reset()
+            for suffix in (".npy", ".scales.npy", ".f32.npy", ".json", ".ivf.npz"):
+                Path(f"{self._base}{suffix}").unlink(missing_ok=True)
+
+    # ---------- persistence ----------
+    def _save_array(self, suffix: str, arr: Optional[np.ndarray]):
+        path = Path(f"{self._base}{suffix}")
+        if arr is None:
+            path.unlink(missing_ok=True)
+            return
+        tmp = Path(f"{self._base}.tmp{suffix}")
+        np.save(tmp, arr)
+        os.replace(tmp, path)
+
+    def save(self):
+        with self._lock:
+            self._consolidate()
+            self.dir.mkdir(parents=True, exist_ok=True)
+            if self.mode == "ivf" and self._centroids is None:
+                self.train_ivf()
+            self._save_array(".npy", self.codes)
+            self._save_array(".scales.npy", self.scales)
+            self._save_array(".f32.npy", self.full)
+            side = {"dtype": self.dtype, "ids": self.ids, "texts": self.texts, "metas": self.metas}
+            with open(f"{self._base}.json.tmp", "w", encoding="utf-8") as f:
+                json.dump(side, f, ensure_ascii=False)
+            os.replace(f"{self._base}.json.tmp", f"{self._base}.json")
+            if self._centroids is not None:
+                np.savez(f"{self._base}.ivf.npz", centroids=self._centroids,
+                         order=self._lists_order, offsets=self._lists_offsets)
+            else:
+                Path(f"{self._base}.ivf.npz").unlink(missing_ok=True)
+
+    def load(self) -> bool:
+        if not (Path(f"{self._base}.npy").exists() and Path(f"{self._base}.json").exists()):
+            return False
+        with self._lock:
+            self._reset()
+            with open(f"{self._base}.json", encoding="utf-8") as f:
+                side = json.load(f)
+            self.ids, self.texts, self.metas = side["ids"], side["texts"], side["metas"]
+            self._pos = {cid: r for r, cid in enumerate(self.ids)}
+
+            codes = np.load(f"{self._base}.npy", mmap_mode="r")
+            scales_p, full_p = Path(f"{self._base}.scales.npy"), Path(f"{self._base}.f32.npy")
+            scales = np.load(scales_p) if scales_p.exists() else None
+            full = np.load(full_p, mmap_mode="r") if full_p.exists() else None
+
+            if side.get("dtype", "float32") == self.dtype and (full is not None or not self._keep_full):
+                self.codes, self.scales = codes, scales
+                self.full = full if self._keep_full else None
+                ivf = Path(f"{self._base}.ivf.npz")
+                if ivf.exists():
+                    with np.load(ivf) as z:
+                        self._centroids = z["centroids"]
+                        self._lists_order, self._lists_offsets = z["order"], z["offsets"]
+            else:
+                # змінився формат зберігання — переквантизуємо з найточнішого, що є
+                src = np.array(full) if full is not None else dequantize(codes, scales)
+                self._pending = [src]
+                self._consolidate()
+        return True
+
+    # ---------- scoring ----------
+    def _dot(self, q: np.ndarray, rows: Optional[np.ndarray] = None) -> np.ndarray:
+        """Скори по стиснутій формі; розпаковка блоками по BLOCK рядків (вміщається в кеш)."""
+        n = len(self.ids) if rows is None else len(rows)
+        out = np.empty(n, dtype=np.float32)
+        for a in range(0, n, self.BLOCK):
+            sel = slice(a, a + self.BLOCK) if rows is None else rows[a:a + self.BLOCK]
+            block = self.codes[sel]
+            if self.dtype == "float32":
+                out[a:a + self.BLOCK] = block @ q
+            else:
+                s = block.astype(np.float32) @ q
+                if self.scales is not None:
+                    s *= self.scales[sel]
+                out[a:a + self.BLOCK] = s
+        return out
+
+    # ---------- IVF ----------
+    def train_ivf(self, iters: int = 10, sample: int = 50_000, seed: int = 0):
+        """k-means (сферичний) на вибірці; nlist за замовчуванням ~ sqrt(n)."""
+        with self._lock:
+            self._consolidate()
+            n = len(self.ids)
+            if n < self.ivf_min_size:
+                self._centroids = None
+                return
+            nlist = self.nlist or max(16, int(np.sqrt(n)))
+            rng = np.random.default_rng(seed)
+            pick = np.sort(rng.choice(n, size=min(n, sample), replace=False))
+            x = dequantize(self.codes[pick], None if self.scales is None else self.scales[pick])
+            cent = np.array(x[rng.choice(len(x), size=nlist, replace=False)], dtype=np.float32)
+            for _ in range(iters):
+                assign = np.argmax(x @ cent.T, axis=1)
+                for c in range(nlist):
+                    members = x[assign == c]
+                    if len(members):
+                        v = members.sum(axis=0)
+                        cent[c] = v / max(np.linalg.norm(v), 1e-12)
+
+            # призначення всіх векторів — блоками, щоб не тримати n x nlist одразу
+            assign = np.empty(n, dtype=np.int32)
+            for a in range(0, n, self.BLOCK):
+                sl = slice(a, a + self.BLOCK)
+                block = dequantize(self.codes[sl], None if self.scales is None else self.scales[sl])
+                assign[sl] = np.argmax(block @ cent.T, axis=1)
+            order = np.argsort(assign, kind="stable").astype(np.int64)
+            counts = np.bincount(assign, minlength=nlist)
+            self._centroids = cent
+            self._lists_order = order
+            self._lists_offsets = np.concatenate([[0], np.cumsum(counts)]).astype(np.int64)
+
+    def vectors(self, rows) -> np.ndarray:
+        """float32 рядків rows (точні, якщо зберігаються, інакше — розпаковані коди)."""
+        rows = np.asarray(rows, dtype=np.int64)
+        with self._lock:
+            self._consolidate()
+            if self.full is not None:
+                return np.asarray(self.full[rows], dtype=np.float32)
+            return dequantize(self.codes[rows], None if self.scales is None else self.scales[rows])
+
+    # ---------- search ----------
+    def search(self, q, top_k: int = 4) -> tuple[np.ndarray, np.ndarray]:
+        """Повертає (номери рядків, скори) у порядку спадання схожості."""
+        q = np.asarray(q, dtype=np.float32).reshape(-1)
+        empty = np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+        with self._lock:
+            self._consolidate()
+            n = len(self.ids)
+            if not n:
+                return empty
+
+            rows = None
+            if self.mode == "ivf" and n >= self.ivf_min_size:
+                if self._centroids is None:
+                    self.train_ivf()
+                probe = np.argsort(-(self._centroids @ q))[:self.nprobe]
+                off = self._lists_offsets
+                rows = np.sort(np.concatenate([self._lists_order[off[c]:off[c + 1]] for c in probe]))
+
+            scores = self._dot(q, rows)
+            want = top_k * self.rescore if (self.full is not None and self.rescore > 0) else top_k
+            k = min(want, len(scores))
+            if not k:
+                return empty
+            top = np.argpartition(-scores, k - 1)[:k]
+            idx = top if rows is None else rows[top]
+
+            if self.full is not None and self.rescore > 0:
+                # точне переранжування кандидатів по float32 (mmap читає лише ці рядки)
+                order = np.argsort(idx)
+                idx = idx[order]
+                exact = np.asarray(self.full[idx], dtype=np.float32) @ q
+                best = np.argsort(-exact)[:top_k]
+                return idx[best].astype(np.int64), exact[best]
+
+            best = np.argsort(-scores[top])
+            return idx[best].astype(np.int64), scores[top][best]
+
+class VectorRetriever:
+    """Той самий інтерфейс, що й ChromaRetriever, але поверх VectorIndex (numpy)."""
+
+    def __init__(self, persist_dir: str = "vectorstore/chroma_db", collection_name: str = "bioconsult",
+                 mode: str = "exact", nprobe: int = 8, dtype: str = "float32", rescore: int = 0):
+        Path(persist_dir).mkdir(parents=True, exist_ok=True)
+        self.persist_dir = persist_dir
+        self.collection_name = collection_name
+        self.index = VectorIndex(persist_dir, collection_name, mode=mode, nprobe=nprobe,
+                                 dtype=dtype, rescore=rescore)
+        self.index.load()
+        self.embedder = None
+
+    def attach_embedder(self, embedder: EmbeddingModel):
+        self.embedder = embedder
+
+    def clear(self):
+        self.index.clear()
+
+    def delete_ids(self, ids: List[str]):
+        if ids:
+            self.index.delete(ids)
+
+    def add_chunks(self, chunks: List[Dict[str, Any]]):
+        if self.embedder is None:
+            raise RuntimeError("Embedder not attached")
+        self.upsert(chunks, self.embedder.embed_documents([c["text"] for c in chunks]))
+
+    def upsert(self, chunks: List[Dict[str, Any]], embeddings):
+        self.index.upsert(
+            [c["id"] for c in chunks], [c["text"] for c in chunks], [c["meta"] for c in chunks], embeddings
+        )
+
+    def save(self):
+        self.index.save()
+
+    def count(self) -> int:
+        return len(self.index)
+
+    def iter_embedded(self, batch: int = 4096):
+        """Як ChromaRetriever.iter_embedded(); int8/float16 без повних float32 — розпаковані коди."""
+        idx = self.index
+        with idx._lock:
+            idx._consolidate()
+            for a in range(0, len(idx), batch):
+                rows = slice(a, a + batch)
+                if idx.full is not None:
+                    embs = np.asarray(idx.full[rows], dtype=np.float32)
+                else:
+                    embs = dequantize(idx.codes[rows], idx.scales[rows] if idx.scales is not None else None)
+                chunks = [{"id": i, "text": t, "meta": m}
+                          for i, t, m in zip(idx.ids[rows], idx.texts[rows], idx.metas[rows])]
+                yield chunks, embs
+
+    def all_chunks(self) -> List[Dict[str, Any]]:
+        idx = self.index
+        return [{"id": i, "text": t, "meta": m} for i, t, m in zip(idx.ids, idx.texts, idx.metas)]
 
     def query(self, query_text: str, top_k: int = 4) -> List[Dict[str, Any]]:
         if self.embedder is None:
             raise RuntimeError("Embedder not attached")
+        return self.query_vector(self.embedder.embed_query(query_text), top_k)
+
+    def query_batch(self, query_texts: List[str], top_k: int = 4) -> List[List[Dict[str, Any]]]:
+        if self.embedder is None:
+            raise RuntimeError("Embedder not attached")
+        if not query_texts:
+            return []
+        return self.query_vectors(self.embedder.embed_queries(query_texts), top_k)
+
+    def query_vectors(self, q_embs, top_k: int = 4) -> List[List[Dict[str, Any]]]:
+        return [self.query_vector(q, top_k) for q in q_embs]
+
+    def query_vector(self, q_emb, top_k: int = 4) -> List[Dict[str, Any]]:
+        with span("vector_search"):
+            rows, scores = self.index.search(q_emb, top_k)
+            embs = self.index.vectors(rows)
+        out = []
+        for r, s, e in zip(rows, scores, embs):
+            out.append({
+                "id": self.index.ids[r],
+                "text": self.index.texts[r],
+                "meta": self.index.metas[r],
+                "distance": float(1.0 - s),
+                "embedding": e,
+            })
+        return out
+
+class BM25Retriever:
+    """
+    BM25 (Okapi) з компактним інвертованим індексом у numpy-масивах (CSR):
+      offsets[t]..offsets[t+1] — постинги терма t у doc_ids/weights,
+      weights — уже нормалізований tf-доданок BM25 (з урахуванням довжини документа),
+      idf — передпорахований для кожного терма.
+    Зберігається поруч зі сховищем Chroma: bm25_<collection>.npz + .json.
+    """
+
+    def __init__(self, persist_dir: str = "vectorstore/chroma_db", collection_name: str = "bioconsult",
+                 k1: float = 1.4, b: float = 0.75):
+        self.persist_dir = persist_dir
+        self.collection_name = collection_name
+        self.k1 = k1
+        self.b = b
+        self._reset()
 
-        q_emb = self.embedder.embed_query(query_text)
-        res = self.collection.query(
-            query_embeddings=[q_emb],
-            n_results=top_k,
-            include=["documents", "metadatas", "distances", "ids"]
+    def _reset(self):
+        self.vocab: Dict[str, int] = {}
+        self.ids: List[str] = []
+        self.texts: List[str] = []
+        self.metas: List[Dict[str, Any]] = []
+        self.offsets = np.zeros(1, dtype=np.int64)
+        self.doc_ids = np.zeros(0, dtype=np.int32)
+        self.weights = np.zeros(0, dtype=np.float32)
+        self.idf = np.zeros(0, dtype=np.float32)
+        self.doc_len = np.zeros(0, dtype=np.float32)
+
+    @property
+    def _base(self) -> Path:
+        return Path(self.persist_dir) / f"bm25_{self.collection_name}"
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def build(self, chunks: List[Dict[str, Any]]):
+        """chunks: [{id, text, meta}]"""
+        self._reset()
+        postings: Dict[int, List[tuple]] = {}
+        lens = []
+        for d, c in enumerate(chunks):
+            toks = tokenize(c["text"])
+            lens.append(len(toks))
+            tf: Dict[int, int] = {}
+            for t in toks:
+                tid = self.vocab.setdefault(t, len(self.vocab))
+                tf[tid] = tf.get(tid, 0) + 1
+            for tid, f in tf.items():
+                postings.setdefault(tid, []).append((d, f))
+            self.ids.append(c["id"])
+            self.texts.append(c["text"])
+            self.metas.append(c.get("meta") or {})
+
+        n = len(chunks)
+        self.doc_len = np.asarray(lens, dtype=np.float32)
+        avgdl = float(self.doc_len.mean()) if n else 0.0
+
+        counts = np.zeros(len(self.vocab), dtype=np.int64)
+        for tid, p in postings.items():
+            counts[tid] = len(p)
+        self.offsets = np.concatenate([[0], np.cumsum(counts)]).astype(np.int64)
+
+        doc_ids = np.empty(int(self.offsets[-1]), dtype=np.int32)
+        tfs = np.empty(int(self.offsets[-1]), dtype=np.float32)
+        for tid, p in postings.items():
+            a = self.offsets[tid]
+            arr = np.asarray(p, dtype=np.int64)
+            doc_ids[a:a + len(p)] = arr[:, 0]
+            tfs[a:a + len(p)] = arr[:, 1]
+        self.doc_ids = doc_ids
+
+        dl = self.doc_len[doc_ids] if len(doc_ids) else np.zeros(0, dtype=np.float32)
+        norm = self.k1 * (1 - self.b + self.b * dl / max(avgdl, 1e-9))
+        self.weights = (tfs * (self.k1 + 1) / (tfs + norm)).astype(np.float32)
+
+        # idf = ln(1 + (N - df + 0.5) / (df + 0.5))
+        self.idf = np.log1p((n - counts + 0.5) / (counts + 0.5)).astype(np.float32)
+
+    def build_from_collection(self, collection):
+        """Перебудова з колекції Chroma (працює і після інкрементальної індексації)."""
+        self.build(sorted(iter_collection(collection), key=lambda c: c["id"]))
+
+    def save(self):
+        base = self._base
+        base.parent.mkdir(parents=True, exist_ok=True)
+        np.savez(
+            f"{base}.npz",
+            offsets=self.offsets, doc_ids=self.doc_ids, weights=self.weights,
+            idf=self.idf, doc_len=self.doc_len,
         )
+        side = {"k1": self.k1, "b": self.b, "vocab": self.vocab,
+                "ids": self.ids, "texts": self.texts, "metas": self.metas}
+        tmp = f"{base}.json.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(side, f, ensure_ascii=False)
+        os.replace(tmp, f"{base}.json")
+
+    def load(self) -> bool:
+        base = self._base
+        if not (Path(f"{base}.npz").exists() and Path(f"{base}.json").exists()):
+            return False
+        with np.load(f"{base}.npz") as z:
+            self.offsets, self.doc_ids, self.weights = z["offsets"], z["doc_ids"], z["weights"]
+            self.idf, self.doc_len = z["idf"], z["doc_len"]
+        with open(f"{base}.json", encoding="utf-8") as f:
+            side = json.load(f)
+        self.k1, self.b = side["k1"], side["b"]
+        self.vocab, self.ids = side["vocab"], side["ids"]
+        self.texts, self.metas = side["texts"], side["metas"]
+        return True
+
+    def clear(self):
+        self._reset()
+        for ext in (".npz", ".json"):
+            Path(f"{self._base}{ext}").unlink(missing_ok=True)
+
+    def search(self, query_text: str, top_k: int = 4) -> tuple[List[Dict[str, Any]], float]:
+        """
+        Повертає (результати, впевненість). Впевненість — частка найкращого скору
+        від максимально можливого для цього запиту (усі терми з tf -> ∞), у [0, 1].
+        """
+        with span("bm25"):
+            return self._search(query_text, top_k)
+
+    def _search(self, query_text: str, top_k: int) -> tuple[List[Dict[str, Any]], float]:
+        if not self.ids:
+            return [], 0.0
+        tids = sorted({self.vocab[t] for t in tokenize(query_text) if t in self.vocab})
+        if not tids:
+            return [], 0.0
+
+        scores = np.zeros(len(self.ids), dtype=np.float32)
+        for tid in tids:
+            a, z = self.offsets[tid], self.offsets[tid + 1]
+            # в межах одного терма doc_ids унікальні — можна без np.add.at
+            scores[self.doc_ids[a:z]] += self.idf[tid] * self.weights[a:z]
+
+        k = min(top_k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
 
         out = []
-        for i in range(len(res["ids"][0])):
+        for d in top:
+            if scores[d] <= 0:
+                break
             out.append({
-                "id": res["ids"][0][i],
-                "text": res["documents"][0][i],
-                "meta": res["metadatas"][0][i],
-                "distance": res["distances"][0][i],
+                "id": self.ids[d],
+                "text": self.texts[d],
+                "meta": self.metas[d],
+                "score": float(scores[d]),
             })
+
+        max_possible = float(self.idf[tids].sum()) * (self.k1 + 1)
+        conf = (out[0]["score"] / max_possible) if out and max_possible > 0 else 0.0
+        return out, conf
+
+    def query(self, query_text: str, top_k: int = 4) -> List[Dict[str, Any]]:
+        return self.search(query_text, top_k)[0]
+
+    def query_batch(self, query_texts: List[str], top_k: int = 4) -> List[List[Dict[str, Any]]]:
+        return [self.search(q, top_k)[0] for q in query_texts]
+
+def rrf_fuse(result_lists: List[List[Dict[str, Any]]], top_k: int, k: int = 60) -> List[Dict[str, Any]]:
+    """Reciprocal rank fusion: score(d) = Σ 1 / (k + rank_i(d))."""
+    fused: Dict[str, float] = {}
+    items: Dict[str, Dict[str, Any]] = {}
+    for results in result_lists:
+        for rank, r in enumerate(results, start=1):
+            fused[r["id"]] = fused.get(r["id"], 0.0) + 1.0 / (k + rank)
+            items.setdefault(r["id"], r)
+    order = sorted(fused, key=fused.get, reverse=True)[:top_k]
+    return [{**items[i], "rrf": fused[i]} for i in order]
+
+class HybridRetriever:
+    """
+    BM25 + щільний пошук, злиті через RRF.
+    Якщо BM25 досить впевнений (confidence >= skip_dense_at), ембеддер не викликається взагалі.
+    """
+
+    def __init__(self, dense_query: Callable[[str, int], List[Dict[str, Any]]], bm25: BM25Retriever,
+                 candidates: int = 3, rrf_k: int = 60, skip_dense_at: float = 0.55,
+                 dense_batch: Optional[Callable[[List[str], int], List[List[Dict[str, Any]]]]] = None):
+        self.dense_query = dense_query
+        self.dense_batch = dense_batch
+        self.bm25 = bm25
+        self.candidates = candidates
+        self.rrf_k = rrf_k
+        self.skip_dense_at = skip_dense_at
+        self.dense_skipped = 0
+        self.queries = 0
+
+    def query(self, query_text: str, top_k: int = 4) -> List[Dict[str, Any]]:
+        self.queries += 1
+        n = max(top_k, top_k * self.candidates)
+        sparse, conf = self.bm25.search(query_text, top_k=n)
+        if sparse and self.skip_dense_at > 0 and conf >= self.skip_dense_at:
+            self.dense_skipped += 1
+            return sparse[:top_k]
+
+        dense = self.dense_query(query_text, n)
+        if not sparse:
+            return dense[:top_k]
+        return rrf_fuse([dense, sparse], top_k=top_k, k=self.rrf_k)
+
+    def query_batch(self, query_texts: List[str], top_k: int = 4) -> List[List[Dict[str, Any]]]:
+        """Як query() для кожного тексту, але щільний пошук — одним dense_batch на ті, де BM25 не впевнений."""
+        n = max(top_k, top_k * self.candidates)
+        out: List[Optional[List[Dict[str, Any]]]] = [None] * len(query_texts)
+        sparse_all, need = [], []
+        for i, q in enumerate(query_texts):
+            self.queries += 1
+            sparse, conf = self.bm25.search(q, top_k=n)
+            sparse_all.append(sparse)
+            if sparse and self.skip_dense_at > 0 and conf >= self.skip_dense_at:
+                self.dense_skipped += 1
+                out[i] = sparse[:top_k]
+            else:
+                need.append(i)
+
+        if need:
+            texts = [query_texts[i] for i in need]
+            if self.dense_batch is not None:
+                dense_all = self.dense_batch(texts, n)
+            else:
+                dense_all = [self.dense_query(q, n) for q in texts]
+            for i, dense in zip(need, dense_all):
+                sparse = sparse_all[i]
+                out[i] = rrf_fuse([dense, sparse], top_k=top_k, k=self.rrf_k) if sparse else dense[:top_k]
         return out
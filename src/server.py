@@ -1,29 +1,152 @@
 import os
-from typing import List, Dict
-from fastapi import FastAPI
+import json
+import asyncio
+import dataclasses
+import logging
+from pathlib import Path
+from typing import Any, AsyncIterator, Awaitable, List, Dict, Optional, TypeVar
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse, StreamingResponse
 from pydantic import BaseModel
 from dotenv import load_dotenv
 
-import chromadb
-from chromadb.config import Settings
-from openai import OpenAI
+from src.chunking import chunk_text
+from src.context_packer import estimate_tokens, pack_context, tiktoken_counter
+from src.conversation import Conversation, SessionStore
+from src.dedup import ChunkDeduper
+from src.embedding_cache import EmbeddingCache
+from src.manifest import IndexManifest, manifest_path
+from src.index_pipeline import StagedIndexer
+from src.registry import chroma_client, registry
+from src.retriever import BM25Retriever, ChromaRetriever, HybridRetriever
+from src.answer_cache import AnswerCache, answer_key
+from src.batching import QueryBatcher
+from src.index_pack import import_store
+from src.sharding import ShardRouter, ShardedRetriever
+from src.tracing import Tracer, span
 
 # ========= CONFIG =========
 load_dotenv()
+log = logging.getLogger(__name__)
 
 DATA_DIR = "data/raw"
 PERSIST_DIR = "vectorstore"
 COLLECTION = "kb"
+EMBED_MODEL = "text-embedding-3-small"
+EMBED_CACHE_DIR = os.getenv("EMBED_CACHE_DIR", "vectorstore/embed_cache")
+EMBED_WORKERS = int(os.getenv("EMBED_WORKERS", "4"))
+RETRIEVER = os.getenv("RETRIEVER", "dense")  # "dense" | "bm25" | "hybrid" (BM25-індекс будується лише для двох останніх)
+SHARD_RULES = os.getenv("SHARD_RULES", f"*->{COLLECTION}")  # напр. "dir=en*->kb_en; dir=bio*->kb_bio; *->kb"
+QUERY_SHARDS = os.getenv("QUERY_SHARDS", "")                # шарди для пошуку через кому; "" — усі
+SHARD_DEADLINE_MS = float(os.getenv("SHARD_DEADLINE_MS", "1000"))  # повільний шард пропускається
+INDEX_PACK = os.getenv("INDEX_PACK", "")  # .ragpack (src/index_pack.py): при порожньому індексі — імпорт на старті
+CHAT_MODEL = "gpt-4o-mini"
+LLM_PROVIDER = os.getenv("LLM_PROVIDER", "openai")  # "openai" | "ollama" (генерація через src.llm, async)
+OLLAMA_MODEL = os.getenv("OLLAMA_MODEL", "llama3.1")
+OLLAMA_BASE_URL = os.getenv("OLLAMA_BASE_URL", "http://localhost:11434")
+GEN_MODEL = OLLAMA_MODEL if LLM_PROVIDER == "ollama" else CHAT_MODEL
+PROMPT_VERSION = "1"  # змінювати при правках build_messages (ключ кешу відповідей)
+LLM_CONCURRENCY = int(os.getenv("LLM_CONCURRENCY", "16"))   # одночасних генерацій
+REQUEST_TIMEOUT = float(os.getenv("REQUEST_TIMEOUT", "60"))  # с на одну генерацію
+HTTP_POOL_SIZE = int(os.getenv("HTTP_POOL_SIZE", "64"))      # keep-alive з'єднань до OpenAI / Ollama
+CHUNK_TOKENS = int(os.getenv("CHUNK_TOKENS", "200"))        # розмір чанка в словах+знаках
+CHUNK_OVERLAP_TOKENS = int(os.getenv("CHUNK_OVERLAP_TOKENS", "32"))
+CONTEXT_TOKENS = int(os.getenv("CONTEXT_TOKENS", "1500"))    # бюджет контексту в промпті (tiktoken, без нього — ≈); 0 — усі чанки
+DEDUP_THRESHOLD = float(os.getenv("DEDUP_THRESHOLD", "0.9"))  # 1 — лише точні копії; 0 — вимкнено
+QUERY_BATCH_MS = float(os.getenv("QUERY_BATCH_MS", "10"))   # вікно мікробатчингу запитів; 0 — вимкнено
+QUERY_BATCH_MAX = int(os.getenv("QUERY_BATCH_MAX", "32"))
+BATCH_MAX = int(os.getenv("BATCH_MAX", "500"))                # запитань в одному /api/chat/batch
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "4"))  # генерацій одного пакета одночасно (з LLM_CONCURRENCY)
+LLM_RETRIES = int(os.getenv("LLM_RETRIES", "2"))              # повтори 429/5xx/таймаутів у клієнті LLM
+MEMORY_TURNS = int(os.getenv("MEMORY_TURNS", "3"))          # останніх реплік сесії дослівно
+MEMORY_TOKENS = int(os.getenv("MEMORY_TOKENS", "600"))       # бюджет цих реплік; старіші — у підсумок
+SUMMARY_TOKENS = int(os.getenv("SUMMARY_TOKENS", "300"))
+SESSION_TTL = float(os.getenv("SESSION_TTL", "3600"))
+TRACING = os.getenv("TRACING", "1") == "1"  # заміри етапів: /metrics + "timings" у відповідях
 
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY", "")
 if not OPENAI_API_KEY:
     raise RuntimeError("Не знайдено OPENAI_API_KEY. Створи .env і додай ключ.")
 
-client = OpenAI(api_key=OPENAI_API_KEY)
+# sync-клієнт — для ембеддінгів (викликається з потоків), async — для генерації;
+# обидва тримають пул keep-alive з'єднань. openai/chromadb імпортуються ліниво
+# (src.registry): старт процесу не чекає на них, а warm_up() вантажить у фоні.
+def _build_client():
+    from openai import OpenAI
+    return OpenAI(api_key=OPENAI_API_KEY, timeout=REQUEST_TIMEOUT, max_retries=LLM_RETRIES)
+
+def _build_aclient():
+    import httpx
+    from openai import AsyncOpenAI
+    return AsyncOpenAI(
+        api_key=OPENAI_API_KEY,
+        timeout=REQUEST_TIMEOUT,
+        max_retries=LLM_RETRIES,
+        http_client=httpx.AsyncClient(
+            limits=httpx.Limits(max_connections=HTTP_POOL_SIZE, max_keepalive_connections=HTTP_POOL_SIZE),
+            timeout=REQUEST_TIMEOUT,
+        ),
+    )
+
+def _build_llm():
+    from src.llm import LLM, LLMConfig
+    return LLM(LLMConfig(provider="ollama", model=OLLAMA_MODEL, base_url=OLLAMA_BASE_URL,
+                         timeout=REQUEST_TIMEOUT, max_connections=HTTP_POOL_SIZE, retries=LLM_RETRIES))
+
+def client():
+    return registry.get("openai", _build_client, "openai")
+
+async def allm():
+    # LLM_PROVIDER=ollama: пул keep-alive з'єднань httpx.AsyncClient усередині LLM
+    return await registry.aget("llm", _build_llm, "llm")
+
+async def aclient():
+    # з async-обробників: поки warm_up ще імпортує openai/httpx — чекаємо, не блокуючи event loop
+    return await registry.aget("openai_async", _build_aclient, "openai_async")
+
+def chroma():
+    return chroma_client(PERSIST_DIR)
+
+def warm_up():
+    registry.warm("openai", _build_client, "openai")
+    if LLM_PROVIDER == "ollama":
+        registry.warm("llm", _build_llm, "llm")
+    else:
+        registry.warm("openai_async", _build_aclient, "openai_async")
+    chroma_client(PERSIST_DIR, background=True)
+    registry.warm("vector_store", _build_store, "vector_store")
+
+llm_slots = asyncio.Semaphore(LLM_CONCURRENCY)
+reindex_lock = asyncio.Lock()
+tracer = Tracer(enabled=TRACING)
+sessions = SessionStore(
+    max_sessions=int(os.getenv("MAX_SESSIONS", "1000")),
+    ttl=SESSION_TTL,
+    recent_turns=MEMORY_TURNS,
+    recent_tokens=MEMORY_TOKENS,
+    summary_tokens=SUMMARY_TOKENS,
+)
 
 app = FastAPI(title="BioConsult RAG API")
 
+@app.on_event("startup")
+async def _warm_up():
+    warm_up()
+    if INDEX_PACK:
+        async with reindex_lock:
+            await run_in_threadpool(load_index_pack)
+
+@app.on_event("shutdown")
+async def _close_clients():
+    ac = registry.peek("openai_async")
+    if ac is not None:
+        await ac.close()
+    llm = registry.peek("llm")
+    if llm is not None:
+        await llm.aclose()
+
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],  # для тестів, потім краще звузити
@@ -32,106 +155,242 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-chroma = chromadb.PersistentClient(
-    path=PERSIST_DIR,
-    settings=Settings(anonymized_telemetry=False)
-)
-
 # ========= Utils =========
 def ensure_dirs():
     os.makedirs(DATA_DIR, exist_ok=True)
     os.makedirs(PERSIST_DIR, exist_ok=True)
 
-def get_collection():
-    return chroma.get_or_create_collection(COLLECTION)
+def _build_store():
+    router = ShardRouter(SHARD_RULES)
+    if len(router.shards) == 1:
+        return ChromaRetriever(PERSIST_DIR, router.default)
+    return ShardedRetriever(
+        {name: ChromaRetriever(PERSIST_DIR, name) for name in router.shards},
+        router,
+        query_shards=[s.strip() for s in QUERY_SHARDS.split(",") if s.strip()],
+        deadline_ms=SHARD_DEADLINE_MS,
+    )
+
+def store():
+    """Векторне сховище: одна колекція або шарди за SHARD_RULES (src/sharding.py)."""
+    return registry.get("vector_store", _build_store, "vector_store")
 
-def read_raw_texts() -> List[Dict]:
+def raw_text_paths() -> List[Path]:
     ensure_dirs()
-    docs = []
-    for fn in os.listdir(DATA_DIR):
-        if fn.lower().endswith((".txt", ".md")):
-            path = os.path.join(DATA_DIR, fn)
-            with open(path, "r", encoding="utf-8", errors="ignore") as f:
-                docs.append({"id": fn, "title": fn, "text": f.read()})
-    return docs
-
-def chunk_text(text: str, chunk_size: int = 900, overlap: int = 120) -> List[str]:
-    clean = " ".join((text or "").split())
-    if not clean:
-        return []
-    out = []
-    i = 0
-    while i < len(clean):
-        end = min(len(clean), i + chunk_size)
-        out.append(clean[i:end])
-        i = max(0, end - overlap)
-        if end == len(clean):
-            break
-    return out
+    # з підтеками (data/raw/<курс>/...) — для правил SHARD_RULES за dir
+    return sorted(p for p in Path(DATA_DIR).rglob("*") if p.is_file() and p.suffix.lower() in (".txt", ".md"))
 
-def embed_texts(texts: List[str]) -> List[List[float]]:
-    resp = client.embeddings.create(
-        model="text-embedding-3-small",
+embed_cache = EmbeddingCache(EMBED_CACHE_DIR, EMBED_MODEL) if EMBED_CACHE_DIR else None
+
+def _embed_api(texts: List[str]) -> List[List[float]]:
+    resp = client().embeddings.create(
+        model=EMBED_MODEL,
         input=texts
     )
     return [d.embedding for d in resp.data]
 
+def embed_texts(texts: List[str]) -> List[List[float]]:
+    if embed_cache is None:
+        return _embed_api(texts)
+    return embed_cache.embed(texts, _embed_api).tolist()
+
+# одночасні запитання -> один запит до embeddings API
+query_batcher = QueryBatcher(embed_texts, max_batch=QUERY_BATCH_MAX, max_wait_ms=QUERY_BATCH_MS) if QUERY_BATCH_MS > 0 else None
+
+def embed_query(question: str) -> List[float]:
+    with span("embed"):
+        if query_batcher is None:
+            return embed_texts([question])[0]
+        return query_batcher.embed(question)
+
 # ========= RAG =========
-def rebuild_index() -> Dict:
+def rebuild_index(incremental: bool = True) -> Dict:
+    """
+    incremental=True — ембедимо лише нові/змінені файли (за маніфестом),
+    чанки видалених файлів прибираємо. Інакше колекція пересоздається.
+    """
     ensure_dirs()
+    manifest = IndexManifest.load(manifest_path(PERSIST_DIR, COLLECTION))
+
+    # маніфест, дедуп і BM25 — спільні для всіх шардів (за COLLECTION)
+    vs = store()
+    if not incremental:
+        # пересоздаємо колекції
+        vs.clear()
+        manifest.reset()
+        if dedup is not None:
+            dedup.clear()
+
+    changes, removed = manifest.diff(raw_text_paths())
+    stats = {"added": 0, "updated": 0, "deleted": 0, "skipped": 0, "duplicates": 0}
+
+    if dedup is not None:
+        # дублікати з незмінених файлів трималися на чанках змінених/видалених — переіндексуємо і їх
+        affected = dedup.release([str(ch.path) for ch in changes if ch.status != "skipped"] + removed)
+        changes = [
+            dataclasses.replace(ch, status="updated") if ch.status == "skipped" and str(ch.path) in affected else ch
+            for ch in changes
+        ]
+        dup0 = dedup.duplicates
 
-    # пересоздаємо колекцію
     try:
-        chroma.delete_collection(COLLECTION)
-    except Exception:
-        pass
-    col = chroma.get_or_create_collection(COLLECTION)
-
-    docs = read_raw_texts()
-    ids, metadatas, texts = [], [], []
-
-    for d in docs:
-        parts = chunk_text(d["text"])
-        for i, p in enumerate(parts):
-            ids.append(f"{d['id']}#{i}")
-            metadatas.append({"title": d["title"], "chunk": i})
-            texts.append(p)
-
-    if not texts:
-        return {"ok": True, "chunks": 0, "message": "Немає .txt/.md у data/raw"}
-
-    batch = 64
-    for start in range(0, len(texts), batch):
-        sub_texts = texts[start:start + batch]
-        sub_ids = ids[start:start + batch]
-        sub_meta = metadatas[start:start + batch]
-        sub_emb = embed_texts(sub_texts)
-
-        col.add(
-            ids=sub_ids,
-            documents=sub_texts,
-            metadatas=sub_meta,
-            embeddings=sub_emb
-        )
+        for key in removed:
+            vs.delete_ids(manifest.chunk_ids(key))
+            manifest.forget(key)
+            stats["deleted"] += 1
+
+        def doc_batches():
+            for ch in changes:
+                if ch.status == "skipped":
+                    manifest.touch(ch)
+                    stats["skipped"] += 1
+                    continue
+
+                with open(ch.path, "r", encoding="utf-8", errors="ignore") as f:
+                    parts = chunk_text(f.read(), ch.path.name, max_tokens=CHUNK_TOKENS, overlap_tokens=CHUNK_OVERLAP_TOKENS)
+
+                rel = ch.path.relative_to(DATA_DIR)
+                meta = {"title": ch.path.name}
+                if rel.parent.as_posix() != ".":
+                    meta["dir"] = rel.parent.as_posix()  # для правил SHARD_RULES
+                items = [
+                    {
+                        "id": f"{rel.as_posix()}#{i}",
+                        "text": p.text,
+                        "meta": {**meta, "chunk": i, "start": p.meta["start"], "end": p.meta["end"]}
+                    }
+                    for i, p in enumerate(parts)
+                ]
+                if dedup is not None:
+                    items = dedup.filter(str(ch.path), items)
+
+                keep = {it["id"] for it in items}
+                vs.delete_ids([i for i in manifest.chunk_ids(str(ch.path)) if i not in keep])
+
+                manifest.record(ch, [it["id"] for it in items])
+                stats[ch.status] += 1
+                yield items
+
+        # OpenAI-ембеддінги — мережеві, тож кілька запитів у польоті одночасно
+        indexer = StagedIndexer(embed_fn=embed_texts, write_fn=vs.upsert, batch_size=64, embed_workers=EMBED_WORKERS)
+        done = indexer.run(doc_batches(), docs_total=len(changes))
+
+        manifest.save()
+        if dedup is not None:
+            dedup.save()
+            stats["duplicates"] = dedup.duplicates - dup0
+    except BaseException:
+        # release() уже змінив стан дедупу в пам'яті — повертаємо збережений з диска
+        if dedup is not None:
+            dedup.reload()
+        raise
+
+    if embed_cache is not None:
+        embed_cache.flush()  # у робочому режимі кеш дописується пачками (див. EmbeddingCache)
+    if RETRIEVER in ("bm25", "hybrid"):
+        bm25.build(sorted(vs.all_chunks(), key=lambda c: c["id"]))
+        bm25.save()
+    answer_cache.invalidate()
+
+    if not manifest.files:
+        return {"ok": True, "chunks": 0, **stats, "message": "Немає .txt/.md у data/raw"}
+    return {"ok": True, "chunks": done.chunks_written, **stats, "seconds": round(done.elapsed, 2)}
+
+def load_index_pack(path: str = "", force: bool = False) -> Dict:
+    """
+    Індекс із .ragpack замість ембеддингу data/raw: новий вузол готовий за секунди.
+    Без force — лише якщо маніфест порожній (вже проіндексований вузол не чіпаємо).
+    """
+    path = path or INDEX_PACK
+    manifest = IndexManifest.load(manifest_path(PERSIST_DIR, COLLECTION))
+    if manifest.files and not force:
+        return {"ok": True, "skipped": "index not empty"}
+    if not Path(path).exists():
+        return {"ok": False, "error": f"{path} не знайдено"}
+    ensure_dirs()
+    out = import_store(
+        store(), path, embed_model=EMBED_MODEL, manifest=manifest, raw_dir=DATA_DIR,
+        bm25=bm25 if RETRIEVER in ("bm25", "hybrid") else None, dedup=dedup,
+    )
+    answer_cache.invalidate()
+    return {"ok": True, **out}
 
-    return {"ok": True, "chunks": len(texts)}
+def _dense_retrieve(question: str, k: int) -> List[Dict]:
+    # ембеддінг запиту — один раз; шарди (якщо є) опитуються паралельно (span vector_search — у store)
+    return store().query_vectors([embed_query(question)], k)[0]
 
-def retrieve(question: str, k: int = 6) -> List[Dict]:
-    col = get_collection()
+def _dense_retrieve_batch(questions: List[str], k: int) -> List[List[Dict]]:
+    # один запит до embeddings API і один collection.query на весь пакет
+    if not questions:
+        return []
+    with span("embed"):
+        q_embs = embed_texts(questions)
+    return store().query_vectors(q_embs, k)
+
+answer_cache = AnswerCache(
+    max_entries=int(os.getenv("ANSWER_CACHE_SIZE", "512")),
+    ttl=float(os.getenv("ANSWER_CACHE_TTL", "3600")),
+    similarity=float(os.getenv("ANSWER_CACHE_SIMILARITY", "0")),
+)
 
-    q_emb = embed_texts([question])[0]
-    res = col.query(query_embeddings=[q_emb], n_results=k)
+bm25 = BM25Retriever(persist_dir=PERSIST_DIR, collection_name=COLLECTION)
+bm25.load()
 
-    docs = res.get("documents", [[]])[0]
-    metas = res.get("metadatas", [[]])[0]
+dedup = ChunkDeduper(PERSIST_DIR, COLLECTION, threshold=DEDUP_THRESHOLD) if DEDUP_THRESHOLD > 0 else None
+if dedup is not None:
+    dedup.load()
+hybrid = HybridRetriever(_dense_retrieve, bm25, dense_batch=_dense_retrieve_batch)
 
-    out = []
-    for doc, meta in zip(docs, metas):
-        out.append({"title": meta.get("title", "kb"), "text": doc})
-    return out
+def _contexts(hits: List[Dict]) -> List[Dict]:
+    return [{"id": h["id"], "title": h["meta"].get("title", "kb"), "text": h["text"], "meta": h["meta"],
+             "embedding": h.get("embedding")} for h in hits]
+
+def retrieve(question: str, k: int = 6) -> List[Dict]:
+    if RETRIEVER == "bm25":
+        hits = bm25.query(question, k)
+    elif RETRIEVER == "hybrid" and len(bm25):
+        hits = hybrid.query(question, k)
+    else:
+        hits = _dense_retrieve(question, k)
+    return _contexts(hits)
+
+def retrieve_batch(questions: List[str], k: int = 6) -> List[List[Dict]]:
+    if RETRIEVER == "bm25":
+        found = bm25.query_batch(questions, k)
+    elif RETRIEVER == "hybrid" and len(bm25):
+        found = hybrid.query_batch(questions, k)
+    else:
+        found = _dense_retrieve_batch(questions, k)
+    return [_contexts(hits) for hits in found]
+
+# токени CHAT_MODEL: точно через tiktoken (якщо встановлено), інакше — оцінка за довжиною
+# (для Ollama це лише наближення — токенізатор інший)
+count_tokens = tiktoken_counter(CHAT_MODEL)
+if count_tokens is None:
+    log.warning("tiktoken недоступний: бюджет контексту (CONTEXT_TOKENS) рахується наближено, за довжиною тексту")
+    count_tokens = estimate_tokens
+
+def pack(contexts: List[Dict]):
+    # MMR по ембеддінгах чанків зі сховища; embeddings API — лише для чанків без них (BM25)
+    # і лише з кешем ембеддінгів (там вони з індексації); інакше — Жаккар
+    with span("prompt"):
+        return pack_context(contexts, CONTEXT_TOKENS, embed_fn=embed_texts if embed_cache is not None else None,
+                            count_tokens=count_tokens)
 
 # ========= Prompt (ВАЖЛИВО: fallback якщо контексту нема) =========
-def build_messages(question: str, contexts: List[Dict]) -> List[Dict]:
+def _with_history(messages: List[Dict], conv: Optional[Conversation]) -> List[Dict]:
+    """Підсумок старіших реплік + останні репліки сесії між system і поточним запитанням."""
+    if conv is None:
+        return messages
+    extra = []
+    if conv.summary:
+        extra.append({"role": "system", "content": "Коротко про попередню розмову:\n" + conv.summary_text()})
+    return messages[:1] + extra + conv.history() + messages[1:]
+
+def build_messages(question: str, contexts: List[Dict], conv: Optional[Conversation] = None) -> List[Dict]:
+    return _with_history(_build_messages(question, contexts), conv)
+
+def _build_messages(question: str, contexts: List[Dict]) -> List[Dict]:
     if contexts:
         context_block = "\n\n".join(
             [f"[{i+1}] ({c['title']}) {c['text']}" for i, c in enumerate(contexts)]
@@ -176,33 +435,362 @@ class ChatIn(BaseModel):
     question: str
     rag: bool = True
     top_k: int = 6
+    session_id: Optional[str] = None  # багатоходова розмова (уточнення + підсумок попередніх реплік)
 
 class ChatOut(BaseModel):
     answer: str
     used_contexts: int
+    cached: bool = False
+    context: Optional[Dict] = None  # PackStats: tokens_in / tokens_out / saved ...
+    timings: Optional[Dict[str, float]] = None  # retrieve_ms / embed_ms / generate_ms / total_ms ... (TRACING=1)
+    session: Optional[Dict] = None  # запит, з яким шукали, і розмір пам'яті сесії
+
+class BatchIn(BaseModel):
+    questions: List[str]
+    ids: Optional[List[str]] = None  # повертаються в рядках відповіді (для повтору невдалих)
+    rag: bool = True
+    top_k: int = 6
+    ordered: bool = True             # False — рядки в міру готовності
 
 @app.get("/api/health")
 def health():
+    # ready=False — моделі/клієнти ще вантажаться у фоні (запити тим часом просто почекають)
+    out = {"ok": True, "ready": registry.ready(), "components": registry.status(), "answer_cache": answer_cache.stats()}
+    if embed_cache is not None:
+        out["embed_cache"] = embed_cache.stats()
+    if query_batcher is not None:
+        out["query_batcher"] = query_batcher.stats()
+    vs = registry.peek("vector_store")
+    if isinstance(vs, ShardedRetriever):
+        out["shards"] = vs.stats()
+    return out
+
+@app.get("/metrics")
+def metrics():
+    # формат експозиції Prometheus; гістограми етапів + лічильники токенів/чанків/запитів
+    return PlainTextResponse(tracer.render(), media_type="text/plain; version=0.0.4")
+
+@app.delete("/api/chat/session/{session_id}")
+def reset_session(session_id: str):
+    sessions.reset(session_id)
     return {"ok": True}
 
 @app.post("/api/reindex")
-def reindex():
-    return rebuild_index()
+async def reindex(full: bool = False):
+    # Chroma + ембеддінги — блокуючі, тож у пул потоків; одночасно лише одна переіндексація
+    async with reindex_lock:
+        return await run_in_threadpool(rebuild_index, incremental=not full)
+
+@app.post("/api/index/import")
+async def import_index(force: bool = False):
+    # файл — INDEX_PACK на вузлі (довільні шляхи ззовні не приймаємо); force — замінити й непорожній індекс
+    if not INDEX_PACK:
+        raise HTTPException(400, "INDEX_PACK не задано")
+    async with reindex_lock:
+        return await run_in_threadpool(load_index_pack, INDEX_PACK, force)
+
+T = TypeVar("T")
+
+async def _until_disconnect(request: Request, work: Awaitable[T]) -> T:
+    """Чекає на work із таймаутом; якщо клієнт відключився — скасовує її."""
+    task = asyncio.ensure_future(asyncio.wait_for(work, REQUEST_TIMEOUT))
+    try:
+        while True:
+            done, _ = await asyncio.wait({task}, timeout=0.25)
+            if done:
+                return task.result()
+            if await request.is_disconnected():
+                task.cancel()
+                raise HTTPException(status_code=499, detail="Client disconnected")
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=504, detail="LLM timeout")
+    finally:
+        if not task.done():
+            task.cancel()
+
+def _cache_tag(payload) -> str:
+    # простір пошуку майже-дублікатів: відповідь без RAG чи з іншим top_k — інша відповідь
+    return f"{GEN_MODEL}:rag={payload.rag}:k={payload.top_k}"
+
+def _lookup(question: str, payload: ChatIn, conv: Optional[Conversation] = None):
+    """
+    Кеш + retrieval: (готова відповідь або None, контексти, ключ кешу, ембеддінг запиту).
+    Історія сесії (conv) входить у ключ; для таких відповідей пошук майже-дублікатів вимкнено.
+    """
+    history = conv.digest() if conv is not None else ""
+    q_emb = None
+    if answer_cache.similarity > 0 and not history:
+        q_emb = embed_query(question)
+        hit = answer_cache.get_similar(q_emb, _cache_tag(payload))
+        if hit is not None:
+            return hit, [], "", q_emb
+
+    with span("retrieve"):
+        contexts = retrieve(question, payload.top_k) if payload.rag else []
+    key = answer_key(question, [c["id"] for c in contexts], GEN_MODEL, PROMPT_VERSION, history)
+    return answer_cache.get(key), contexts, key, q_emb
+
+def _lookup_batch(questions: List[str], payload: BatchIn) -> List[tuple]:
+    """_lookup() для пакета: один запит ембеддінгів і один collection.query на промахи кешу."""
+    out: List[Any] = [None] * len(questions)
+    q_embs: List[Any] = [None] * len(questions)
+    if answer_cache.similarity > 0:
+        q_embs = embed_texts(questions)
+        for i, q_emb in enumerate(q_embs):
+            hit = answer_cache.get_similar(q_emb, _cache_tag(payload))
+            if hit is not None:
+                out[i] = (hit, [], "", q_emb)
+
+    todo = [i for i in range(len(questions)) if out[i] is None]
+    found = retrieve_batch([questions[i] for i in todo], payload.top_k) if payload.rag else [[] for _ in todo]
+    for i, contexts in zip(todo, found):
+        key = answer_key(questions[i], [c["id"] for c in contexts], GEN_MODEL, PROMPT_VERSION)
+        out[i] = (answer_cache.get(key), contexts, key, q_embs[i])
+    return out
+
+def _session(question: str, payload: ChatIn):
+    """(Conversation або None, запит для пошуку): уточнення доповнюються темою попереднього запиту."""
+    if not payload.session_id:
+        return None, question
+    conv = sessions.get(payload.session_id)
+    return conv, conv.rewrite(question)
+
+def _session_info(conv: Optional[Conversation], query: str) -> Optional[Dict]:
+    return {"query": query, **conv.stats()} if conv is not None else None
+
+def _sources(contexts: List[Dict]) -> List[Dict]:
+    out = []
+    for i, c in enumerate(contexts, start=1):
+        src = {"n": i, "title": c["title"]}
+        also = dedup.also(c["id"]) if dedup is not None else []
+        if also:
+            src["also"] = [Path(k).name for k in also]
+        out.append(src)
+    return out
+
+def _remember(key: str, answer: str, contexts: List[Dict], q_emb, tag: str):
+    if answer:
+        value = {"answer": answer, "used_contexts": len(contexts), "sources": _sources(contexts)}
+        answer_cache.put(key, value, tag, q_emb=q_emb)
+
+def _count(question: str, messages: List[Dict], answer: str, contexts: List[Dict], cached: bool, usage=None):
+    tracer.inc("requests_total", cached=str(cached).lower())
+    if cached:
+        return
+    if usage is not None:
+        tin, tout = usage.prompt_tokens, usage.completion_tokens
+    else:
+        # стрім без usage / Ollama — оцінка
+        tin = sum(count_tokens(m["content"]) for m in messages)
+        tout = count_tokens(answer)
+    tracer.inc("tokens_in_total", tin)
+    tracer.inc("tokens_out_total", tout)
+    tracer.inc("context_chunks_total", len(contexts))
+
+async def _complete(messages: List[Dict]):
+    """(відповідь, usage або None) — від OpenAI або, з LLM_PROVIDER=ollama, від src.llm."""
+    async with llm_slots:
+        with span("generate"):
+            if LLM_PROVIDER == "ollama":
+                return await (await allm()).agenerate(messages=messages), None
+            resp = await (await aclient()).chat.completions.create(
+                model=CHAT_MODEL,
+                messages=messages,
+                temperature=0.4
+            )
+            return (resp.choices[0].message.content or "").strip(), getattr(resp, "usage", None)
+
+async def _stream(messages: List[Dict], meta: Dict) -> AsyncIterator[str]:
+    """Шматки відповіді; meta["usage"] — usage OpenAI (приходить останнім чанком)."""
+    if LLM_PROVIDER == "ollama":
+        async for piece in (await allm()).astream(messages=messages):
+            yield piece
+        return
+    stream = await (await aclient()).chat.completions.create(
+        model=CHAT_MODEL,
+        messages=messages,
+        temperature=0.4,
+        stream=True,
+        stream_options={"include_usage": True}
+    )
+    async with stream:
+        async for chunk in stream:
+            meta["usage"] = getattr(chunk, "usage", None) or meta.get("usage")  # останній чанк: usage без choices
+            delta = chunk.choices[0].delta.content if chunk.choices else None
+            if delta:
+                yield delta
+
+def _sse(event: str, data: Dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
 
 @app.post("/api/chat", response_model=ChatOut)
-def chat(payload: ChatIn):
+async def chat(payload: ChatIn, request: Request):
     question = (payload.question or "").strip()
     if not question:
         return ChatOut(answer="Напиши запитання 🙂", used_contexts=0)
 
-    contexts = retrieve(question, payload.top_k) if payload.rag else []
-    messages = build_messages(question, contexts)
+    conv, query = _session(question, payload)
+    # run_in_threadpool копіює контекст, тож span() у потоках пишуть у ту саму трасу
+    with tracer.trace() as tr:
+        hit, contexts, key, q_emb = await run_in_threadpool(_lookup, query, payload, conv)
+        if hit is not None:
+            _count(question, [], hit["answer"], [], True)
+            out = ChatOut(**hit, cached=True)
+        else:
+            contexts, packed = await run_in_threadpool(pack, contexts)
+            messages = build_messages(question, contexts, conv)
+            answer, usage = await _until_disconnect(request, _complete(messages))
+
+            _remember(key, answer, contexts, q_emb, _cache_tag(payload))
+            _count(question, messages, answer, contexts, False, usage)
+            out = ChatOut(answer=answer, used_contexts=len(contexts), context=packed.to_dict())
+    if conv is not None:
+        conv.add(question, out.answer, query)
+        out.session = _session_info(conv, query)
+    if tr is not None:
+        out.timings = tr.timings()
+    return out
 
-    resp = client.chat.completions.create(
-        model="gpt-4o-mini",
-        messages=messages,
-        temperature=0.4
+@app.post("/api/chat/stream")
+async def chat_stream(payload: ChatIn):
+    """
+    SSE-потік: спершу `sources`, далі `token` (шматки відповіді), наприкінці `done`.
+    У разі помилки — `error`. Якщо клієнт відключився, Starlette скасовує генератор
+    і з'єднання з OpenAI / Ollama закривається.
+    """
+    question = (payload.question or "").strip()
+
+    async def events():
+        if not question:
+            yield _sse("sources", {"sources": [], "cached": False})
+            yield _sse("token", {"text": "Напиши запитання 🙂"})
+            yield _sse("done", {"answer": "Напиши запитання 🙂", "used_contexts": 0})
+            return
+
+        try:
+            conv, query = _session(question, payload)
+            # траса активна лише до першого yield; генерація міряється вручну
+            with tracer.trace(finish=False) as tr:
+                hit, contexts, key, q_emb = await run_in_threadpool(_lookup, query, payload, conv)
+                if hit is None:
+                    contexts, packed = await run_in_threadpool(pack, contexts)
+            extra = {}  # timings / session у done
+
+            if hit is not None:
+                _count(question, [], hit["answer"], [], True)
+                if conv is not None:
+                    conv.add(question, hit["answer"], query)
+                    extra["session"] = _session_info(conv, query)
+                if tr is not None:
+                    tr.finish()
+                    extra["timings"] = tr.timings()
+                yield _sse("sources", {"sources": hit.get("sources", []), "cached": True})
+                yield _sse("token", {"text": hit["answer"]})
+                yield _sse("done", {"answer": hit["answer"], "used_contexts": hit["used_contexts"], **extra})
+                return
+
+            yield _sse("sources", {"sources": _sources(contexts), "cached": False})
+
+            parts, meta = [], {}
+            messages = build_messages(question, contexts, conv)
+            loop = asyncio.get_running_loop()
+            deadline = loop.time() + REQUEST_TIMEOUT
+            async with llm_slots:
+                t0 = loop.time()
+                pieces = _stream(messages, meta)
+                try:
+                    async for delta in pieces:
+                        if loop.time() > deadline:
+                            raise TimeoutError("LLM timeout")
+                        if tr is not None and not parts:
+                            tr.add("first_token", loop.time() - t0)
+                        parts.append(delta)
+                        yield _sse("token", {"text": delta})
+                finally:
+                    await pieces.aclose()
+                if tr is not None:
+                    tr.add("generate", loop.time() - t0)
+
+            answer = "".join(parts).strip()
+            _remember(key, answer, contexts, q_emb, _cache_tag(payload))
+            _count(question, messages, answer, contexts, False, meta.get("usage"))
+            if conv is not None:
+                conv.add(question, answer, query)
+                extra["session"] = _session_info(conv, query)
+            if tr is not None:
+                tr.finish()
+                extra["timings"] = tr.timings()
+            yield _sse("done", {"answer": answer, "used_contexts": len(contexts), "context": packed.to_dict(), **extra})
+        except Exception as e:
+            yield _sse("error", {"message": str(e)})
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
     )
 
-    answer = (resp.choices[0].message.content or "").strip()
-    return ChatOut(answer=answer, used_contexts=len(contexts))
+async def _answer_item(question: str, lookup: tuple, slots: asyncio.Semaphore, tag: str) -> Dict:
+    hit, contexts, key, q_emb = lookup
+    if hit is not None:
+        _count(question, [], hit["answer"], [], True)
+        return {"ok": True, **hit, "cached": True}
+
+    async with slots:
+        contexts, packed = await run_in_threadpool(pack, contexts)
+        messages = build_messages(question, contexts)
+        # 429/5xx клієнт LLM уже повторює сам (LLM_RETRIES) — тут лише фіксуємо невдачу
+        try:
+            answer, usage = await asyncio.wait_for(_complete(messages), REQUEST_TIMEOUT)
+        except Exception as e:
+            return {"ok": False, "error": str(e) or type(e).__name__}
+
+    _remember(key, answer, contexts, q_emb, tag)
+    _count(question, messages, answer, contexts, False, usage)
+    return {"ok": True, "answer": answer, "used_contexts": len(contexts), "sources": _sources(contexts),
+            "cached": False, "context": packed.to_dict()}
+
+@app.post("/api/chat/batch")
+async def chat_batch(payload: BatchIn):
+    """
+    NDJSON-потік: по рядку на запитання {"i", "id", "question", "ok", "answer", ...}
+    або {"ok": false, "error"} — невдалі можна надіслати ще раз (з тими самими ids).
+    Усі запитання ембедяться одним запитом, пошук — одним collection.query;
+    генерації — не більше BATCH_CONCURRENCY одночасно (і в межах загального LLM_CONCURRENCY).
+    """
+    questions = [(q or "").strip() for q in payload.questions]
+    if len(questions) > BATCH_MAX:
+        raise HTTPException(status_code=413, detail=f"Не більше {BATCH_MAX} запитань у пакеті")
+    if payload.ids is not None and len(payload.ids) != len(questions):
+        raise HTTPException(status_code=422, detail="ids і questions мають бути однакової довжини")
+    ids = payload.ids or [str(i) for i in range(len(questions))]
+
+    async def lines():
+        asked = [i for i, q in enumerate(questions) if q]
+        try:
+            lookups = await run_in_threadpool(_lookup_batch, [questions[i] for i in asked], payload)
+        except Exception as e:
+            # пошук упав для всього пакета — кожен рядок невдалий, пакет можна повторити
+            lookups = [e] * len(asked)
+
+        slots = asyncio.Semaphore(max(1, BATCH_CONCURRENCY))
+
+        async def one(i: int, lookup) -> Dict:
+            base = {"i": i, "id": ids[i], "question": questions[i]}
+            if not questions[i]:
+                return {**base, "ok": False, "error": "Порожнє запитання"}
+            if isinstance(lookup, Exception):
+                return {**base, "ok": False, "error": str(lookup) or type(lookup).__name__}
+            return {**base, **await _answer_item(questions[i], lookup, slots, _cache_tag(payload))}
+
+        by_index = dict(zip(asked, lookups))
+        tasks = [asyncio.ensure_future(one(i, by_index.get(i))) for i in range(len(questions))]
+        try:
+            for fut in (tasks if payload.ordered else asyncio.as_completed(tasks)):
+                yield json.dumps(await fut, ensure_ascii=False) + "\n"
+        finally:
+            # клієнт відключився — генерації, що лишились, скасовуються
+            for t in tasks:
+                t.cancel()
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
@@ -0,0 +1,198 @@
+from __future__ import annotations
+from concurrent.futures import ThreadPoolExecutor, wait
+from fnmatch import fnmatchcase
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+import heapq
+import threading
+
+from src.embeddings import EmbeddingModel
+from src.tracing import span
+
+class ShardRouter:
+    """
+    Правила розподілу чанків по шардах (колекціях) за метаданими:
+
+        "dir=en*->kb_en; dir=biology*->kb_bio; source=*_uk.*->kb_uk; *->kb"
+
+    Правило — "<поле>=<glob>-><шард>" (fnmatch, з урахуванням регістру) або "*-><шард>";
+    перше, що збіглося, виграє. Останнім має бути правило за замовчуванням "*-><шард>".
+    Поля — з meta чанка: source (ім'я файлу), dir (тека відносно raw_dir), page, ...
+    """
+
+    def __init__(self, rules: str):
+        self.rules: List[Tuple[Optional[str], str, str]] = []
+        self.default = ""
+        for part in rules.replace("\n", ";").split(";"):
+            part = part.strip()
+            if not part:
+                continue
+            cond, arrow, shard = part.partition("->")
+            cond, shard = cond.strip(), shard.strip()
+            if not arrow or not shard:
+                raise ValueError(f"Bad shard rule: {part!r} (expected 'field=glob->shard')")
+            if cond == "*":
+                self.default = shard
+                break
+            field, eq, pattern = cond.partition("=")
+            if not eq or not field.strip():
+                raise ValueError(f"Bad shard rule: {part!r} (expected 'field=glob->shard')")
+            self.rules.append((field.strip(), pattern.strip(), shard))
+        if not self.default:
+            raise ValueError(f"Shard rules need a default '*->shard': {rules!r}")
+
+    @property
+    def shards(self) -> List[str]:
+        out = []
+        for _, _, shard in self.rules:
+            if shard not in out:
+                out.append(shard)
+        if self.default not in out:
+            out.append(self.default)
+        return out
+
+    def route(self, meta: Dict[str, Any]) -> str:
+        for field, pattern, shard in self.rules:
+            if fnmatchcase(str(meta.get(field, "")), pattern):
+                return shard
+        return self.default
+
+class ShardedRetriever:
+    """
+    Кілька колекцій (шардів) за інтерфейсом одного ретривера.
+
+    Запис: чанки розходяться по шардах за ShardRouter (у meta додається "shard").
+    Пошук: ембеддінг запиту рахується один раз і паралельно розсилається в query_shards
+    (типово — усі); результати зливаються в глобальний top-k за відстанню (heap).
+    Шард, що не відповів за deadline_ms або впав, пропускається (timeouts/errors,
+    last_missing) — відповідь збирається з решти; якщо не відповів жоден — RuntimeError.
+    Шарди мають бути одного бекенду й однієї моделі ембеддінгів — інакше відстані непорівнянні.
+    Зміна правил розподілу потребує повної переіндексації (index(clear=True)).
+    """
+
+    def __init__(self, shards: Dict[str, Any], router: ShardRouter,
+                 query_shards: Optional[Sequence[str]] = None, deadline_ms: float = 1000.0,
+                 workers: int = 0):
+        missing = [s for s in router.shards if s not in shards]
+        if missing:
+            raise ValueError(f"No retriever for shards: {missing}")
+        self.shards = shards
+        self.router = router
+        self.query_shards = list(query_shards or shards)
+        unknown = [s for s in self.query_shards if s not in shards]
+        if unknown:
+            raise ValueError(f"Unknown query shards: {unknown}")
+        self.deadline = deadline_ms / 1000.0 if deadline_ms > 0 else None
+        # із запасом: завислий шард займає потік, доки не відповість
+        self._pool = ThreadPoolExecutor(max_workers=workers or 2 * len(self.query_shards),
+                                        thread_name_prefix="shard")
+        self._lock = threading.Lock()
+        self.embedder = None
+        self.timeouts: Dict[str, int] = {s: 0 for s in shards}
+        self.errors: Dict[str, int] = {s: 0 for s in shards}
+        self.last_missing: List[str] = []
+
+    def attach_embedder(self, embedder: EmbeddingModel):
+        self.embedder = embedder
+        for r in self.shards.values():
+            r.attach_embedder(embedder)
+
+    # ---------- запис ----------
+    def clear(self):
+        for r in self.shards.values():
+            r.clear()
+
+    def delete_ids(self, ids: List[str]):
+        # шард чанка не зберігається окремо — видаляємо всюди (відсутні id ігноруються)
+        for r in self.shards.values():
+            r.delete_ids(ids)
+
+    def add_chunks(self, chunks: List[Dict[str, Any]]):
+        if self.embedder is None:
+            raise RuntimeError("Embedder not attached")
+        self.upsert(chunks, self.embedder.embed_documents([c["text"] for c in chunks]))
+
+    def upsert(self, chunks: List[Dict[str, Any]], embeddings):
+        groups: Dict[str, List[int]] = {}
+        for i, c in enumerate(chunks):
+            groups.setdefault(self.router.route(c["meta"]), []).append(i)
+        for shard, rows in groups.items():
+            part = [{**chunks[i], "meta": {**chunks[i]["meta"], "shard": shard}} for i in rows]
+            self.shards[shard].upsert(part, embeddings[rows] if hasattr(embeddings, "shape")
+                                      else [embeddings[i] for i in rows])
+
+    def save(self):
+        for r in self.shards.values():
+            if hasattr(r, "save"):
+                r.save()
+
+    def all_chunks(self) -> List[Dict[str, Any]]:
+        out = []
+        for r in self.shards.values():
+            out.extend(r.all_chunks())
+        return out
+
+    def count(self) -> int:
+        return sum(r.count() for r in self.shards.values())
+
+    def iter_embedded(self, batch: int = 4096):
+        for r in self.shards.values():
+            yield from r.iter_embedded(batch)
+
+    # ---------- пошук ----------
+    def query(self, query_text: str, top_k: int = 4) -> List[Dict[str, Any]]:
+        if self.embedder is None:
+            raise RuntimeError("Embedder not attached")
+        return self.query_vectors([self.embedder.embed_query(query_text)], top_k)[0]
+
+    def query_batch(self, query_texts: List[str], top_k: int = 4) -> List[List[Dict[str, Any]]]:
+        if self.embedder is None:
+            raise RuntimeError("Embedder not attached")
+        if not query_texts:
+            return []
+        return self.query_vectors(self.embedder.embed_queries(query_texts), top_k)
+
+    def query_vector(self, q_emb, top_k: int = 4) -> List[Dict[str, Any]]:
+        return self.query_vectors([q_emb], top_k)[0]
+
+    def query_vectors(self, q_embs, top_k: int = 4) -> List[List[Dict[str, Any]]]:
+        """Fan-out у query_shards (кожен шард — один пакетний запит) + злиття в глобальний top-k."""
+        n = len(q_embs)
+        if not n:
+            return []
+        with span("vector_search"):
+            futures = {
+                self._pool.submit(self.shards[s].query_vectors, q_embs, top_k): s
+                for s in self.query_shards
+            }
+            done, pending = wait(futures, timeout=self.deadline)
+
+            per_shard, missing = [], []
+            with self._lock:
+                for f in pending:
+                    f.cancel()  # ще не почався — не запускати; вже запущений добіжить у фоні
+                    self.timeouts[futures[f]] += 1
+                    missing.append(futures[f])
+                for f in done:
+                    if f.exception() is not None:
+                        self.errors[futures[f]] += 1
+                        missing.append(futures[f])
+                    else:
+                        per_shard.append(f.result())
+                self.last_missing = sorted(missing)
+            if not per_shard:
+                raise RuntimeError(f"No shard answered within deadline: {sorted(missing)}")
+
+            return [
+                heapq.nsmallest(top_k, (h for hits in per_shard for h in hits[q]),
+                                key=lambda h: h["distance"])
+                for q in range(n)
+            ]
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "shards": list(self.shards),
+            "query_shards": self.query_shards,
+            "timeouts": dict(self.timeouts),
+            "errors": dict(self.errors),
+            "last_missing": list(self.last_missing),
+        }
@@ -0,0 +1,145 @@
+from __future__ import annotations
+from contextvars import ContextVar
+from typing import Dict, Optional, Tuple
+import threading
+import time
+
+# секунди; як у prometheus_client за замовчуванням + хвіст для LLM
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+_current: ContextVar[Optional["Trace"]] = ContextVar("rag_trace", default=None)
+
+class _Noop:
+    def __enter__(self):
+        return None
+
+    def __exit__(self, *exc):
+        return False
+
+_NOOP = _Noop()
+
+class _Span:
+    __slots__ = ("trace", "name", "t0")
+
+    def __init__(self, trace: "Trace", name: str):
+        self.trace = trace
+        self.name = name
+
+    def __enter__(self):
+        self.t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.trace.add(self.name, time.perf_counter() - self.t0)
+        return False
+
+def span(name: str):
+    """
+    Замір етапу в межах поточного запиту (Tracer.trace()). Поза трасою — спільний
+    no-op без виділень пам'яті, тож у глибині коду (ембеддер, ретривери) його можна лишати завжди.
+    """
+    t = _current.get()
+    return _NOOP if t is None else _Span(t, name)
+
+class Trace:
+    """Етапи одного запиту: ім'я -> сумарні секунди (етап може повторюватись)."""
+
+    def __init__(self, tracer: "Tracer"):
+        self.tracer = tracer
+        self.spans: Dict[str, float] = {}
+        self.t0 = time.perf_counter()
+        self.total = 0.0
+
+    def add(self, name: str, seconds: float):
+        self.spans[name] = self.spans.get(name, 0.0) + seconds
+        self.tracer.observe(name, seconds)
+
+    def finish(self):
+        self.total = time.perf_counter() - self.t0
+        self.tracer.observe("total", self.total)
+
+    def timings(self) -> Dict[str, float]:
+        """{"<етап>_ms": ..., "total_ms": ...}"""
+        out = {f"{k}_ms": round(v * 1000.0, 2) for k, v in self.spans.items()}
+        out["total_ms"] = round((self.total or time.perf_counter() - self.t0) * 1000.0, 2)
+        return out
+
+class _TraceScope:
+    __slots__ = ("tracer", "finish", "trace", "token")
+
+    def __init__(self, tracer: "Tracer", finish: bool):
+        self.tracer = tracer
+        self.finish = finish
+
+    def __enter__(self) -> Trace:
+        self.trace = Trace(self.tracer)
+        self.token = _current.set(self.trace)
+        return self.trace
+
+    def __exit__(self, *exc):
+        _current.reset(self.token)
+        if self.finish:
+            self.trace.finish()
+        return False
+
+class Tracer:
+    """
+    Гістограми тривалості етапів + лічильники; render() — текстовий формат Prometheus
+    (без prometheus_client). enabled=False: trace() -> None, inc() нічого не робить.
+    """
+
+    def __init__(self, enabled: bool = True, prefix: str = "rag", buckets: Tuple[float, ...] = BUCKETS):
+        self.enabled = enabled
+        self.prefix = prefix
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self._hist: Dict[str, list] = {}                           # stage -> [counts..., sum, count]
+        self._counters: Dict[Tuple[str, Tuple[Tuple[str, str], ...]], float] = {}
+
+    def trace(self, finish: bool = True):
+        """
+        with tracer.trace() as tr: ... — span() усередині пишуться в tr (None, якщо вимкнено).
+        finish=False — запит триває після виходу з блоку (стрімінг): тоді tr.add(...) і tr.finish() вручну.
+        """
+        return _TraceScope(self, finish) if self.enabled else _NOOP
+
+    def observe(self, stage: str, seconds: float):
+        with self._lock:
+            h = self._hist.get(stage)
+            if h is None:
+                h = self._hist[stage] = [0] * len(self.buckets) + [0.0, 0]
+            for i, b in enumerate(self.buckets):
+                if seconds <= b:
+                    h[i] += 1
+            h[-2] += seconds
+            h[-1] += 1
+
+    def inc(self, name: str, value: float = 1.0, **labels: str):
+        if not self.enabled:
+            return
+        key = (name, tuple(sorted((k, str(v)) for k, v in labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0.0) + value
+
+    def render(self) -> str:
+        p = self.prefix
+        lines = [
+            f"# HELP {p}_stage_seconds Duration of RAG request stages.",
+            f"# TYPE {p}_stage_seconds histogram",
+        ]
+        with self._lock:
+            for stage, h in sorted(self._hist.items()):
+                for b, c in zip(self.buckets, h):
+                    lines.append(f'{p}_stage_seconds_bucket{{stage="{stage}",le="{b}"}} {c}')
+                lines.append(f'{p}_stage_seconds_bucket{{stage="{stage}",le="+Inf"}} {h[-1]}')
+                lines.append(f'{p}_stage_seconds_sum{{stage="{stage}"}} {h[-2]:.6f}')
+                lines.append(f'{p}_stage_seconds_count{{stage="{stage}"}} {h[-1]}')
+
+            seen = set()
+            for (name, labels), v in sorted(self._counters.items()):
+                if name not in seen:
+                    lines.append(f"# TYPE {p}_{name} counter")
+                    seen.add(name)
+                lab = ",".join(f'{k}="{val}"' for k, val in labels)
+                lines.append(f"{p}_{name}{{{lab}}} {v:g}" if lab else f"{p}_{name} {v:g}")
+        return "\n".join(lines) + "\n"
@@ -0,0 +1,5 @@
+import sys
+from pathlib import Path
+
+# тести запускаються з кореня репозиторію: python -m pytest -q
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
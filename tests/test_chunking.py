@@ -0,0 +1,60 @@
+import random
+
+import pytest
+
+from src.chunking import approx_token_count, chunk_text
+
+SAMPLE = (
+    "Клітина — основна структурна одиниця живого. Вона має мембрану, цитоплазму і ядро!\n"
+    "Мітоз складається з профази, метафази, анафази й телофази… Після нього — цитокінез.\n\n"
+    "«Мейоз» дає гамети (статеві клітини). Кількість хромосом зменшується вдвічі?\n"
+    "ATP/АТФ — універсальне джерело енергії; синтезується в мітохондріях.\n"
+)
+
+def _random_text(rng: random.Random, n_sentences: int) -> str:
+    words = ["клітина", "ядро", "ДНК", "білок", "мембрана", "energy", "x" * 40, "—", "(1)", "«лапки»"]
+    seps = [". ", "! ", "? ", "… ", ".\n", "\n\n", " ", "\r\n", ".\t"]
+    parts = []
+    for _ in range(n_sentences):
+        parts.append(" ".join(rng.choice(words) for _ in range(rng.randint(1, 30))))
+        parts.append(rng.choice(seps))
+    return "".join(parts)
+
+def _check(text: str, chunks, max_tokens: int):
+    assert chunks, "non-empty text must produce chunks"
+    prev_start = -1
+    for c in chunks:
+        start, end = c.meta["start"], c.meta["end"]
+        assert text[start:end] == c.text
+        assert start > prev_start  # рух уперед, без зациклення
+        prev_start = start
+        assert approx_token_count([c.text])[0] <= max_tokens
+    # увесь змістовний текст покрито
+    covered = [False] * len(text)
+    for c in chunks:
+        for i in range(c.meta["start"], c.meta["end"]):
+            covered[i] = True
+    assert all(covered[i] for i, ch in enumerate(text) if not ch.isspace())
+
+@pytest.mark.parametrize("max_tokens,overlap", [(8, 0), (16, 4), (40, 10), (500, 64)])
+def test_offsets_match_text(max_tokens, overlap):
+    chunks = chunk_text(SAMPLE, "s.txt", max_tokens=max_tokens, overlap_tokens=overlap)
+    _check(SAMPLE, chunks, max_tokens)
+
+def test_offsets_match_text_random():
+    rng = random.Random(13)
+    for _ in range(200):
+        text = _random_text(rng, rng.randint(1, 60))
+        max_tokens = rng.randint(4, 120)
+        chunks = chunk_text(text, "r.txt", max_tokens=max_tokens, overlap_tokens=rng.randint(0, max_tokens))
+        _check(text, chunks, max_tokens)
+
+def test_long_sentence_is_split():
+    text = " ".join(["слово"] * 1000) + "."
+    chunks = chunk_text(text, "long.txt", max_tokens=50, overlap_tokens=0)
+    assert len(chunks) > 1
+    _check(text, chunks, 50)
+
+def test_empty_text():
+    assert chunk_text("", "e.txt") == []
+    assert chunk_text("   \n\n ", "e.txt") == []
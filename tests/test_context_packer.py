@@ -0,0 +1,34 @@
+import numpy as np
+
+from src.context_packer import pack_context
+
+def _contexts(with_embeddings):
+    out = []
+    for i in range(4):
+        v = np.zeros(4, dtype=np.float32)
+        v[i] = 1.0
+        out.append({"id": f"c{i}", "text": f"Фрагмент {i}: клітина ділиться мітозом. " * 3,
+                    "meta": {"source": f"s{i}.txt"}, "embedding": v if i in with_embeddings else None})
+    return out
+
+def test_store_embeddings_skip_encoder():
+    calls = []
+    out, stats = pack_context(_contexts(range(4)), 1000, embed_fn=lambda texts: calls.append(texts))
+    assert calls == []
+    assert stats.chunks_out == 4  # ортогональні вектори — нічого не відкинуто як дубль
+
+def test_encoder_only_for_missing():
+    calls = []
+
+    def embed(texts):
+        calls.append(list(texts))
+        return np.eye(4, dtype=np.float32)[[3] * len(texts)]
+
+    ctx = _contexts([0, 1, 2])
+    pack_context(ctx, 1000, embed_fn=embed)
+    assert calls == [[ctx[3]["text"]]]
+
+def test_missing_without_encoder_falls_back_to_jaccard():
+    # однакові тексти: без ембеддінгів Жаккар = 1, тож лишається один фрагмент
+    out, stats = pack_context(_contexts([0]), 1000)
+    assert stats.chunks_out == 1
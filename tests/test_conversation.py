@@ -0,0 +1,40 @@
+from src.context_packer import estimate_tokens
+from src.conversation import Conversation
+
+MITOSIS = ("Мітоз — поділ ядра, після якого дочірні клітини мають однаковий набір хромосом. "
+           "Фази мітозу: профаза, метафаза, анафаза, телофаза. "
+           "Погода в день лекції була сонячна.")
+
+def _conv(**kw) -> Conversation:
+    return Conversation(recent_turns=1, recent_tokens=400, summary_tokens=80, **kw)
+
+def test_summary_within_budget_and_incremental():
+    conv = _conv()
+    for i in range(12):
+        conv.add(f"Запитання {i} про тему номер {i}?", f"Відповідь {i}: деталь {i} стосується теми {i}. " * 3)
+        assert estimate_tokens(conv.summary_text()) <= conv.summary_tokens
+    assert len(conv.turns) == 1 and conv.stats()["turns"] == 12
+    assert conv.summary  # підсумок не порожній і не росте з довжиною сесії
+
+def test_recurring_topic_survives_one_off_details():
+    conv = _conv()
+    conv.add("Що таке мітоз?", MITOSIS)
+    for q, a in [
+        ("Скільки фаз у мітозу?", "У мітозу чотири фази; хромосоми розходяться в анафазі мітозу."),
+        ("Хто відкрив клітини?", "Роберт Гук у 1665 році описав клітини корка."),
+        ("Чим мейоз відрізняється від мітозу?", "Мейоз дає гамети з половинним набором хромосом, мітоз — ні."),
+        ("Яка роль рибосом?", "Рибосоми синтезують білок."),
+    ]:
+        conv.add(q, a)
+    text = conv.summary_text()
+    # перша репліка давно випала з вікна, але її тема (мітоз, хромосоми) лишилася
+    assert "Мітоз — поділ ядра" in text
+    # а разова деталь витіснена
+    assert "Погода" not in text
+
+def test_fold_uses_full_answer():
+    conv = Conversation(recent_turns=1, recent_tokens=30, summary_tokens=200, line_tokens=20)
+    conv.add("Що таке мітоз?", MITOSIS)
+    assert "Фази мітозу" not in conv.turns[0].answer  # у вікні відповідь обрізана
+    conv.add("Далі?", "Далі.")
+    assert "Фази мітозу" in conv.summary_text()
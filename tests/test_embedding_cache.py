@@ -0,0 +1,33 @@
+import json
+
+import numpy as np
+
+from src.embedding_cache import EmbeddingCache
+
+def _vecs(texts):
+    return np.array([[len(t), 1.0] for t in texts], dtype=np.float32)
+
+def test_two_writers_keep_each_others_rows(tmp_path):
+    # два "процеси" з одним каталогом: кожен має лише свій знімок стану в пам'яті
+    a = EmbeddingCache(str(tmp_path), "m", flush_rows=10_000)
+    b = EmbeddingCache(str(tmp_path), "m", flush_rows=10_000)
+    a.put_many(["a1", "a22"], _vecs(["a1", "a22"]))
+    b.put_many(["b333", "a1"], _vecs(["b333", "a1"]))
+    a.flush()
+    b.flush()  # без перечитування обрізав би рядки a до своїх 0
+
+    c = EmbeddingCache(str(tmp_path), "m")
+    got = c.get_many(["a1", "a22", "b333"])
+    assert c.stats()["entries"] == 3
+    assert [v[0] for v in got] == [2, 3, 4]
+
+    # і b бачить рядки a після власного запису
+    assert b.get_many(["a22"])[0][0] == 3
+
+def test_meta_written_atomically(tmp_path):
+    cache = EmbeddingCache(str(tmp_path), "m")
+    cache.put_many(["x"], _vecs(["x"]))
+    cache.flush()
+    meta = json.loads((cache.dir / "meta.json").read_text(encoding="utf-8"))
+    assert meta["rows"] == 1 and meta["gen"] == 1
+    assert not (cache.dir / "meta.json.tmp").exists()
@@ -0,0 +1,214 @@
+import shutil
+import types
+import zlib
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+import src.rag_pipeline as rag_pipeline
+from src.chunking import approx_token_count
+from src.index_pack import PackReader, export_store, import_store
+from src.llm import LLMConfig
+from src.manifest import FileEntry, IndexManifest
+from src.rag_pipeline import PipelineConfig, RAGPipeline
+from src.retriever import VectorRetriever, tokenize
+
+DIM = 16
+
+def _data(n: int = 50, seed: int = 0):
+    rng = np.random.default_rng(seed)
+    embs = rng.standard_normal((n, DIM)).astype(np.float32)
+    embs /= np.linalg.norm(embs, axis=1, keepdims=True)
+    chunks = [
+        {"id": f"doc{i // 10}.txt::{i}", "text": f"Чанк {i}: клітина, мітоз — «{i}»",
+         "meta": {"source": f"doc{i // 10}.txt", "chunk": i % 10}}
+        for i in range(n)
+    ]
+    return chunks, embs
+
+def _store(tmp_path: Path, name: str = "src") -> VectorRetriever:
+    return VectorRetriever(str(tmp_path / name), "kb_main")
+
+def _dump(store: VectorRetriever):
+    chunks, embs = [], []
+    for c, e in store.iter_embedded(7):
+        chunks.extend(c)
+        embs.append(e)
+    order = sorted(range(len(chunks)), key=lambda i: chunks[i]["id"])
+    return [chunks[i] for i in order], np.concatenate(embs)[order]
+
+@pytest.mark.parametrize("dtype,atol", [("float32", 0.0), ("float16", 1e-3)])
+def test_round_trip(tmp_path, dtype, atol):
+    chunks, embs = _data()
+    src = _store(tmp_path)
+    src.upsert(chunks, embs)
+    pack = tmp_path / "kb.ragpack"
+
+    out = export_store(src, str(pack), dtype=dtype, embed_model="e5-test", batch=8)
+    assert out["chunks"] == len(chunks) and out["dim"] == DIM
+
+    reader = PackReader(str(pack))
+    assert isinstance(reader.embeddings, np.memmap)
+    assert reader.header["embed_model"] == "e5-test"
+
+    dst = _store(tmp_path, "dst")
+    dst.upsert(chunks[:3], embs[:3] * 0)  # старий вміст має зникнути
+    res = import_store(dst, str(pack), embed_model="e5-test", batch=8)
+    assert res["chunks"] == len(chunks) and dst.count() == len(chunks)
+
+    got_chunks, got_embs = _dump(dst)
+    want = sorted(chunks, key=lambda c: c["id"])
+    assert [c["id"] for c in got_chunks] == [c["id"] for c in want]
+    assert [c["text"] for c in got_chunks] == [c["text"] for c in want]
+    assert [c["meta"] for c in got_chunks] == [c["meta"] for c in want]
+    want_embs = embs[sorted(range(len(chunks)), key=lambda i: chunks[i]["id"])]
+    np.testing.assert_allclose(got_embs, want_embs, atol=atol, rtol=0)
+
+def test_manifest_is_rebased(tmp_path):
+    chunks, embs = _data(20)
+    src = _store(tmp_path)
+    src.upsert(chunks, embs)
+    old_raw = tmp_path / "old" / "raw"
+    manifest = IndexManifest(tmp_path / "old" / "manifest.json")
+    for n in range(2):
+        key = str(old_raw / "sub" / f"doc{n}.txt")
+        manifest.files[key] = FileEntry(path=key, size=10 + n, mtime=1.5, sha1=f"sha{n}",
+                                        chunk_ids=[c["id"] for c in chunks if c["meta"]["source"] == f"doc{n}.txt"])
+    pack = tmp_path / "kb.ragpack"
+    export_store(src, str(pack), manifest=manifest, raw_dir=str(old_raw))
+
+    new_raw = tmp_path / "new" / "raw"
+    restored = IndexManifest(tmp_path / "new" / "manifest.json")
+    import_store(_store(tmp_path, "dst"), str(pack), manifest=restored, raw_dir=str(new_raw))
+
+    assert sorted(restored.files) == [str(new_raw / "sub" / f"doc{n}.txt") for n in range(2)]
+    e = restored.files[str(new_raw / "sub" / "doc1.txt")]
+    assert (e.size, e.mtime, e.sha1) == (11, 1.5, "sha1")
+    assert e.chunk_ids == [c["id"] for c in chunks if c["meta"]["source"] == "doc1.txt"]
+    assert IndexManifest.load(restored.path).files.keys() == restored.files.keys()
+
+def _packed(tmp_path: Path) -> Path:
+    chunks, embs = _data()
+    src = _store(tmp_path)
+    src.upsert(chunks, embs)
+    pack = tmp_path / "kb.ragpack"
+    export_store(src, str(pack), embed_model="e5-test")
+    return pack
+
+def test_corrupted_byte_fails_checksum(tmp_path):
+    pack = _packed(tmp_path)
+    data = bytearray(pack.read_bytes())
+    data[len(data) // 2] ^= 0xFF
+    pack.write_bytes(bytes(data))
+    with pytest.raises(ValueError, match="checksum"):
+        PackReader(str(pack))
+    dst = _store(tmp_path, "dst")
+    with pytest.raises(ValueError, match="checksum"):
+        import_store(dst, str(pack))
+
+def test_truncated_file_is_rejected(tmp_path):
+    pack = _packed(tmp_path)
+    data = pack.read_bytes()
+    pack.write_bytes(data[:len(data) - 100])
+    with pytest.raises(ValueError, match="truncated"):
+        PackReader(str(pack))
+
+def test_not_a_pack(tmp_path):
+    bad = tmp_path / "kb.ragpack"
+    bad.write_bytes(b"x" * 256)
+    with pytest.raises(ValueError, match="not a ragpack"):
+        PackReader(str(bad))
+
+def test_embed_model_mismatch(tmp_path):
+    pack = _packed(tmp_path)
+    dst = _store(tmp_path, "dst")
+    chunks, embs = _data(3, seed=1)
+    dst.upsert(chunks, embs)
+    with pytest.raises(ValueError, match="exported with e5-test"):
+        import_store(dst, str(pack), embed_model="other-model")
+    assert dst.count() == 3  # наявний індекс не чіпаємо
+
+class _WordEmbedder:
+    """Мішок слів, захешований у 64 виміри — замість e5 (модель у тестах не вантажимо)."""
+    max_tokens = 512
+    cache = None
+
+    def __init__(self):
+        self.engine = types.SimpleNamespace(total_chunks=0, total_seconds=0.0)
+
+    def _vec(self, text: str) -> np.ndarray:
+        v = np.zeros(64, dtype=np.float32)
+        for t in tokenize(text):
+            v[zlib.crc32(t.encode("utf-8")) % 64] += 1.0
+        return v / max(1e-9, float(np.linalg.norm(v)))
+
+    def embed_documents(self, texts):
+        self.engine.total_chunks += len(texts)
+        return np.stack([self._vec(t) for t in texts]) if texts else np.zeros((0, 64), np.float32)
+
+    def embed_queries(self, texts):
+        return self.embed_documents(list(texts))
+
+    def embed_query(self, text):
+        return self._vec(text).tolist()
+
+    def count_tokens(self, texts):
+        return approx_token_count(texts)
+
+SHARED = "Мітохондрії синтезують АТФ під час клітинного дихання у внутрішній мембрані."
+
+def _pipeline(tmp_path: Path, name: str, **kw) -> RAGPipeline:
+    cfg = PipelineConfig(
+        raw_dir=str(tmp_path / name / "raw"), persist_dir=str(tmp_path / name / "db"), collection="kb_main",
+        vector_backend="numpy", embed_cache_dir="", chunk_tokens=12, chunk_overlap_tokens=0,
+        answer_cache_size=0, **kw,
+    )
+    return RAGPipeline(cfg, LLMConfig())
+
+def _sources_of(rag: RAGPipeline, text: str):
+    return {c["meta"]["source"] for c in rag.retriever.all_chunks() if c["text"] == text}
+
+def test_import_keeps_dedup_aliases(tmp_path, monkeypatch):
+    monkeypatch.setattr(rag_pipeline, "shared_embedder", lambda cfg: _WordEmbedder())
+    src = _pipeline(tmp_path, "src")
+    raw = Path(src.cfg.raw_dir)
+    (raw / "a").mkdir(parents=True)
+    (raw / "b").mkdir(parents=True)
+    (raw / "a" / "A.txt").write_text(SHARED + "\n\nПрокаріоти не мають оформленого ядра і мембранних органел.",
+                                     encoding="utf-8")
+    (raw / "b" / "B.txt").write_text(SHARED + "\n\nРибосоми збирають білки з амінокислот за матрицею іРНК.",
+                                     encoding="utf-8")
+    assert src.index(incremental=True)["duplicates"] == 1
+    assert _sources_of(src, SHARED) == {"A.txt"}
+    pack = tmp_path / "kb.ragpack"
+    src.export_index(str(pack))
+
+    # новий вузол: інший raw_dir/persist_dir, ті самі файли
+    dst = _pipeline(tmp_path, "dst")
+    shutil.copytree(raw, dst.cfg.raw_dir)
+    dst.import_index(str(pack))
+    assert dst.dedup.also(next(c["id"] for c in dst.retriever.all_chunks() if c["text"] == SHARED)) \
+        == [str(Path(dst.cfg.raw_dir) / "b" / "B.txt")]
+
+    # спільний абзац прибрано з A — він має лишитися в індексі як частина B
+    (Path(dst.cfg.raw_dir) / "a" / "A.txt").write_text("Прокаріоти не мають оформленого ядра.", encoding="utf-8")
+    stats = dst.index(incremental=True)
+    assert stats["updated"] == 2 and stats["skipped"] == 0
+    assert _sources_of(dst, SHARED) == {"B.txt"}
+    assert dst.retriever.query(SHARED, top_k=1)[0]["meta"]["source"] == "B.txt"
+
+def test_same_name_in_different_folders(tmp_path, monkeypatch):
+    monkeypatch.setattr(rag_pipeline, "shared_embedder", lambda cfg: _WordEmbedder())
+    rag = _pipeline(tmp_path, "kb", dedup_threshold=0)
+    raw = Path(rag.cfg.raw_dir)
+    for sub in ("a", "b"):
+        (raw / sub).mkdir(parents=True)
+        (raw / sub / "notes.txt").write_text(SHARED, encoding="utf-8")
+    rag.index(incremental=True)
+    assert len([c for c in rag.retriever.all_chunks() if c["text"] == SHARED]) == 2
+
+    # видалення a/notes.txt не зачіпає чанки b/notes.txt
+    (raw / "a" / "notes.txt").unlink()
+    rag.index(incremental=True)
+    assert [c["id"].split("#")[0] for c in rag.retriever.all_chunks()] == ["b/notes.txt"]
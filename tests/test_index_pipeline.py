@@ -0,0 +1,43 @@
+import numpy as np
+
+from src.embeddings import EmbeddingEngine
+from src.index_pipeline import StagedIndexer
+
+class _FakeModel:
+    """Вектор — [довжина тексту]; запам'ятовує склад кожного батча."""
+    device = "cpu"
+
+    def __init__(self):
+        self.batches = []
+
+    def get_sentence_embedding_dimension(self):
+        return 1
+
+    def encode(self, batch, **kw):
+        self.batches.append(list(batch))
+        return np.array([[len(t)] for t in batch], dtype=np.float32)
+
+def test_stream_sorts_within_window():
+    model = _FakeModel()
+    engine = EmbeddingEngine(model, batch_size=2, window=6)
+    texts = ["x" * n for n in (5, 1, 6, 2, 4, 3, 9, 7)]
+    out = list(engine.encode_stream(texts))
+    assert [len(w) for w in out] == [6, 2]
+    assert np.concatenate(out)[:, 0].tolist() == [len(t) for t in texts]  # вихідний порядок
+    assert [[len(t) for t in b] for b in model.batches] == [[1, 2], [3, 4], [5, 6], [7, 9]]
+
+def test_indexer_embeds_windows_writes_batches():
+    calls, writes = [], []
+
+    def embed(texts):
+        calls.append(len(texts))
+        return np.array([[float(t)] for t in texts], dtype=np.float32)
+
+    def write(batch, embs):
+        assert [float(c["text"]) for c in batch] == embs[:, 0].tolist()
+        writes.append(len(batch))
+
+    docs = [[{"id": f"{d}-{i}", "text": str(d * 10 + i), "meta": {}} for i in range(7)] for d in range(5)]
+    done = StagedIndexer(embed, write, batch_size=4, embed_window=16).run(iter(docs), docs_total=5)
+    assert calls == [16, 16, 3]
+    assert sum(writes) == done.chunks_written == 35 and max(writes) == 4
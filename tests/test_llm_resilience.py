@@ -0,0 +1,213 @@
+import asyncio
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from src.llm import LLM, LLMConfig, UnknownProviderError
+from src.llm_stub import ANSWER, StubState, serve
+
+class ScriptedState(StubState):
+    """Стаб із наперед заданими результатами (далі — "ok"); on_request викликається на кожен запит."""
+
+    def __init__(self, script=(), on_request=None, **kw):
+        super().__init__(**kw)
+        self.script = list(script)
+        self.on_request = on_request
+
+    def draw(self) -> str:
+        if self.on_request is not None:
+            self.on_request()
+        with self.lock:
+            self.counts["requests"] += 1
+            outcome = self.script.pop(0) if self.script else "ok"
+            self.counts[outcome] += 1
+            return outcome
+
+@pytest.fixture
+def stubs():
+    servers = []
+
+    def start(state: StubState):
+        srv = serve(state)
+        servers.append(srv)
+        return srv
+
+    yield start
+    for srv in servers:
+        srv.shutdown()
+        srv.server_close()
+
+def _llm(primary, fallback, **kw) -> LLM:
+    cfg = dict(
+        provider="openai", model="stub", api_key="x",
+        openai_base_url=f"http://127.0.0.1:{primary.server_port}/v1",
+        base_url=f"http://127.0.0.1:{fallback.server_port}",
+        fallbacks="ollama:stub", retries=0, backoff=0.01, timeout=5,
+    )
+    cfg.update(kw)
+    return LLM(LLMConfig(**cfg))
+
+def test_503_falls_back(stubs):
+    p = ScriptedState(["503", "503"], latency_ms=1)
+    f = ScriptedState(latency_ms=1)
+    llm = _llm(stubs(p), stubs(f), retries=1)
+    assert llm.generate("Що таке мітоз?", []) == ANSWER
+    assert p.counts["requests"] == 2  # спроба + повтор
+    assert f.counts["requests"] == 1
+    stats = llm.stats()
+    assert stats["fallbacks"] == 1 and stats["retries"] == 1
+
+def test_stream_503_falls_back(stubs):
+    p = ScriptedState(["503"], latency_ms=1)
+    f = ScriptedState(latency_ms=1)
+    llm = _llm(stubs(p), stubs(f))
+    assert "".join(llm.stream("Що таке мітоз?", [])).strip() == ANSWER
+    assert llm.stats()["fallbacks"] == 1
+
+def test_long_retry_after_skips_to_fallback(stubs):
+    p = ScriptedState(["429"], latency_ms=1, retry_after=30)
+    f = ScriptedState(latency_ms=1)
+    llm = _llm(stubs(p), stubs(f), retries=3, backoff_max=8)
+    t0 = time.monotonic()
+    assert llm.generate("Що таке мітоз?", []) == ANSWER
+    assert time.monotonic() - t0 < 2.0  # Retry-After 30 с не чекали
+    assert p.counts["requests"] == 1
+    assert llm.stats()["fallbacks"] == 1
+
+def test_breaker_open_half_open_closed(stubs):
+    seen = []
+    llm = None
+    p = ScriptedState(["503", "503"], latency_ms=1,
+                      on_request=lambda: seen.append(llm.routes[0].breaker.state))
+    f = ScriptedState(latency_ms=1)
+    llm = _llm(stubs(p), stubs(f), breaker_failures=2, breaker_reset=0.3)
+    breaker = llm.routes[0].breaker
+
+    for _ in range(2):
+        assert llm.generate("q", []) == ANSWER
+    assert breaker.state == "open" and breaker.trips == 1
+
+    # поки запобіжник відкритий, основний провайдер не отримує запитів
+    assert llm.generate("q", []) == ANSWER
+    assert p.counts["requests"] == 2
+
+    time.sleep(0.35)
+    assert llm.generate("q", []) == ANSWER  # проба в half_open — успішна
+    assert p.counts["requests"] == 3
+    assert seen[-1] == "half_open"
+    assert breaker.state == "closed"
+    assert f.counts["requests"] == 3
+
+def test_deadline(stubs):
+    p = ScriptedState(latency_ms=3000)
+    f = ScriptedState(latency_ms=3000)
+    llm = _llm(stubs(p), stubs(f), deadline=0.5)
+    t0 = time.monotonic()
+    with pytest.raises(RuntimeError, match="deadline"):
+        llm.generate("q", [])
+    assert time.monotonic() - t0 < 1.5
+
+def test_hedge_wins_over_slow_request(stubs):
+    p = ScriptedState(latency_ms=20, slow_ms=3000)
+    f = ScriptedState(latency_ms=1)
+    llm = _llm(stubs(p), stubs(f), hedge_quantile=0.9, hedge_min_samples=5)
+    for _ in range(5):
+        llm.generate("q", [])
+    assert llm.stats()["hedges"] == 0
+
+    p.script = ["slow"]
+    t0 = time.monotonic()
+    assert llm.generate("q", []) == ANSWER
+    assert time.monotonic() - t0 < 1.5
+    stats = llm.stats()
+    assert stats["hedges"] == 1 and stats["hedge_wins"] == 1
+    assert stats["fallbacks"] == 0
+    assert f.counts["requests"] == 0
+
+class _HtmlHandler(BaseHTTPRequestHandler):
+    """200 з HTML-сторінкою замість JSON (напр. проксі чи captive portal)."""
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        data = b"<html><body>Service maintenance</body></html>"
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+def test_non_json_response_falls_back(stubs):
+    html = ThreadingHTTPServer(("127.0.0.1", 0), _HtmlHandler)
+    html.daemon_threads = True
+    threading.Thread(target=html.serve_forever, daemon=True).start()
+    try:
+        f = ScriptedState(latency_ms=1)
+        llm = _llm(html, stubs(f), retries=2)
+        assert llm.generate("q", []) == ANSWER
+        assert "".join(llm.stream("q", [])).strip() == ANSWER
+        assert llm.stats()["retries"] == 0  # непридатна відповідь не повторюється
+        assert llm.routes[0].breaker.state == "closed"
+    finally:
+        html.shutdown()
+        html.server_close()
+
+def test_unknown_provider_is_not_masked(stubs):
+    f = ScriptedState(latency_ms=1)
+    llm = _llm(stubs(ScriptedState()), stubs(f), provider="nope")
+    with pytest.raises(UnknownProviderError):
+        llm.generate("q", [])
+    assert f.counts["requests"] == 0
+
+def _run(llm: LLM, coro):
+    async def main():
+        try:
+            return await coro
+        finally:
+            await llm.aclose()
+    return asyncio.run(main())
+
+def test_async_503_falls_back(stubs):
+    p = ScriptedState(["503", "503"], latency_ms=1)
+    f = ScriptedState(latency_ms=1)
+    llm = _llm(stubs(p), stubs(f), retries=1)
+    assert _run(llm, llm.agenerate("Що таке мітоз?", [])) == ANSWER
+    assert p.counts["requests"] == 2
+    assert llm.stats()["fallbacks"] == 1
+
+def test_async_ollama_chat_messages(stubs):
+    f = ScriptedState(latency_ms=1)
+    srv = stubs(f)
+    llm = LLM(LLMConfig(provider="ollama", model="stub", base_url=f"http://127.0.0.1:{srv.server_port}"))
+    messages = [{"role": "system", "content": "s"}, {"role": "user", "content": "q"}]
+
+    async def pieces():
+        return [p async for p in llm.astream(messages=messages)]
+
+    got = _run(llm, pieces())
+    assert len(got) > 1 and "".join(got).strip() == ANSWER
+    assert f.counts["requests"] == 1
+
+def test_async_cancel_frees_half_open_probe(stubs):
+    p = ScriptedState(["503", "slow"], latency_ms=1, slow_ms=3000)
+    f = ScriptedState(latency_ms=1)
+    llm = _llm(stubs(p), stubs(f), breaker_failures=1, breaker_reset=0.1)
+    breaker = llm.routes[0].breaker
+
+    async def main():
+        assert await llm.agenerate("q", []) == ANSWER  # 503 -> запобіжник відкрився
+        assert breaker.state == "open"
+        await asyncio.sleep(0.15)
+        task = asyncio.ensure_future(llm.agenerate("q", []))  # проба half_open зависає
+        await asyncio.sleep(0.3)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        assert breaker.allow()  # скасована проба не блокує наступну
+
+    _run(llm, main())
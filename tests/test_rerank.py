@@ -0,0 +1,60 @@
+import time
+
+import pytest
+
+import src.registry as registry
+from src.rerank import CrossEncoderReranker
+
+class _FakeCrossEncoder:
+    """Оцінка — кількість спільних слів запиту й чанка; delay — час на кожен predict()."""
+
+    def __init__(self, delay: float = 0.0):
+        self.delay = delay
+        self.pairs = 0
+
+    def predict(self, pairs, batch_size=32, show_progress_bar=False):
+        time.sleep(self.delay)
+        self.pairs += len(pairs)
+        return [len(set(q.split()) & set(t.split())) for q, t in pairs]
+
+def _reranker(monkeypatch, model, **kw) -> CrossEncoderReranker:
+    monkeypatch.setattr(registry, "cross_encoder", lambda name, device=None: model)
+    return CrossEncoderReranker("fake", **kw)
+
+CANDIDATES = [
+    {"id": "c0", "text": "рибосоми синтезують білок"},
+    {"id": "c1", "text": "мітоз поділ клітини"},
+    {"id": "c2", "text": "мітоз це поділ ядра клітини"},
+]
+
+def test_reorders_and_caches(monkeypatch):
+    model = _FakeCrossEncoder()
+    rr = _reranker(monkeypatch, model, max_ms=1000)
+    out = rr.rerank("мітоз поділ ядра клітини", CANDIDATES, 2)
+    assert [c["id"] for c in out] == ["c2", "c1"]
+    assert out[0]["rerank_score"] == 4
+    rr.rerank("Мітоз: поділ ядра клітини?", CANDIDATES, 2)
+    assert model.pairs == 3  # друга оцінка — з кешу (нормалізований запит)
+    assert rr.stats()["cache_hits"] == 3
+
+def test_slow_single_batch_falls_back_to_dense_order(monkeypatch):
+    model = _FakeCrossEncoder(delay=0.5)
+    rr = _reranker(monkeypatch, model, batch_size=32, max_ms=50)
+    t0 = time.perf_counter()
+    out = rr.rerank("мітоз поділ ядра клітини", CANDIDATES, 2)
+    assert time.perf_counter() - t0 < 0.3
+    assert [c["id"] for c in out] == ["c0", "c1"]
+    assert "rerank_score" not in out[0]
+    assert rr.fallbacks == 1
+
+    # потік дораховує оцінки у фоні — повтор запиту бере їх із кешу
+    time.sleep(0.6)
+    assert [c["id"] for c in rr.rerank("мітоз поділ ядра клітини", CANDIDATES, 2)] == ["c2", "c1"]
+    assert rr.fallbacks == 1 and model.pairs == 3
+
+@pytest.mark.parametrize("max_ms", [0, 10_000])
+def test_no_fallback_within_limit(monkeypatch, max_ms):
+    rr = _reranker(monkeypatch, _FakeCrossEncoder(delay=0.05), batch_size=2, max_ms=max_ms)
+    out = rr.rerank("мітоз поділ ядра клітини", CANDIDATES, 3)
+    assert [c["id"] for c in out] == ["c2", "c1", "c0"]
+    assert rr.fallbacks == 0 and rr.scored == 3